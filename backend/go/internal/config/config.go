@@ -7,6 +7,7 @@ import (
 	"os"
 	"path/filepath"
 	"runtime"
+	"strconv"
 	"strings"
 	"sync"
 )
@@ -28,6 +29,8 @@ type Config struct {
 	// Service settings
 	PortGo     string
 	PortPython string
+	// Unix domain socket of a co-located Python service (SOCKET_PYTHON); dialed instead of TCP when set
+	PythonSocket string
 	FrontendURL string
 	
 	// Database settings
@@ -44,6 +47,9 @@ type Config struct {
 	// External service URLs
 	PythonAPIURL string
 	GoAPIURL     string
+
+	// Head sampling rate for new traces (TRACE_SAMPLE_RATE, 0..1)
+	TraceSampleRate float64
 }
 
 var globalConfig *Config
@@ -237,6 +243,9 @@ func (c *Config) loadFromEnv() {
 	if portPython := os.Getenv("PORT_PYTHON"); portPython != "" {
 		c.PortPython = portPython
 	}
+	if pythonSocket := os.Getenv("SOCKET_PYTHON"); pythonSocket != "" {
+		c.PythonSocket = pythonSocket
+	}
 	if frontendURL := os.Getenv("FRONTEND_URL"); frontendURL != "" {
 		c.FrontendURL = frontendURL
 	}
@@ -273,6 +282,9 @@ func (c *Config) loadFromEnv() {
 	if goAPIURL := os.Getenv("GO_API_URL"); goAPIURL != "" {
 		c.GoAPIURL = goAPIURL
 	}
+	if traceSampleRate := os.Getenv("TRACE_SAMPLE_RATE"); traceSampleRate != "" {
+		c.TraceSampleRate, _ = strconv.ParseFloat(traceSampleRate, 64)
+	}
 }
 
 // setEnvValue sets a configuration value from environment variable
@@ -299,6 +311,8 @@ func (c *Config) setEnvValue(key, value string) {
 		c.PortGo = value
 	case "PORT_PYTHON":
 		c.PortPython = value
+	case "SOCKET_PYTHON":
+		c.PythonSocket = value
 	case "FRONTEND_URL":
 		c.FrontendURL = value
 	case "DB_HOST":
@@ -319,6 +333,8 @@ func (c *Config) setEnvValue(key, value string) {
 		c.PythonAPIURL = value
 	case "GO_API_URL":
 		c.GoAPIURL = value
+	case "TRACE_SAMPLE_RATE":
+		c.TraceSampleRate, _ = strconv.ParseFloat(value, 64)
 	}
 }
 
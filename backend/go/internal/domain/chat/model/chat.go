@@ -11,6 +11,11 @@ type ChatStreamRequest struct {
 	PresencePenalty  float64   `json:"presencePenalty,omitempty"`
 	Stop             []string  `json:"stop,omitempty"`
 	ThinkingMode     bool      `json:"thinkingMode,omitempty"` // Enable thinking mode
+	TimeoutMs        int64     `json:"timeoutMs,omitempty"`    // Caller's remaining time budget
+	Priority         string    `json:"priority,omitempty"`     // interactive (default), background or bulk
+	// Compare mode: stream these models side by side instead of Model
+	CompareModels    []string `json:"compareModels,omitempty"`
+	CompareStopAfter int      `json:"compareStopAfter,omitempty"` // Stop the other models once this many have finished
 }
 
 // Single message structure (consistent with frontend)
@@ -23,6 +28,19 @@ type Message struct {
 
 // Streaming response data chunk (aligned with frontend StreamChunk)
 type StreamChunk struct {
-	Content  string `json:"content"`
-	Finished bool   `json:"finished"`
+	Content  string      `json:"content"`
+	Finished bool        `json:"finished"`
+	Error    *ChunkError `json:"error,omitempty"` // Only set on error chunks
+	// Compare mode only: the chunk's model; its last chunk has ModelDone and its TTFT
+	Model     string   `json:"model,omitempty"`
+	ModelDone bool     `json:"modelDone,omitempty"`
+	TTFTMs    *float64 `json:"ttftMs,omitempty"`
+}
+
+// Structured error carried by the final chunk of a failed stream
+type ChunkError struct {
+	ErrorClass string `json:"errorClass"`
+	Retryable  bool   `json:"retryable"`
+	Provider   string `json:"provider"`
+	Message    string `json:"message"`
 }
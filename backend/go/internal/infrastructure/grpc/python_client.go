@@ -1,6 +1,7 @@
 ﻿package grpc
 
 import (
+	"AAAnynotes/backend/go/internal/config"
 	"AAAnynotes/backend/go/internal/domain/chat/model"
 	"bytes"
 	"context"
@@ -9,6 +10,7 @@ import (
 	"io"
 	"net"
 	"net/http"
+	"strconv"
 	"time"
 )
 
@@ -40,17 +42,31 @@ func SendChatStream(ctx context.Context, req model.ChatStreamRequest) (io.ReadCl
 
 	// 🔧 核心优化：补充流式响应关键请求头
 	httpReq.Header.Set("Content-Type", "application/json; charset=utf-8")
-	httpReq.Header.Set("Accept", "text/event-stream; charset=utf-8")       // 声明接收SSE流式响应
+	httpReq.Header.Set("Accept", "application/x-ndjson")                  // 按行解析NDJSON（Python按Accept协商格式）
 	httpReq.Header.Set("Cache-Control", "no-cache")                       // 禁用缓存
 	httpReq.Header.Set("Connection", "keep-alive")                        // 强制长连接
 	httpReq.Header.Set("X-Requested-With", "XMLHttpRequest")              // 兼容前端AJAX请求
 	httpReq.Header.Set("Accept-Encoding", "identity")                     // 禁用压缩，避免流式数据乱码
 
+	// 传递剩余时间预算：Python 侧据此限制上游连接/首token/总耗时，调用方放弃后立即停止
+	if deadline, ok := ctx.Deadline(); ok {
+		remaining := time.Until(deadline).Milliseconds()
+		if remaining < 1 {
+			remaining = 1
+		}
+		httpReq.Header.Set("X-Request-Timeout-Ms", strconv.FormatInt(remaining, 10))
+	}
+
+	// 传递W3C trace上下文：Python 侧的span挂在网关的trace下
+	if traceparent, ok := TraceparentFromContext(ctx); ok {
+		httpReq.Header.Set("traceparent", traceparent)
+	}
+
 	fmt.Println("Go: Sending HTTP request to Python service (long connection)...")
 
 	// 3. 🔧 核心优化：HTTP客户端配置（适配长时流式请求）
 	client := &http.Client{
-		Timeout: 6000 * time.Second,
+		// 不设置总超时：由ctx截止时间统一控制（同时通过请求头传递给Python）
 		Transport: &http.Transport{
 			// 启用Keep-Alive（流式请求必需）
 			DisableKeepAlives:     false,
@@ -60,11 +76,8 @@ func SendChatStream(ctx context.Context, req model.ChatStreamRequest) (io.ReadCl
 			IdleConnTimeout:       60 * time.Second,   // 空闲连接超时（60秒）
 			// 超时配置：握手/连接超时（短超时，快速失败）
 			TLSHandshakeTimeout:   10 * time.Second,   // TLS握手超时
-			// 连接超时控制
-			DialContext: (&net.Dialer{
-				Timeout:   10 * time.Second,  // 连接建立超时
-				KeepAlive: 30 * time.Second,  // Keep-Alive时间
-			}).DialContext,
+			// 连接超时控制（同机部署时配置SOCKET_PYTHON走Unix域套接字）
+			DialContext: pythonDialContext(),
 			ResponseHeaderTimeout: 15 * time.Second,   // 响应头超时
 			// 禁用压缩：避免流式数据解压混乱
 			DisableCompression:    true,
@@ -118,6 +131,23 @@ func SendChatStream(ctx context.Context, req model.ChatStreamRequest) (io.ReadCl
 	return resp.Body, nil
 }
 
+// pythonDialContext 同机部署（配置了SOCKET_PYTHON）时改连Python服务的Unix域套接字，
+// 省去TCP回环的协议栈开销；URL中的主机和端口此时被忽略
+func pythonDialContext() func(ctx context.Context, network, addr string) (net.Conn, error) {
+	dialer := &net.Dialer{
+		Timeout:   10 * time.Second, // 连接建立超时
+		KeepAlive: 30 * time.Second, // Keep-Alive时间
+	}
+	cfg := config.GetConfig()
+	if cfg == nil || cfg.PythonSocket == "" {
+		return dialer.DialContext
+	}
+	socketPath := cfg.PythonSocket
+	return func(ctx context.Context, _, _ string) (net.Conn, error) {
+		return dialer.DialContext(ctx, "unix", socketPath)
+	}
+}
+
 // 补充min函数（确保存在）
 func min(a, b int) int {
 	if a < b {
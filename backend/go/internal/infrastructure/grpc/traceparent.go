@@ -0,0 +1,69 @@
+package grpc
+
+import (
+	"context"
+	"crypto/rand"
+	"encoding/hex"
+	"math/big"
+	"strings"
+)
+
+// W3C trace context: the gateway continues the caller's trace or starts a new
+// one with a head-based sampling decision, and forwards it to Python as the
+// traceparent header. The Python service records and exports the spans.
+
+type traceparentKey struct{}
+
+// NewTraceparent returns the traceparent for a request to the Python service.
+// A valid incoming header is forwarded unchanged: the gateway exports no span
+// of its own, so the caller's span stays the parent of the Python spans.
+// Otherwise a new trace is started and sampled with probability sampleRate.
+func NewTraceparent(incoming string, sampleRate float64) string {
+	traceparent := strings.ToLower(strings.TrimSpace(incoming))
+	parts := strings.Split(traceparent, "-")
+	if len(parts) == 4 && parts[0] == "00" && isHexID(parts[1], 32) && isHexID(parts[2], 16) && isHex(parts[3], 2) {
+		return traceparent
+	}
+	flags := "00"
+	if sampleRate > 0 && randomFloat() < sampleRate {
+		flags = "01"
+	}
+	return "00-" + randomHex(16) + "-" + randomHex(8) + "-" + flags
+}
+
+// WithTraceparent attaches a traceparent to ctx for SendChatStream.
+func WithTraceparent(ctx context.Context, traceparent string) context.Context {
+	return context.WithValue(ctx, traceparentKey{}, traceparent)
+}
+
+// TraceparentFromContext returns the traceparent set by WithTraceparent.
+func TraceparentFromContext(ctx context.Context) (string, bool) {
+	traceparent, ok := ctx.Value(traceparentKey{}).(string)
+	return traceparent, ok && traceparent != ""
+}
+
+func isHexID(s string, length int) bool {
+	return isHex(s, length) && strings.Trim(s, "0") != ""
+}
+
+func isHex(s string, length int) bool {
+	if len(s) != length {
+		return false
+	}
+	_, err := hex.DecodeString(s)
+	return err == nil
+}
+
+func randomHex(nbytes int) string {
+	buf := make([]byte, nbytes)
+	_, _ = rand.Read(buf)
+	return hex.EncodeToString(buf)
+}
+
+func randomFloat() float64 {
+	n, err := rand.Int(rand.Reader, big.NewInt(1<<53))
+	if err != nil {
+		return 1
+	}
+	return float64(n.Int64()) / (1 << 53)
+}
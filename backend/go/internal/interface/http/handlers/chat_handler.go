@@ -1,6 +1,7 @@
 ﻿package handlers
 
 import (
+	"AAAnynotes/backend/go/internal/config"
 	"AAAnynotes/backend/go/internal/domain/chat/model"
 	"AAAnynotes/backend/go/internal/infrastructure/grpc"
 	"bufio"
@@ -40,6 +41,8 @@ func ChatStream(c *gin.Context) {
 	// 2. 创建带长超时的自定义Context
 	ctx, cancel := context.WithTimeout(c.Request.Context(), streamTotalTimeout)
 	defer cancel()
+	// 延续调用方的trace（traceparent），否则按TRACE_SAMPLE_RATE开启新trace
+	ctx = grpc.WithTraceparent(ctx, grpc.NewTraceparent(c.GetHeader("traceparent"), config.GetConfig().TraceSampleRate))
 
 	// 3. 调用Python AI服务
 	fmt.Println("Go: Calling Python AI service with long timeout...")
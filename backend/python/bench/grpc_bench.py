@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+gRPC ChatStream versus the NDJSON ``/api/chat/stream`` path.
+
+Starts the mock provider and the app (with GRPC_PORT set) like
+load_test.py, warms both transports, then runs the same workload over each
+in turn and reports throughput, TTFT and inter-token percentiles per
+transport, plus the encoded size of a typical chunk.
+
+Usage:
+    python bench/grpc_bench.py --concurrency 200 --requests 2000 --output grpc.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+import grpc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCH_DIR, "..", "src"))
+
+from load_test import build_request, drive, free_port, git_revision, start_processes, summarize
+
+
+async def run_grpc_stream(stub, message) -> Dict[str, Any]:
+    start = time.perf_counter()
+    arrivals = []
+    error = None
+    try:
+        async for chunk in stub.ChatStream(message):
+            arrivals.append(time.perf_counter())
+            if chunk.HasField("error"):
+                error = chunk.error.error_class or "error"
+    except grpc.aio.AioRpcError as e:
+        error = e.code().name
+    return {"start": start, "end": time.perf_counter(), "arrivals": arrivals, "error": error}
+
+
+async def drive_grpc(target: str, body: Dict[str, Any], concurrency: int, requests: int,
+                     channels: int) -> List[Dict[str, Any]]:
+    """Like load_test.drive over gRPC, with streams spread over ``channels`` HTTP/2 connections"""
+    from rpc import chat_pb2
+    from rpc.chat_pb2_grpc import ChatServiceStub
+
+    message = chat_pb2.ChatStreamRequest(
+        messages=[chat_pb2.Message(**m) for m in body["messages"]], model=body["model"])
+    # Distinct channel args keep gRPC from sharing one subchannel between them
+    opened = [grpc.aio.insecure_channel(target, options=[("bench.channel", i)]) for i in range(channels)]
+    stubs = [ChatServiceStub(channel) for channel in opened]
+    results = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    async def worker(stub):
+        while not queue.empty():
+            queue.get_nowait()
+            results.append(await run_grpc_stream(stub, message))
+
+    try:
+        await asyncio.gather(*(worker(stubs[i % channels]) for i in range(concurrency)))
+    finally:
+        for channel in opened:
+            await channel.close()
+    return results
+
+
+def chunk_sizes() -> Dict[str, int]:
+    """Encoded size of one typical content chunk on each transport"""
+    from api.endpoints.chat_endpoint import encode_chunk
+    from common.models import StreamChunk
+    from rpc.server import encode_chunk_proto
+
+    chunk = StreamChunk(content="token ", finished=False)
+    return {"ndjson": len(encode_chunk(chunk)), "grpc": len(encode_chunk_proto(chunk))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare gRPC ChatStream with the NDJSON HTTP path")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=None, help="Total requests per transport (default: 2x concurrency)")
+    parser.add_argument("--channels", type=int, default=4, help="gRPC connections shared by all streams")
+    parser.add_argument("--history", type=int, default=10)
+    parser.add_argument("--message-chars", type=int, default=400)
+    parser.add_argument("--model", default="glm-4")
+    parser.add_argument("--mock-ttft-ms", type=float, default=200.0)
+    parser.add_argument("--mock-tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--mock-tokens", type=int, default=100)
+    parser.add_argument("--mock-jitter-ms", type=float, default=5.0)
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    args = parser.parse_args()
+    args.requests = args.requests or args.concurrency * 2
+
+    grpc_port = free_port()
+    os.environ["GRPC_PORT"] = str(grpc_port)
+    processes = start_processes(args)
+    try:
+        body = build_request(args.history, args.message_chars, args.model)
+        url, target = f"{processes['url']}/api/chat/stream", f"127.0.0.1:{grpc_port}"
+        # Unmeasured round so neither transport pays for cold pools and imports
+        warmup = min(args.concurrency, 10)
+        asyncio.run(drive(url, body, warmup, warmup, lambda: None))
+        asyncio.run(drive_grpc(target, body, warmup, warmup, args.channels))
+
+        start = time.perf_counter()
+        results = asyncio.run(drive(url, body, args.concurrency, args.requests, lambda: None))
+        ndjson = summarize(results, time.perf_counter() - start)
+        start = time.perf_counter()
+        results = asyncio.run(drive_grpc(target, body, args.concurrency, args.requests, args.channels))
+        grpc_report = summarize(results, time.perf_counter() - start)
+    finally:
+        for proc in (processes["app"], processes["mock"]):
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    report = {
+        "gitRevision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {
+            "concurrency": args.concurrency, "requests": args.requests, "channels": args.channels,
+            "history": args.history, "model": args.model, "mockTokens": args.mock_tokens,
+        },
+        "chunkBytes": chunk_sizes(),
+        "ndjson": ndjson,
+        "grpc": grpc_report,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Import-time benchmark for worker boot (``python -X importtime``).
+
+Imports the app module in fresh interpreters, reports the best total import
+time and the most expensive modules, and fails when the total exceeds a
+budget or when a module that should load lazily (provider implementations)
+was imported at boot.
+
+Usage:
+    python bench/import_time.py                        # report, default budget
+    python bench/import_time.py --budget-ms 800 --runs 10 --output import.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, "..", "src")
+
+# Loaded on first use through models.registry, never at boot
+LAZY_MODULES = ("models.glm_model", "models.kimi_model")
+
+
+def parse_importtime(stderr: str) -> Dict[str, Tuple[int, int]]:
+    """Module -> (self us, cumulative us) from ``-X importtime`` output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def measure(module: str = "main", runs: int = 5) -> Tuple[int, Dict[str, Tuple[int, int]]]:
+    """Best cumulative import time of ``module`` in us, with that run's module table"""
+    best: Tuple[int, Dict[str, Tuple[int, int]]] = (0, {})
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=SRC_DIR, capture_output=True, text=True, check=True,
+        )
+        modules = parse_importtime(result.stderr)
+        total = modules[module][1]
+        if not best[1] or total < best[0]:
+            best = (total, modules)
+    return best
+
+
+def report(module: str, total_us: int, modules: Dict[str, Tuple[int, int]], top: int = 15) -> Dict[str, Any]:
+    slowest: List[Tuple[str, Tuple[int, int]]] = sorted(modules.items(), key=lambda m: m[1][0], reverse=True)
+    return {
+        "module": module,
+        "python": sys.version.split()[0],
+        "totalMs": round(total_us / 1000, 1),
+        "moduleCount": len(modules),
+        "slowestSelfMs": [{"module": name, "selfMs": round(s / 1000, 2), "cumulativeMs": round(c / 1000, 2)}
+                          for name, (s, c) in slowest[:top]],
+        "eagerLazyModules": [name for name in LAZY_MODULES if name in modules],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time budget check for worker boot")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters; the fastest run is reported")
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="Fail above this total import time")
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules to list")
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    args = parser.parse_args()
+
+    total_us, modules = measure(args.module, args.runs)
+    result = report(args.module, total_us, modules, args.top)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+    failed = False
+    if result["totalMs"] > args.budget_ms:
+        print(f"Import of {args.module} took {result['totalMs']}ms, budget is {args.budget_ms}ms")
+        failed = True
+    if result["eagerLazyModules"]:
+        print(f"Imported at boot but should load lazily: {', '.join(result['eagerLazyModules'])}")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end load test of the streaming chat path.
+
+Starts the mock provider and the FastAPI app as separate processes, drives
+``/api/chat/stream`` with a fixed number of concurrent streams and writes a
+JSON report with throughput, TTFT and inter-token percentiles and the app
+process' memory and thread usage.
+
+Usage:
+    python bench/load_test.py --concurrency 100 --requests 1000 --history 20 --output results.json
+    python bench/load_test.py --concurrency 1000 --baseline main.json   # compare with another branch
+
+Pass ``--app-url`` to benchmark an already running service instead of
+spawning one (memory and thread figures are then omitted). Runs above a
+few thousand streams need a raised open-file limit (``ulimit -n 65536``).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, "..", "src")
+
+# Report fields where a larger value is a regression, checked by --baseline
+REGRESSION_KEYS = ("ttftMs.p50", "ttftMs.p99", "interTokenMs.p99", "rssPerStreamKb")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def pick(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))], 3)
+
+    return {"p50": pick(50), "p95": pick(95), "p99": pick(99), "max": round(ordered[-1], 3)}
+
+
+def process_status(pid: int) -> Dict[str, int]:
+    """RSS (KiB) and thread count of ``pid`` from /proc (Linux only)"""
+    status = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    status["rssKb"] = int(line.split()[1])
+                elif line.startswith("Threads:"):
+                    status["threads"] = int(line.split()[1])
+    except OSError:
+        pass
+    return status
+
+
+def wait_for(url: str, timeout: float = 30.0, uds: Optional[str] = None) -> None:
+    deadline = time.monotonic() + timeout
+    transport = httpx.HTTPTransport(uds=uds) if uds else None
+    while time.monotonic() < deadline:
+        try:
+            with httpx.Client(transport=transport, timeout=1.0) as client:
+                client.get(url)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def build_request(history: int, message_chars: int, model: str) -> Dict[str, Any]:
+    """A chat request with ``history`` prior messages of realistic size"""
+    messages = []
+    for i in range(history):
+        messages.append({
+            "id": f"msg-{i}",
+            "content": (f"message {i} " * (message_chars // 11 + 1))[:message_chars],
+            "sender": "user" if i % 2 == 0 else "assistant",
+            "time": "2024-01-01T12:00:00Z",
+        })
+    return {"messages": messages, "model": model}
+
+
+async def run_stream(client: httpx.AsyncClient, url: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    arrivals = []
+    error = None
+    try:
+        async with client.stream("POST", url, json=body) as response:
+            if response.status_code != 200:
+                error = f"HTTP {response.status_code}"
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                arrivals.append(time.perf_counter())
+                if '"error"' in line and json.loads(line).get("error"):
+                    error = json.loads(line)["error"].get("errorClass", "error")
+    except Exception as e:
+        error = type(e).__name__
+    return {"start": start, "end": time.perf_counter(), "arrivals": arrivals, "error": error}
+
+
+async def drive(url: str, body: Dict[str, Any], concurrency: int, requests: int, sampler,
+                uds: Optional[str] = None) -> List[Dict[str, Any]]:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    # A transport replaces the client's own pool, so it carries the limits
+    transport = httpx.AsyncHTTPTransport(uds=uds, limits=limits) if uds else None
+    results = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    async with httpx.AsyncClient(limits=limits, transport=transport,
+                                 timeout=httpx.Timeout(300.0, connect=30.0)) as client:
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                results.append(await run_stream(client, url, body))
+
+        async def sample():
+            while True:
+                sampler()
+                await asyncio.sleep(0.2)
+
+        sampling = asyncio.get_running_loop().create_task(sample())
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        sampling.cancel()
+    return results
+
+
+def summarize(results: List[Dict[str, Any]], wall: float) -> Dict[str, Any]:
+    ok = [r for r in results if r["error"] is None and r["arrivals"]]
+    ttft = [(r["arrivals"][0] - r["start"]) * 1000 for r in ok]
+    gaps = [(b - a) * 1000 for r in ok for a, b in zip(r["arrivals"], r["arrivals"][1:])]
+    tokens = sum(len(r["arrivals"]) for r in ok)
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r["error"] is not None:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    return {
+        "requests": len(results),
+        "succeeded": len(ok),
+        "errors": errors,
+        "wallSeconds": round(wall, 3),
+        "requestsPerSecond": round(len(ok) / wall, 2) if wall else None,
+        "tokensPerSecond": round(tokens / wall, 2) if wall else None,
+        "ttftMs": percentiles(ttft),
+        "interTokenMs": percentiles(gaps),
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def lookup(report: Dict[str, Any], dotted: str) -> Optional[float]:
+    value: Any = report
+    for part in dotted.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> bool:
+    """Print deltas against ``baseline``; False if any key regressed beyond tolerance"""
+    ok = True
+    for key in REGRESSION_KEYS + ("requestsPerSecond", "tokensPerSecond"):
+        new, old = lookup(report, key), lookup(baseline, key)
+        if new is None or not old:
+            continue
+        change = (new - old) / old
+        regressed = key in REGRESSION_KEYS and change > tolerance
+        ok = ok and not regressed
+        print(f"  {key:<20} {old:>10} -> {new:<10} {change:+.1%}{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def start_processes(args, uds: Optional[str] = None) -> Dict[str, Any]:
+    """Mock provider and app; the app listens on the Unix socket ``uds`` when given"""
+    mock_port, app_port = free_port(), free_port()
+    mock = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "mock_upstream.py"), "--port", str(mock_port),
+        "--ttft-ms", str(args.mock_ttft_ms), "--tokens-per-second", str(args.mock_tokens_per_second),
+        "--tokens", str(args.mock_tokens), "--jitter-ms", str(args.mock_jitter_ms), "--seed", "1",
+    ])
+    env = dict(
+        os.environ,
+        GLM_API_KEY=os.environ.get("GLM_API_KEY", "bench-key"),
+        MOONSHOT_API_KEY=os.environ.get("MOONSHOT_API_KEY", "bench-key"),
+        GLM_BASE_URL=f"http://127.0.0.1:{mock_port}/v4/",
+        KIMI_BASE_URL=f"http://127.0.0.1:{mock_port}/v1",
+        LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"),
+        # Keep benchmark token usage out of the working tree
+        DB_SQLITE_PATH=os.environ.get("DB_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "aanynotes-bench.db")),
+    )
+    listen = ["--uds", uds] if uds else ["--port", str(app_port)]
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", *listen, "--log-level", "warning", "--no-access-log"],
+        cwd=SRC_DIR, env=env,
+    )
+    # The host is ignored when connecting over a Unix socket
+    url = "http://localhost" if uds else f"http://127.0.0.1:{app_port}"
+    wait_for(f"http://127.0.0.1:{mock_port}/mock/stats")
+    wait_for(f"{url}/health", uds=uds)
+    return {"mock": mock, "app": app, "url": url}
+
+
+def run(args) -> Dict[str, Any]:
+    processes = None if args.app_url else start_processes(args)
+    base_url = args.app_url or processes["url"]
+    app_pid = processes["app"].pid if processes else None
+    samples: List[Dict[str, int]] = []
+
+    def sampler():
+        if app_pid:
+            samples.append(process_status(app_pid))
+
+    try:
+        body = build_request(args.history, args.message_chars, args.model)
+        sampler()
+        idle = samples[-1] if samples else {}
+        start = time.perf_counter()
+        results = asyncio.run(drive(f"{base_url}/api/chat/stream", body, args.concurrency, args.requests, sampler))
+        report = summarize(results, time.perf_counter() - start)
+    finally:
+        if processes:
+            for proc in (processes["app"], processes["mock"]):
+                proc.terminate()
+                proc.wait(timeout=10)
+
+    peak_rss = max((s.get("rssKb", 0) for s in samples), default=0)
+    report.update({
+        "label": args.label,
+        "gitRevision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "config": {
+            "concurrency": args.concurrency, "history": args.history, "messageChars": args.message_chars,
+            "model": args.model, "mockTtftMs": args.mock_ttft_ms,
+            "mockTokensPerSecond": args.mock_tokens_per_second, "mockTokens": args.mock_tokens,
+        },
+        "idleRssKb": idle.get("rssKb"),
+        "peakRssKb": peak_rss or None,
+        "rssPerStreamKb": round((peak_rss - idle.get("rssKb", 0)) / args.concurrency, 2) if peak_rss else None,
+        "peakThreads": max((s.get("threads", 0) for s in samples), default=0) or None,
+    })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end streaming load test against the mock provider")
+    parser.add_argument("--concurrency", type=int, default=100, help="Concurrent streams (100-10000)")
+    parser.add_argument("--requests", type=int, default=None, help="Total requests (default: 2x concurrency)")
+    parser.add_argument("--history", type=int, default=10, help="Messages of history per request")
+    parser.add_argument("--message-chars", type=int, default=400, help="Characters per history message")
+    parser.add_argument("--model", default="glm-4")
+    parser.add_argument("--mock-ttft-ms", type=float, default=200.0)
+    parser.add_argument("--mock-tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--mock-tokens", type=int, default=100)
+    parser.add_argument("--mock-jitter-ms", type=float, default=5.0)
+    parser.add_argument("--app-url", default=None, help="Benchmark a running service instead of spawning one")
+    parser.add_argument("--label", default=None, help="Free-form label stored in the report")
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    parser.add_argument("--baseline", default=None, help="Compare with a previous JSON report")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed regression for --baseline")
+    args = parser.parse_args()
+    args.requests = args.requests or args.concurrency * 2
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.baseline}:")
+        if not compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
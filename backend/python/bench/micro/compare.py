@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Compare two pytest-benchmark JSON files by median time per benchmark.
+
+Usage:
+    python bench/micro/compare.py baseline.json current.json [--tolerance 0.25]
+    python bench/micro/compare.py --snapshot current.json baseline.json
+
+Exits non-zero if any benchmark got slower than the tolerance. Absolute
+numbers depend on the machine; compare runs made on the same host. The
+committed baseline only keeps each benchmark's median, IQR and rounds, so
+before comparing on another host, refresh it there from the base commit.
+"""
+import argparse
+import json
+import sys
+from typing import Dict
+
+
+# Stats kept per benchmark in a snapshot
+SNAPSHOT_STATS = ("median", "iqr", "rounds")
+
+
+def load_medians(path: str) -> Dict[str, float]:
+    """Median per benchmark from a pytest-benchmark JSON file or a snapshot"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    benchmarks = data["benchmarks"]
+    if isinstance(benchmarks, dict):
+        return {name: stats["median"] for name, stats in benchmarks.items()}
+    return {bench["fullname"].split("::", 1)[-1]: bench["stats"]["median"] for bench in benchmarks}
+
+
+def snapshot(source: str, target: str) -> None:
+    """Write the stats of ``source`` that comparisons use, without machine or commit details"""
+    with open(source, encoding="utf-8") as f:
+        data = json.load(f)
+    benchmarks = {
+        bench["fullname"].split("::", 1)[-1]: {stat: bench["stats"][stat] for stat in SNAPSHOT_STATS}
+        for bench in data["benchmarks"]
+    }
+    with open(target, "w", encoding="utf-8") as f:
+        json.dump({"benchmarks": dict(sorted(benchmarks.items()))}, f, indent=2)
+        f.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pytest-benchmark results")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown (0.25 = 25%%)")
+    parser.add_argument("--snapshot", action="store_true", help="Save the first file as a compact baseline")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        snapshot(args.baseline, args.current)
+        return
+
+    baseline, current = load_medians(args.baseline), load_medians(args.current)
+    regressions = 0
+    print(f"{'benchmark':<55} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(set(baseline) | set(current)):
+        old, new = baseline.get(name), current.get(name)
+        if old is None or new is None:
+            print(f"{name:<55} {'-' if old is None else f'{old * 1e6:.2f}us':>12} "
+                  f"{'-' if new is None else f'{new * 1e6:.2f}us':>12}")
+            continue
+        change = (new - old) / old
+        flag = ""
+        if change > args.tolerance:
+            regressions += 1
+            flag = "  SLOWER"
+        print(f"{name:<55} {old * 1e6:>10.2f}us {new * 1e6:>10.2f}us {change:>+8.1%}{flag}")
+
+    if regressions:
+        print(f"{regressions} benchmark(s) slower than {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmarks for per-request and per-token hot paths (pytest-benchmark).
+
+Run:
+    pip install -r requirements/bench.txt
+    pytest bench/micro --benchmark-json=bench/micro/current.json
+
+Compare with the committed baseline:
+    python bench/micro/compare.py bench/micro/baseline.json bench/micro/current.json
+
+Refresh the baseline after an intended change:
+    pytest bench/micro --benchmark-json=bench/micro/current.json
+    python bench/micro/compare.py --snapshot bench/micro/current.json bench/micro/baseline.json
+"""
+import json
+import os
+import sys
+
+import pytest
+
+# Add src to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'src'))
+
+# Set benchmark environment variables
+os.environ.setdefault('GLM_API_KEY', 'bench-glm-api-key')
+os.environ.setdefault('MOONSHOT_API_KEY', 'bench-kimi-api-key')
+
+from api.endpoints.chat_endpoint import encode_chunk
+from api.stream_formats import FORMATS, MSGPACK, decode_msgpack_frames
+from common.models import ChatStreamRequest, Message, StreamChunk
+from config.app_settings import settings
+from config.model_mappings import get_model_id, get_model_type
+from models.glm_model import GLMModel
+from models.kimi_model import ContentType, KimiModel, wrap_chunk
+from models.sse import first_choice, parse_data_line
+from services.chat.chat_service import ChatService
+
+HISTORY = [
+    Message(id=f"msg-{i}", content=f"message {i} " * 40, sender="user" if i % 2 == 0 else "assistant",
+            time="2024-01-01T12:00:00Z")
+    for i in range(20)
+]
+CONVERTED = ChatService.convert_messages(HISTORY)
+
+CONTENT_LINE = 'data: ' + json.dumps({
+    "id": "chatcmpl-1", "object": "chat.completion.chunk", "created": 1700000000, "model": "glm-4",
+    "choices": [{"index": 0, "delta": {"role": "assistant", "content": "你好，世界"}, "finish_reason": None}],
+}, ensure_ascii=False)
+REASONING_LINE = 'data: ' + json.dumps({
+    "id": "chatcmpl-1", "object": "chat.completion.chunk", "created": 1700000000, "model": "kimi-k2-thinking",
+    "choices": [{"index": 0, "delta": {"reasoning_content": "Let me think"}, "finish_reason": None}],
+})
+
+
+# Media type -> parse of one encoded chunk
+CHUNK_DECODERS = {
+    "application/x-ndjson": json.loads,
+    "text/event-stream": lambda data: json.loads(data[data.index(b"data: ") + 6:]),
+    MSGPACK: lambda data: decode_msgpack_frames(data)[0],
+}
+
+
+class TestRoutingLookups:
+    def test_get_model_type(self, benchmark):
+        assert benchmark(get_model_type, "kimi-k2-thinking") == "kimi"
+
+    def test_get_model_id(self, benchmark):
+        assert benchmark(get_model_id, "glm-4") == "glm-4"
+
+
+class TestSettings:
+    def test_get_available_models(self, benchmark):
+        benchmark(settings.get_available_models)
+
+    def test_get_enabled_models(self, benchmark):
+        benchmark(settings.get_enabled_models)
+
+
+class TestRequestPath:
+    def test_convert_messages(self, benchmark):
+        assert len(benchmark(ChatService.convert_messages, HISTORY)) == 20
+
+    def test_request_validation(self, benchmark):
+        body = {"messages": [m.model_dump() for m in HISTORY], "model": "glm-4"}
+        benchmark(ChatStreamRequest.model_validate, body)
+
+    def test_glm_build_payload(self, benchmark):
+        model = GLMModel(model_id="glm-4")
+        assert benchmark(model.build_payload, CONVERTED, 0.6, 2000)["stream"] is True
+
+    def test_kimi_build_payload(self, benchmark):
+        model = KimiModel(model_id="kimi-k2-thinking")
+        assert benchmark(model.build_payload, CONVERTED, 0.6, 2000, 0.9, True)["enable_reasoning"] is True
+
+
+class TestTokenPath:
+    def test_parse_content_line(self, benchmark):
+        """The providers' per-line parse (models/sse.py)"""
+        assert first_choice(benchmark(parse_data_line, CONTENT_LINE))["delta"]["content"] == "你好，世界"
+
+    def test_parse_reasoning_line(self, benchmark):
+        assert "reasoning_content" in first_choice(benchmark(parse_data_line, REASONING_LINE))["delta"]
+
+    def test_json_loads(self, benchmark):
+        benchmark(json.loads, CONTENT_LINE[6:])
+
+    def test_wrap_chunk(self, benchmark):
+        benchmark(wrap_chunk, "你好，世界", False, ContentType.CONTENT)
+
+    def test_stream_chunk(self, benchmark):
+        benchmark(StreamChunk, content="你好，世界", finished=False)
+
+    def test_encode_chunk(self, benchmark):
+        chunk = StreamChunk(content="你好，世界", finished=False)
+        assert benchmark(encode_chunk, chunk).endswith(b"\n")
+
+    @pytest.mark.parametrize("media_type", list(FORMATS))
+    def test_encode_chunk_format(self, benchmark, media_type):
+        encode = FORMATS[media_type].new_encoder()
+        benchmark(encode, StreamChunk(content="你好，世界", finished=False))
+
+    @pytest.mark.parametrize("media_type", list(FORMATS))
+    def test_decode_chunk_format(self, benchmark, media_type):
+        """The consumer's per-chunk parse, as done by the gateway"""
+        data = FORMATS[media_type].new_encoder()(StreamChunk(content="你好，世界", finished=False))
+        decode = CHUNK_DECODERS[media_type]
+        assert benchmark(decode, data)["content"] == "你好，世界"
+
+    @pytest.mark.parametrize("tokens", [100])
+    def test_token_pipeline(self, benchmark, tokens):
+        """Parse, wrap, construct and encode ``tokens`` chunks end to end"""
+        lines = [CONTENT_LINE] * tokens
+
+        def pipeline():
+            for line in lines:
+                delta = first_choice(parse_data_line(line))["delta"]
+                encode_chunk(StreamChunk(content=wrap_chunk(delta["content"], False, ContentType.CONTENT), finished=False))
+
+        benchmark(pipeline)
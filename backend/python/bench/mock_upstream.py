@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Offline mock LLM provider for load and latency benchmarks.
+
+Speaks the OpenAI-compatible SSE dialect parsed by GLMModel and KimiModel:
+``reasoning_content`` and ``content`` deltas, ``finish_reason`` and ``usage``
+on the last chunk and a closing ``data: [DONE]``. Latency and failure behaviour are
+configurable so benchmarks and CI runs are reproducible without network
+access or paid API keys.
+
+Usage:
+    python bench/mock_upstream.py --port 9100 --ttft-ms 300 --tokens-per-second 40
+
+    GLM_BASE_URL=http://127.0.0.1:9100/v4/ KIMI_BASE_URL=http://127.0.0.1:9100/v1 \\
+        python src/main.py
+
+Behaviour can be changed at runtime with ``PUT /mock/config`` (JSON body
+with any MockConfig field) and counters are available at ``GET /mock/stats``.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import random
+import socket
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+
+class MockConfig:
+    """Latency, throughput and fault-injection settings of the mock provider"""
+
+    FIELDS = (
+        "ttft_ms", "tokens_per_second", "jitter_ms", "tokens", "reasoning_tokens",
+        "error_rate", "rate_limit_rate", "retry_after_seconds", "disconnect_rate",
+        "disconnect_after_tokens", "seed",
+    )
+
+    def __init__(self, ttft_ms: float = 200.0, tokens_per_second: float = 50.0, jitter_ms: float = 0.0,
+                 tokens: int = 100, reasoning_tokens: int = 0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, retry_after_seconds: int = 1, disconnect_rate: float = 0.0,
+                 disconnect_after_tokens: int = 10, seed: Optional[int] = None):
+        self.ttft_ms = ttft_ms
+        self.tokens_per_second = tokens_per_second
+        self.jitter_ms = jitter_ms
+        self.tokens = tokens
+        self.reasoning_tokens = reasoning_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_seconds = retry_after_seconds
+        self.disconnect_rate = disconnect_rate
+        self.disconnect_after_tokens = disconnect_after_tokens
+        self.seed = seed
+
+    def update(self, values: Dict[str, Any]) -> None:
+        for key, value in values.items():
+            if key in self.FIELDS:
+                setattr(self, key, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+class MockStats:
+    def __init__(self):
+        self.requests = 0
+        self.active_streams = 0
+        # Most streams open at once
+        self.peak_streams = 0
+        self.completed_streams = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.disconnects = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return dict(self.__dict__)
+
+
+class MockDisconnect(Exception):
+    """Raised inside the stream to drop the connection without a clean end"""
+
+
+def sse(data: Dict[str, Any]) -> bytes:
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def create_app(config: Optional[MockConfig] = None) -> FastAPI:
+    """Build the mock provider application"""
+    config = config or MockConfig()
+    stats = MockStats()
+    rng = random.Random(config.seed)
+    app = FastAPI(title="Mock LLM Provider")
+    app.state.config = config
+    app.state.stats = stats
+
+    def delay(seconds: float) -> float:
+        if config.jitter_ms:
+            seconds += rng.uniform(-config.jitter_ms, config.jitter_ms) / 1000.0
+        return max(0.0, seconds)
+
+    def chunk(model: str, delta: Dict[str, str], finish_reason: Optional[str] = None,
+              usage: Optional[Dict[str, int]] = None) -> bytes:
+        data = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        if usage:
+            data["usage"] = usage
+        return sse(data)
+
+    async def stream(model: str, reasoning: bool, max_tokens: int, disconnect: bool, prompt_tokens: int):
+        interval = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+        tokens = max(1, min(config.tokens, max_tokens))
+        stats.active_streams += 1
+        stats.peak_streams = max(stats.peak_streams, stats.active_streams)
+        try:
+            await asyncio.sleep(delay(config.ttft_ms / 1000.0))
+            if reasoning:
+                for i in range(config.reasoning_tokens):
+                    yield chunk(model, {"role": "assistant", "reasoning_content": f"think{i} "})
+                    await asyncio.sleep(delay(interval))
+            for i in range(tokens):
+                if disconnect and i == config.disconnect_after_tokens:
+                    stats.disconnects += 1
+                    raise MockDisconnect("mock mid-stream disconnect")
+                last = i == tokens - 1
+                # Usage rides on the final chunk, as GLM and Moonshot send it
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": tokens + (config.reasoning_tokens if reasoning else 0),
+                } if last else None
+                yield chunk(model, {"role": "assistant", "content": f"token{i} "}, "stop" if last else None, usage)
+                if not last:
+                    await asyncio.sleep(delay(interval))
+            yield b"data: [DONE]\n\n"
+            stats.completed_streams += 1
+        finally:
+            stats.active_streams -= 1
+
+    @app.head("/")
+    async def head_root():
+        # Connection warm-up pings
+        return Response(status_code=200)
+
+    @app.post("/chat/completions")
+    @app.post("/{prefix:path}/chat/completions")
+    async def chat_completions(request: Request, prefix: str = ""):
+        stats.requests += 1
+        payload = await request.json()
+        roll = rng.random()
+        if roll < config.rate_limit_rate:
+            stats.rate_limited += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                status_code=429,
+                headers={"Retry-After": str(config.retry_after_seconds)},
+            )
+        if roll < config.rate_limit_rate + config.error_rate:
+            stats.errors += 1
+            return JSONResponse({"error": {"message": "Mock upstream error", "type": "server_error"}}, status_code=500)
+
+        disconnect = rng.random() < config.disconnect_rate
+        reasoning = bool(payload.get("enable_reasoning")) or "thinking" in str(payload.get("model", ""))
+        return StreamingResponse(
+            stream(payload.get("model", "mock"), reasoning, int(payload.get("max_tokens") or config.tokens), disconnect,
+                   sum(len(str(m.get("content", ""))) // 4 + 1 for m in payload.get("messages", []))),
+            media_type="text/event-stream",
+        )
+
+    @app.get("/mock/config")
+    async def get_config():
+        return config.to_dict()
+
+    @app.put("/mock/config")
+    async def put_config(request: Request):
+        config.update(await request.json())
+        return config.to_dict()
+
+    @app.get("/mock/stats")
+    async def get_stats():
+        return stats.to_dict()
+
+    return app
+
+
+class MockServer:
+    """Mock provider running on a background thread, for tests and load runs"""
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.app = create_app(config)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self.host, self.port = self._sock.getsockname()[:2]
+        self._server = uvicorn.Server(uvicorn.Config(self.app, log_level="warning", access_log=False))
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [self._sock]}, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def config(self) -> MockConfig:
+        return self.app.state.config
+
+    @property
+    def stats(self) -> MockStats:
+        return self.app.state.stats
+
+    def start(self) -> "MockServer":
+        # anyio loads its asyncio backend on first use; servers started in one
+        # process would otherwise race on that import from their own threads
+        importlib.import_module("anyio._backends._asyncio")
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+        self._sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline mock LLM provider (OpenAI-compatible SSE)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft-ms", type=float, default=200.0, help="Delay before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Token rate, 0 for no delay")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter on every delay")
+    parser.add_argument("--tokens", type=int, default=100, help="Content tokens per response")
+    parser.add_argument("--reasoning-tokens", type=int, default=0, help="reasoning_content tokens for thinking requests")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after-seconds", type=int, default=1, help="Retry-After sent with 429")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="Fraction of streams dropped mid-way")
+    parser.add_argument("--disconnect-after-tokens", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible jitter and faults")
+    args = parser.parse_args()
+
+    config = MockConfig(**{field: getattr(args, field) for field in MockConfig.FIELDS})
+    print(f"Mock provider on http://{args.host}:{args.port}")
+    print(f"  GLM_BASE_URL=http://{args.host}:{args.port}/v4/")
+    print(f"  KIMI_BASE_URL=http://{args.host}:{args.port}/v1")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
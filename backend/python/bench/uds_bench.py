@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Loopback TCP versus a Unix domain socket on ``/api/chat/stream``.
+
+Runs the same workload against the app listening on 127.0.0.1 and then on
+a Unix socket (each with its own mock provider, started like load_test.py)
+and reports inter-chunk latency percentiles per transport, plus the CPU
+time the app and this client spent per delivered chunk. The mock streams
+fast by default so transport overhead, not provider pacing, dominates the
+inter-chunk gaps.
+
+Usage:
+    python bench/uds_bench.py --concurrency 200 --requests 2000 --output uds.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCH_DIR, "..", "src"))
+
+from load_test import build_request, drive, git_revision, start_processes, summarize
+
+
+def process_cpu_seconds(pid: int) -> Optional[float]:
+    """User plus system CPU time of ``pid`` from /proc (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Split after the command name, which may contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime are fields 14 and 15 of stat; fields[0] is field 3
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def measure(args, uds: Optional[str] = None) -> Dict[str, Any]:
+    processes = start_processes(args, uds)
+    pid = processes["app"].pid
+    try:
+        body = build_request(args.history, args.message_chars, args.model)
+        url = f"{processes['url']}/api/chat/stream"
+        # Unmeasured round so neither transport pays for cold pools and imports
+        warmup = min(args.concurrency, 10)
+        asyncio.run(drive(url, body, warmup, warmup, lambda: None, uds))
+
+        app_cpu, client_cpu = process_cpu_seconds(pid), time.process_time()
+        start = time.perf_counter()
+        results = asyncio.run(drive(url, body, args.concurrency, args.requests, lambda: None, uds))
+        report = summarize(results, time.perf_counter() - start)
+        client_cpu = time.process_time() - client_cpu
+        if app_cpu is not None:
+            app_cpu = process_cpu_seconds(pid) - app_cpu
+    finally:
+        for proc in (processes["app"], processes["mock"]):
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    chunks = sum(len(r["arrivals"]) for r in results) or 1
+    report["cpuUsPerChunk"] = {
+        "app": round(app_cpu / chunks * 1e6, 2) if app_cpu is not None else None,
+        "client": round(client_cpu / chunks * 1e6, 2),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare loopback TCP with a Unix domain socket")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=None, help="Total requests per transport (default: 2x concurrency)")
+    parser.add_argument("--history", type=int, default=10)
+    parser.add_argument("--message-chars", type=int, default=400)
+    parser.add_argument("--model", default="glm-4")
+    parser.add_argument("--mock-ttft-ms", type=float, default=20.0)
+    parser.add_argument("--mock-tokens-per-second", type=float, default=1000.0)
+    parser.add_argument("--mock-tokens", type=int, default=200)
+    parser.add_argument("--mock-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    args = parser.parse_args()
+    args.requests = args.requests or args.concurrency * 2
+
+    tcp = measure(args)
+    with tempfile.TemporaryDirectory() as directory:
+        uds = measure(args, os.path.join(directory, "python.sock"))
+
+    report = {
+        "gitRevision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {
+            "concurrency": args.concurrency, "requests": args.requests, "history": args.history,
+            "model": args.model, "mockTokens": args.mock_tokens,
+            "mockTokensPerSecond": args.mock_tokens_per_second,
+        },
+        "tcp": tcp,
+        "uds": uds,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
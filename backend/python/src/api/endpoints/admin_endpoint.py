@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Admin-only diagnostics: on-demand CPU and allocation profiling.
+
+Disabled (404) unless ADMIN_TOKEN is set; callers must send it in the
+X-Admin-Token header. Each profile runs for a bounded window on a worker
+thread and only one profile runs at a time per process.
+"""
+import asyncio
+import hmac
+import logging
+import threading
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from common.profiling import sample_cpu, track_allocations
+from config.app_settings import settings
+
+router = APIRouter(prefix="/admin")
+logger = logging.getLogger(__name__)
+
+_profile_lock = threading.Lock()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+async def _run_exclusive(func, *args):
+    if not _profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    try:
+        return await asyncio.to_thread(func, *args)
+    finally:
+        _profile_lock.release()
+
+
+@router.post("/profile/cpu", dependencies=[Depends(require_admin)])
+async def profile_cpu(seconds: float = Query(10.0, gt=0), intervalMs: float = Query(5.0, ge=1),
+                      includeIdle: bool = Query(False)):
+    """Sample thread stacks for a window, returned as collapsed stacks
+
+    Threads blocked in a wait are left out unless ``includeIdle`` is set,
+    which turns the CPU profile into a wall-clock profile of all threads.
+    """
+    seconds = min(seconds, settings.profile_max_seconds)
+    logger.info("Admin: %s profile for %.1fs at %.0fms", "wall-clock" if includeIdle else "CPU", seconds, intervalMs)
+    sampler = await _run_exclusive(sample_cpu, seconds, intervalMs / 1000.0, includeIdle)
+    return PlainTextResponse(sampler.collapsed(), headers={
+        "X-Profile-Samples": str(sampler.sample_count),
+        "X-Profile-Kind": "wall-clock" if includeIdle else "cpu",
+    })
+
+
+@router.post("/profile/memory", dependencies=[Depends(require_admin)])
+async def profile_memory(seconds: float = Query(30.0, gt=0), limit: int = Query(25, ge=1, le=500)):
+    """Top allocation sites that grew during the window"""
+    seconds = min(seconds, settings.profile_max_seconds)
+    logger.info("Admin: allocation tracking for %.1fs", seconds)
+    top = await _run_exclusive(track_allocations, seconds, limit)
+    return {"seconds": seconds, "top": top}
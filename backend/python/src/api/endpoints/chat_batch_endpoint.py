@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Batch chat (``/api/chat/batch``) for bulk note features.
+
+Summarising, tagging or re-titling a notebook sends many independent
+prompts. A batch takes them in one call, runs them concurrently through
+the same pipeline as ``/api/chat/stream`` (deadlines, quotas, usage,
+tracing, draining) with at most BATCH_CONCURRENCY requests per provider
+at a time, and streams one NDJSON record per request as it completes:
+
+    {"index": 3, "content": "..."}
+    {"index": 0, "content": "partial text", "error": {...ChunkError...}}
+    ...
+    {"done": true, "succeeded": 9, "failed": 1, "cancelled": 0}
+
+``index`` is the request's position in the batch, so results arrive out
+of order. A failed request does not affect the others unless the batch
+sets ``cancelOnError``, in which case the remaining requests end with a
+``BatchCancelled`` error. Closing the connection cancels everything still
+running or queued. An ``X-Request-Timeout-Ms`` header bounds the whole
+batch; ``timeoutMs`` on a request bounds that request.
+"""
+import asyncio
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from api.endpoints.chat_endpoint import aiter_stream, encoded_stream
+from api.stream_formats import NDJSON, encode_chunk
+from common.deadline import Deadline
+from common.drain import get_stream_drain
+from common.errors import error_chunk
+from common.metrics import StreamTimings
+from common.models import BatchResult, BatchSummary, ChatBatchRequest, ChatStreamRequest, ChunkError, StreamChunk
+from common.tracing import get_tracer
+from common.usage import RequestUsage
+from config.app_settings import settings
+from config.model_mappings import get_model_type
+from services.chat.scheduler import BACKGROUND, with_default_priority
+
+router = APIRouter(prefix="/chat")
+
+CANCELLED = "BatchCancelled"
+
+
+class BatchRun:
+    """Runs the requests of one batch and queues their results as they complete"""
+
+    def __init__(self, batch: ChatBatchRequest, request: Request):
+        self.batch = batch
+        self.headers = request.headers
+        header_ms = request.headers.get("x-request-timeout-ms")
+        self.deadline = Deadline.from_request(None, header_ms) if header_ms else None
+        self.results: asyncio.Queue = asyncio.Queue()
+        self.limits: Dict[str, asyncio.Semaphore] = {}
+        self.tasks: List[asyncio.Task] = []
+        self.cancel_reason: Optional[str] = None
+        self.closed = False
+
+    def limit(self, provider: str) -> asyncio.Semaphore:
+        if provider not in self.limits:
+            size = settings.batch_provider_concurrency.get(provider, settings.batch_concurrency)
+            self.limits[provider] = asyncio.Semaphore(max(1, size))
+        return self.limits[provider]
+
+    def start(self) -> None:
+        for index, req in enumerate(self.batch.requests):
+            # Yield upstream capacity to live chats unless the request says otherwise
+            req = with_default_priority(req, BACKGROUND)
+            self.tasks.append(asyncio.create_task(self.run(index, req)))
+
+    def cancel_all(self, reason: str) -> None:
+        self.cancel_reason = reason
+        current = asyncio.current_task()
+        for task in self.tasks:
+            if task is not current:
+                task.cancel()
+
+    async def run(self, index: int, req: ChatStreamRequest) -> None:
+        provider = get_model_type(req.model or "") or "unknown"
+        try:
+            async with self.limit(provider):
+                if self.cancel_reason is not None:
+                    raise asyncio.CancelledError
+                result = await self.complete(index, req)
+        except asyncio.CancelledError:
+            if self.closed:
+                raise
+            result = BatchResult(index=index, content="", error=ChunkError(
+                errorClass=CANCELLED, retryable=True, provider=provider, message=self.cancel_reason or "Cancelled"))
+        except Exception as e:
+            # Every request must report, or the batch would wait for it forever
+            result = BatchResult(index=index, content="", error=error_chunk(e, provider).error)
+        if result.error is not None and result.error.errorClass != CANCELLED and self.batch.cancelOnError:
+            self.cancel_all(f"Cancelled after request {index} failed")
+        self.results.put_nowait(result)
+
+    async def complete(self, index: int, req: ChatStreamRequest) -> BatchResult:
+        """Run one request to the end and collect its text"""
+        parts: List[str] = []
+        errors: List[ChunkError] = []
+
+        def collect(chunk: StreamChunk) -> bytes:
+            if chunk.error is not None:
+                errors.append(chunk.error)
+                return b""
+            parts.append(chunk.content)
+            return chunk.content.encode("utf-8")
+
+        # Timed from when the request got its turn, not from the batch's arrival
+        timings = StreamTimings()
+        span = get_tracer().start_request_span("POST /api/chat/batch", self.headers.get("traceparent"), timings.started)
+        usage = RequestUsage(self.headers.get("x-user-id"), req.messages)
+        batch_ms = f"{self.deadline.remaining() * 1000.0:.0f}" if self.deadline is not None else None
+        deadline = Deadline.from_request(req.timeoutMs, batch_ms)
+
+        stream = aiter_stream(encoded_stream(req, deadline, timings, usage, span, encode=collect))
+        try:
+            async for _ in stream:
+                pass
+        finally:
+            await stream.aclose()
+        return BatchResult(index=index, content="".join(parts), error=errors[-1] if errors else None)
+
+    async def records(self):
+        """NDJSON records in completion order, then the summary"""
+        counts = {"succeeded": 0, "failed": 0, "cancelled": 0}
+        try:
+            for _ in range(len(self.tasks)):
+                result = await self.results.get()
+                if result.error is None:
+                    counts["succeeded"] += 1
+                elif result.error.errorClass == CANCELLED:
+                    counts["cancelled"] += 1
+                else:
+                    counts["failed"] += 1
+                yield encode_chunk(result.model_dump(exclude_none=True))
+            yield encode_chunk(BatchSummary(**counts).model_dump())
+        finally:
+            # Client gone (or done): stop whatever is still queued or running
+            self.closed = True
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+@router.post("/batch")
+async def chat_batch(request: Request, batch: ChatBatchRequest):
+    """Run many chat requests and stream their results as they complete"""
+    if get_stream_drain().draining:
+        return JSONResponse(
+            {"detail": "Server is shutting down, retry the request"},
+            status_code=503,
+            headers={"Retry-After": "1", "Connection": "close"},
+        )
+    if not 0 < len(batch.requests) <= settings.batch_max_requests:
+        return JSONResponse(
+            {"detail": f"A batch holds 1 to {settings.batch_max_requests} requests"}, status_code=400)
+
+    run = BatchRun(batch, request)
+    run.start()
+    return StreamingResponse(
+        run.records(),
+        media_type=NDJSON,
+        headers={"X-Accel-Buffering": "no", "Connection": "keep-alive"}
+    )
@@ -1,99 +1,167 @@
 # -*- coding: utf-8 -*-
 from fastapi import APIRouter, Request
-from fastapi.responses import StreamingResponse
-from common.models import ChatStreamRequest
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from api.stream_formats import encode_chunk, negotiate
+from common.models import ChatStreamRequest, StreamChunk
+from common.deadline import Deadline
+from common.drain import ServerDraining, get_stream_drain
+from common.errors import error_chunk
+from common.metrics import StreamTimings
+from common.tracing import get_tracer, record_stream_spans
+from common.usage import RequestUsage
 from services.chat.chat_service import ChatService
+from services.chat.routing import routing_groups_summary
+from services.chat.scheduler import get_scheduler
+from services.chat.scoreboard import get_scoreboard
 from config.app_settings import settings
-import json
-from typing import Generator
+from config.logging_config import trace_request
+from models.http_pool import UpstreamCancel, current_cancel
+import asyncio
+import os
+import time
+from functools import partial
+from typing import AsyncGenerator, Callable, Generator
 import logging
 
 router = APIRouter(prefix="/chat")
 logger = logging.getLogger(__name__)
 
-print(f"DEBUG: Chat router initialized with prefix: /chat")
+def encoded_stream(req: ChatStreamRequest, deadline: Deadline, timings: StreamTimings, usage: RequestUsage,
+                   span, trace: bool = False,
+                   encode: Callable[[StreamChunk], bytes] = encode_chunk) -> Generator[bytes, None, None]:
+    """Run one chat stream and yield its encoded chunks
+
+    Shared by the HTTP and WebSocket endpoints: counts the stream for
+    shutdown draining, turns failures into a final error chunk and records
+    timings, usage and spans when the stream ends. At the drain deadline a
+    stream still waiting for its next chunk has the upstream read aborted
+    and ends with the ServerDraining error at once.
+    """
+    drain = get_stream_drain()
+    outcome = "ok"
+    # Already bound by aiter_stream for WebSocket streams
+    upstream = current_cancel() or UpstreamCancel()
+    # Registered so the drain deadline can abort a read waiting for the provider
+    drain.stream_started(upstream)
+    try:
+        chunk_count = 0
+        chunks = ChatService.stream_chat(req, deadline, timings, usage)
+        for chunk in iter(partial(upstream.call, next, chunks, None), None):
+            chunk_count += 1
+            if trace:
+                logger.debug("Chunk %d - Content: %.30s... - Finished: %s", chunk_count, chunk.content, chunk.finished)
+
+            if chunk.error is not None and upstream.cancelled and drain.expired():
+                # Read aborted at the drain deadline
+                outcome = "error"
+                yield encode(error_chunk(ServerDraining("Server is shutting down"), "unknown"))
+                break
+            data = encode(chunk)
+            timings.on_chunk(len(data))
+            if chunk.error is not None:
+                # Otherwise an aborted read is the client cancelling (see aiter_stream)
+                outcome = "cancelled" if upstream.cancelled else "error"
+            yield data
+
+            if chunk.finished:
+                if trace:
+                    logger.debug("Stream completed after %d chunks", chunk_count)
+                break
+            if drain.draining and drain.expired():
+                # Drain deadline reached: end with a retryable error, not a cut connection
+                outcome = "error"
+                yield encode(error_chunk(ServerDraining("Server is shutting down"), "unknown"))
+                break
+
+    except Exception as e:
+        logger.exception("ChatService.stream_chat() failed: %s", e)
+        chunk = error_chunk(e, "unknown", content=f"Service error: {str(e)}")
+        outcome = "error"
+        yield encode(chunk)
+    finally:
+        drain.stream_finished(upstream)
+        timings.finish(outcome)
+        usage.finish()
+        if span.sampled:
+            record_stream_spans(span, timings, outcome)
+
+async def aiter_stream(frames: Generator[bytes, None, None]) -> AsyncGenerator[bytes, None]:
+    """Iterate an ``encoded_stream`` from async code, one chunk per worker thread call
+
+    Closing the iterator (e.g. when the consuming task is cancelled) closes
+    the stream and with it the upstream provider connection. A step still
+    waiting for the provider is aborted first, so closing does not wait for
+    the next chunk. The first step, which may wait for a scheduler slot,
+    runs on the scheduler's admission executor when scheduling is on.
+    """
+    step = None
+    upstream = UpstreamCancel()
+    executor = get_scheduler().admission_executor()
+    try:
+        while True:
+            if step is None and executor is not None:
+                call = asyncio.get_running_loop().run_in_executor(executor, upstream.call, next, frames, None)
+            else:
+                call = run_in_threadpool(upstream.call, next, frames, None)
+            # Shielded: a cancel must not leave the generator running in a worker thread
+            step = asyncio.ensure_future(call)
+            data = await asyncio.shield(step)
+            if data is None:
+                return
+            yield data
+    finally:
+        if step is not None and not step.done():
+            upstream.cancel()
+            await asyncio.wait([step])
+        # Records usage and timings; closes the upstream stream if it is still open
+        await run_in_threadpool(frames.close)
 
 @router.post("/stream")
 async def chat_stream(request: Request, req: ChatStreamRequest):
-    """Chat streaming endpoint with detailed debugging"""
-    
-    print(f"DEBUG: chat_stream endpoint called")
-    print(f"DEBUG: Request method: {request.method}")
-    print(f"DEBUG: Request URL: {request.url}")
-    print(f"DEBUG: Request headers: {dict(request.headers)}")
-    print(f"DEBUG: Request client: {request.client}")
-    print(f"DEBUG: Request body size: {len(await request.body())} bytes")
-    
-    # Parse request details
-    print(f"DEBUG: Request model: {req.model}")
-    print(f"DEBUG: Request messages count: {len(req.messages) if req.messages else 0}")
-    
-    if req.messages:
-        print(f"DEBUG: First message preview: {req.messages[0].content[:50]}...")
-        print(f"DEBUG: First message sender: {req.messages[0].sender}")
-    
-    print(f"DEBUG: Request temperature: {req.temperature}")
-    print(f"DEBUG: Request maxTokens: {req.maxTokens}")
-    print(f"DEBUG: Request thinkingMode: {getattr(req, 'thinkingMode', False)}")
-    
-    def generate() -> Generator[str, None, None]:
-        try:
-            print(f"DEBUG: Starting ChatService.stream_chat()")
-            
-            chunk_count = 0
-            for chunk in ChatService.stream_chat(req):
-                chunk_count += 1
-                print(f"DEBUG: Chunk {chunk_count} - Content: {chunk.content[:30]}... - Finished: {chunk.finished}")
-                
-                # Convert chunk to JSON
-                if hasattr(chunk, "dict"):
-                    chunk_dict = chunk.dict()
-                else:
-                    chunk_dict = chunk
-                
-                json_str = json.dumps(chunk_dict, ensure_ascii=False) + "\n"
-                yield json_str
-                
-                if chunk.finished:
-                    print(f"DEBUG: Stream completed after {chunk_count} chunks")
-                    break
-                    
-        except Exception as e:
-            print(f"ERROR: ChatService.stream_chat() failed: {str(e)}")
-            import traceback
-            print(f"ERROR: Traceback: {traceback.format_exc()}")
-            
-            error_chunk = {
-                "content": f"Service error: {str(e)}",
-                "finished": True
-            }
-            error_json = json.dumps(error_chunk, ensure_ascii=False) + "\n"
-            print(f"DEBUG: Error Response: {error_json}")
-            yield error_json
+    """Chat streaming endpoint"""
+    drain = get_stream_drain()
+    if drain.draining:
+        # Shutting down: let the gateway retry on another worker
+        return JSONResponse(
+            {"detail": "Server is shutting down, retry the request"},
+            status_code=503,
+            headers={"Retry-After": "1", "Connection": "close"},
+        )
+    # Deadline from the gateway (header) or the request body, whichever is tighter
+    deadline = Deadline.from_request(req.timeoutMs, request.headers.get("x-request-timeout-ms"))
+    # Stage timings start when the request arrived (stamped by RequestTimingMiddleware)
+    received_at = getattr(request.state, "received_at", None)
+    timings = StreamTimings(received_at)
+    if received_at is not None:
+        timings.stage("body_parse", time.perf_counter() - received_at)
+    # Root span continuing the gateway's traceparent; a no-op when unsampled
+    span = get_tracer().start_request_span("POST /api/chat/stream", request.headers.get("traceparent"), received_at)
+    # Token accounting; recorded once when the stream ends and flushed in batches
+    usage = RequestUsage(request.headers.get("x-user-id"), req.messages)
 
-    try:
-        print(f"DEBUG: Creating StreamingResponse")
-        response = StreamingResponse(
-            generate(),
-            media_type="text/plain",
-            headers={"X-Accel-Buffering": "no", "Connection": "keep-alive"}
+    # Sampled per-request debug tracing; a single level check when debug is off
+    trace = trace_request(logger)
+    if trace:
+        logger.debug(
+            "chat_stream %s %s from %s: model=%s messages=%d temperature=%s maxTokens=%s thinkingMode=%s",
+            request.method, request.url, request.client, req.model, len(req.messages or []),
+            req.temperature, req.maxTokens, getattr(req, "thinkingMode", False),
         )
-        print(f"DEBUG: StreamingResponse created successfully")
-        return response
-        
-    except Exception as e:
-        print(f"ERROR: StreamingResponse creation failed: {str(e)}")
-        import traceback
-        print(f"ERROR: Traceback: {traceback.format_exc()}")
-        raise
+    
+    # NDJSON unless the Accept header asks for SSE or MessagePack frames
+    fmt = negotiate(request.headers.get("accept"))
+    return StreamingResponse(
+        aiter_stream(encoded_stream(req, deadline, timings, usage, span, trace, fmt.new_encoder())),
+        media_type=fmt.media_type,
+        headers={"X-Accel-Buffering": "no", "Connection": "keep-alive", "Vary": "Accept"}
+    )
 
 @router.get("/health")
 async def chat_health():
     """Chat service health check"""
-    print(f"DEBUG: Chat health endpoint called")
     try:
         available_models = ChatService.get_available_models()
-        print(f"DEBUG: Available models: {available_models}")
         
         return {
             "status": "healthy",
@@ -102,7 +170,7 @@ async def chat_health():
         }
         
     except Exception as e:
-        print(f"ERROR: Chat health check failed: {str(e)}")
+        logger.error("Chat health check failed: %s", e)
         return {
             "status": "unhealthy",
             "service": "Chat Service",
@@ -112,34 +180,23 @@ async def chat_health():
 @router.get("/models")
 async def get_models():
     """Get available AI models with full configuration"""
-    print(f"DEBUG: Models endpoint called")
     try:
         models_config = settings.get_enabled_models()
-        print(f"DEBUG: Available models with config: {models_config}")
+        logger.debug("Available models with config: %s", models_config)
         
         return {
             "models": models_config.get("models", []),
-            "defaultModel": models_config.get("defaultModel", "glm-4")
+            "defaultModel": models_config.get("defaultModel", "glm-4"),
+            "routingGroups": routing_groups_summary(),
+            "scores": get_scoreboard().snapshot(),
+            # Scores are kept per worker process
+            "scoresWorker": os.getpid()
         }
         
     except Exception as e:
-        print(f"ERROR: Models listing failed: {str(e)}")
-        import traceback
-        print(f"ERROR: Traceback: {traceback.format_exc()}")
+        logger.exception("Models listing failed: %s", e)
         return {
             "models": [],
             "defaultModel": "glm-4",
             "error": str(e)
         }
-
-print(f"DEBUG: All chat routes registered:")
-for route in router.routes:
-    print(f"  {route.path} - {route.methods}")
-
-
-
-
-
-
-
-
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""Multiplexed chat streams over one WebSocket (``/api/chat/ws``).
+
+A client keeps one connection open and runs any number of concurrent
+streams on it, each named by a client-chosen id. Frames are compact JSON
+objects, sent as text frames or, with ``?frames=binary``, as binary frames
+holding the UTF-8 bytes; the server reads either kind.
+
+Client frames:
+    {"type": "start", "id": "s1", "request": {...ChatStreamRequest...},
+     "credits": 32, "userId": "...", "traceparent": "..."}
+    {"type": "credit", "id": "s1", "n": 16}
+    {"type": "cancel", "id": "s1"}
+
+Server frames:
+    {"type": "chunk", "id": "s1", "chunk": {...StreamChunk...}}
+    {"type": "end", "id": "s1", "reason": "finished" | "cancelled"}
+    {"type": "error", "id": "s1", "message": "...", "retryable": false}
+
+Flow control: a stream may send as many chunk frames as it holds credits
+(``credits`` in its start frame, WS_INITIAL_CREDITS by default) and then
+waits for a credit frame, which in turn pauses the upstream read. A cancel
+frame closes the upstream stream. Each stream is accounted, traced and
+drained exactly like a ``/api/chat/stream`` request. While the worker is
+draining, start frames are refused with a retryable error; uvicorn closes
+the connection with code 1012 on shutdown.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+
+from api.endpoints.chat_endpoint import aiter_stream, encoded_stream
+from api.stream_formats import chunk_fields
+from common.deadline import Deadline
+from common.drain import get_stream_drain
+from common.metrics import StreamTimings
+from common.models import ChatStreamRequest, StreamChunk
+from common.tracing import get_tracer
+from common.usage import RequestUsage
+from config.app_settings import settings
+from config.logging_config import trace_request
+
+router = APIRouter(prefix="/chat")
+logger = logging.getLogger(__name__)
+
+
+def encode_frame(frame: Dict[str, Any]) -> bytes:
+    return json.dumps(frame, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class StreamCredits:
+    """Chunk frames the client is ready to receive for one stream"""
+
+    def __init__(self, credits: int):
+        self.credits = credits
+        self._granted = asyncio.Event()
+
+    def grant(self, n: int) -> None:
+        self.credits += n
+        self._granted.set()
+
+    async def take(self) -> None:
+        while self.credits <= 0:
+            self._granted.clear()
+            await self._granted.wait()
+        self.credits -= 1
+
+
+class ChatConnection:
+    """Streams running on one WebSocket connection"""
+
+    def __init__(self, websocket: WebSocket, binary: bool = False):
+        self.websocket = websocket
+        self.binary = binary
+        self.streams: Dict[str, asyncio.Task] = {}
+        self.credits: Dict[str, StreamCredits] = {}
+        self.closed = False
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, data: bytes) -> None:
+        async with self._send_lock:
+            if self.binary:
+                await self.websocket.send_bytes(data)
+            else:
+                await self.websocket.send_text(data.decode("utf-8"))
+
+    async def send_error(self, stream_id: Optional[str], message: str, retryable: bool = False) -> None:
+        await self.send(encode_frame({"type": "error", "id": stream_id, "message": message, "retryable": retryable}))
+
+    async def serve(self) -> None:
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                raw = message.get("text")
+                if raw is None:
+                    raw = (message.get("bytes") or b"").decode("utf-8", errors="replace")
+                try:
+                    frame = json.loads(raw)
+                except ValueError:
+                    await self.send_error(None, "Frame is not valid JSON")
+                    continue
+                if not isinstance(frame, dict):
+                    await self.send_error(None, "Frame must be a JSON object")
+                    continue
+                try:
+                    await self.handle(frame)
+                except (TypeError, ValueError) as e:
+                    await self.send_error(frame.get("id"), f"Invalid frame: {e}")
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.closed = True
+            for task in list(self.streams.values()):
+                task.cancel()
+            if self.streams:
+                await asyncio.gather(*self.streams.values(), return_exceptions=True)
+
+    async def handle(self, frame: Dict[str, Any]) -> None:
+        kind = frame.get("type")
+        stream_id = frame.get("id")
+        if not isinstance(stream_id, str) or not stream_id:
+            await self.send_error(None, "Frame needs a string id")
+        elif kind == "start":
+            await self.start(stream_id, frame)
+        elif kind == "credit":
+            credits = self.credits.get(stream_id)
+            if credits is not None:
+                credits.grant(int(frame.get("n", 0)))
+        elif kind == "cancel":
+            task = self.streams.get(stream_id)
+            if task is not None:
+                task.cancel()
+        else:
+            await self.send_error(stream_id, f"Unknown frame type {kind!r}")
+
+    async def start(self, stream_id: str, frame: Dict[str, Any]) -> None:
+        received_at = time.perf_counter()
+        if stream_id in self.streams:
+            await self.send_error(stream_id, "Stream id is already in use")
+            return
+        if get_stream_drain().draining:
+            await self.send_error(stream_id, "Server is shutting down, retry the request", retryable=True)
+            return
+        if len(self.streams) >= settings.ws_max_streams:
+            await self.send_error(stream_id, f"At most {settings.ws_max_streams} concurrent streams per connection",
+                                  retryable=True)
+            return
+        try:
+            req = ChatStreamRequest(**(frame.get("request") or {}))
+        except (ValidationError, TypeError) as e:
+            await self.send_error(stream_id, f"Invalid request: {e}")
+            return
+
+        timings = StreamTimings(received_at)
+        timings.stage("body_parse", time.perf_counter() - received_at)
+        headers = self.websocket.headers
+        span = get_tracer().start_request_span(
+            "WS /api/chat/ws", frame.get("traceparent") or headers.get("traceparent"), received_at)
+        usage = RequestUsage(frame.get("userId") or headers.get("x-user-id"), req.messages)
+        deadline = Deadline.from_request(req.timeoutMs, headers.get("x-request-timeout-ms"))
+        credits = StreamCredits(int(frame.get("credits") or settings.ws_initial_credits))
+
+        def encode(chunk: StreamChunk) -> bytes:
+            return encode_frame({"type": "chunk", "id": stream_id, "chunk": chunk_fields(chunk)})
+
+        frames = encoded_stream(req, deadline, timings, usage, span, trace_request(logger), encode)
+        self.credits[stream_id] = credits
+        self.streams[stream_id] = asyncio.create_task(self.run(stream_id, frames, credits))
+
+    async def run(self, stream_id: str, frames, credits: StreamCredits) -> None:
+        reason = "finished"
+        stream = aiter_stream(frames)
+        try:
+            async for data in stream:
+                await credits.take()
+                await self.send(data)
+        except asyncio.CancelledError:
+            reason = "cancelled"
+            raise
+        except Exception as e:
+            # The connection went away mid-send; the receive loop cleans up
+            logger.debug("WebSocket stream %s stopped: %s", stream_id, e)
+            reason = "cancelled"
+        finally:
+            # Closes the upstream stream and records usage and timings
+            await stream.aclose()
+            self.streams.pop(stream_id, None)
+            self.credits.pop(stream_id, None)
+            if not self.closed:
+                try:
+                    await self.send(encode_frame({"type": "end", "id": stream_id, "reason": reason}))
+                except Exception:
+                    pass
+
+
+@router.websocket("/ws")
+async def chat_ws(websocket: WebSocket, frames: str = "text"):
+    """Multiplexed chat streams over one WebSocket connection"""
+    await websocket.accept()
+    await ChatConnection(websocket, binary=frames == "binary").serve()
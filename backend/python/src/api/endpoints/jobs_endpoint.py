@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Asynchronous chat jobs (see services/chat/jobs.py).
+
+    POST /api/jobs                      submit, 202 with the job status
+    GET  /api/jobs/{id}                 status
+    GET  /api/jobs/{id}/result?offset=  text from ``offset`` (characters) on
+    POST /api/jobs/{id}/cancel          cancel
+
+The tenant used for fairness and usage is ``X-Tenant-Id``, else
+``X-User-Id``. A job that was queued again after a worker stopped runs
+from the start: its ``attempt`` grows and readers restart from offset 0.
+"""
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import JSONResponse
+
+from common.models import ChatJobRequest
+from services.chat.jobs import WebhookRejected, get_job_queue, job_view
+
+router = APIRouter(prefix="/jobs")
+
+
+def _not_found(job_id: str) -> JSONResponse:
+    return JSONResponse({"detail": f"Job {job_id} not found"}, status_code=404)
+
+
+@router.post("", status_code=202)
+async def submit_job(request: Request, job: ChatJobRequest):
+    """Queue a chat request to run in the background"""
+    tenant = request.headers.get("x-tenant-id") or request.headers.get("x-user-id") or "anonymous"
+    try:
+        return await get_job_queue().submit(job.request, tenant, job.priority, job.notBefore, job.webhookUrl)
+    except WebhookRejected as e:
+        return JSONResponse({"detail": str(e)}, status_code=400)
+
+
+@router.get("/{job_id}")
+async def job_status(job_id: str):
+    row = await get_job_queue().get(job_id)
+    return job_view(row) if row else _not_found(job_id)
+
+
+@router.get("/{job_id}/result")
+async def job_result(job_id: str, offset: int = Query(0, ge=0)):
+    """Generated text from ``offset`` on; poll again from ``nextOffset``"""
+    row = await get_job_queue().get(job_id)
+    if row is None:
+        return _not_found(job_id)
+    content = row["content"] or ""
+    result = {
+        "id": job_id,
+        "status": row["status"],
+        "attempt": row["attempt"],
+        "offset": offset,
+        "nextOffset": max(offset, len(content)),
+        "content": content[offset:],
+    }
+    view = job_view(row)
+    if "error" in view:
+        result["error"] = view["error"]
+    return result
+
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    row = await get_job_queue().cancel(job_id)
+    return job_view(row) if row else _not_found(job_id)
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""Token usage totals per model, API key or user (see common/usage.py).
+
+Per-user totals, key names and cost are admin data: like the admin
+endpoints, the route needs ADMIN_TOKEN in the X-Admin-Token header.
+"""
+import asyncio
+import time
+
+from fastapi import APIRouter, Depends, Query
+
+from api.endpoints.admin_endpoint import require_admin
+from common.usage import get_usage_aggregator
+
+router = APIRouter(prefix="/usage")
+
+
+@router.get("", dependencies=[Depends(require_admin)])
+async def get_usage(groupBy: str = Query("model", pattern="^(model|key|user)$"),
+                    sinceHours: float = Query(24.0, gt=0)):
+    """Prompt/completion token totals and cost since ``sinceHours`` ago"""
+    since = int(time.time() - sinceHours * 3600)
+    usage = await asyncio.to_thread(get_usage_aggregator().summary, since, groupBy)
+    return {"groupBy": groupBy, "since": since, "usage": usage}
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Wire formats for ``/api/chat/stream``, negotiated from the Accept header.
+
+- ``application/x-ndjson`` (default): one JSON chunk per line.
+- ``text/event-stream``: one SSE event per chunk; ``id`` is the chunk's
+  sequence number in the stream and ``data`` the JSON chunk.
+- ``application/msgpack``: each chunk as a MessagePack map with the same
+  fields as the JSON chunk, prefixed by its length as a 4-byte big-endian
+  integer. Internal consumers read frames without scanning for delimiters
+  or unescaping strings.
+
+A format is a media type plus a factory returning a fresh encoder per
+stream, so stateful framing (SSE ids) needs no shared state. Add a format
+by registering it in ``FORMATS``.
+"""
+import json
+import struct
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import msgpack
+
+from common.models import StreamChunk
+
+ChunkEncoder = Callable[[StreamChunk], bytes]
+
+NDJSON = "application/x-ndjson"
+EVENT_STREAM = "text/event-stream"
+MSGPACK = "application/msgpack"
+
+_FRAME_LENGTH = struct.Struct(">I")
+
+
+def chunk_fields(chunk: StreamChunk) -> Dict[str, Any]:
+    """The JSON chunk's fields; ``error`` only on error chunks, compare tags only in compare mode"""
+    fields: Dict[str, Any] = {"content": chunk.content, "finished": chunk.finished}
+    if chunk.error is not None:
+        fields["error"] = chunk.error.model_dump()
+    if chunk.model is not None:
+        fields["model"] = chunk.model
+        if chunk.modelDone:
+            fields["modelDone"] = True
+            fields["ttftMs"] = chunk.ttftMs
+    return fields
+
+
+def encode_chunk(chunk) -> bytes:
+    """Encode one chunk as an NDJSON line"""
+    chunk_dict = chunk_fields(chunk) if isinstance(chunk, StreamChunk) else chunk
+    return (json.dumps(chunk_dict, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def event_stream_encoder() -> ChunkEncoder:
+    sequence = 0
+
+    def encode(chunk: StreamChunk) -> bytes:
+        nonlocal sequence
+        sequence += 1
+        data = json.dumps(chunk_fields(chunk), ensure_ascii=False)
+        return f"id: {sequence}\ndata: {data}\n\n".encode("utf-8")
+
+    return encode
+
+
+def encode_chunk_msgpack(chunk: StreamChunk) -> bytes:
+    """Length-prefixed MessagePack frame"""
+    body = msgpack.packb(chunk_fields(chunk))
+    return _FRAME_LENGTH.pack(len(body)) + body
+
+
+def decode_msgpack_frames(data: bytes) -> List[Dict[str, Any]]:
+    """Chunks from a complete ``application/msgpack`` response body"""
+    chunks, offset = [], 0
+    while offset < len(data):
+        (length,) = _FRAME_LENGTH.unpack_from(data, offset)
+        offset += _FRAME_LENGTH.size
+        chunks.append(msgpack.unpackb(data[offset:offset + length]))
+        offset += length
+    return chunks
+
+
+class StreamFormat:
+    """A response media type and the encoder factory for its chunks"""
+
+    def __init__(self, media_type: str, new_encoder: Callable[[], ChunkEncoder]):
+        self.media_type = media_type
+        self.new_encoder = new_encoder
+
+
+# Media type -> format
+FORMATS: Dict[str, StreamFormat] = {
+    NDJSON: StreamFormat(NDJSON, lambda: encode_chunk),
+    EVENT_STREAM: StreamFormat(EVENT_STREAM, event_stream_encoder),
+    MSGPACK: StreamFormat(MSGPACK, lambda: encode_chunk_msgpack),
+}
+DEFAULT_FORMAT = FORMATS[NDJSON]
+# Wildcards a client may list instead of a concrete type
+_WILDCARDS = {"*/*": DEFAULT_FORMAT, "application/*": DEFAULT_FORMAT}
+
+
+def _accepted(accept: str) -> List[Tuple[float, int, str]]:
+    """(quality, position, media type) for each entry of an Accept header"""
+    entries = []
+    for position, entry in enumerate(accept.split(",")):
+        media_type, *params = [part.strip() for part in entry.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type:
+            entries.append((quality, position, media_type.lower()))
+    return entries
+
+
+def negotiate(accept: Optional[str]) -> StreamFormat:
+    """Format for an Accept header: the supported type with the highest
+    quality, earliest listed on ties. Wildcards, a missing header and
+    headers naming only other types get the default."""
+    if not accept:
+        return DEFAULT_FORMAT
+    best = None
+    for quality, position, media_type in _accepted(accept):
+        fmt = FORMATS.get(media_type) or _WILDCARDS.get(media_type)
+        if fmt is not None and quality > 0 and (best is None or (-quality, position) < best[0]):
+            best = ((-quality, position), fmt)
+    return best[1] if best else DEFAULT_FORMAT
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Request deadlines propagated from the gateway down to providers.
+
+The caller sends a relative budget (``X-Request-Timeout-Ms`` header or the
+``timeoutMs`` request field), which is turned into an absolute monotonic
+deadline when the request arrives. Providers derive their connect,
+first-token and total budgets from the remaining time and stop as soon as
+the deadline can no longer be met.
+"""
+import time
+from typing import Optional
+
+import httpx
+
+# Below this remaining budget an upstream call cannot produce a useful answer
+MIN_USEFUL_BUDGET = 0.05
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request deadline passed before the work could complete"""
+
+
+class Deadline:
+    """Absolute monotonic deadline with per-stage budgets"""
+
+    def __init__(self, timeout: float, connect_timeout: float = 10.0, first_token_timeout: float = 60.0):
+        self.expires_at = time.monotonic() + max(0.0, timeout)
+        self.connect_timeout = connect_timeout
+        self.first_token_timeout = first_token_timeout
+
+    @classmethod
+    def from_request(cls, timeout_ms: Optional[float] = None, header_ms: Optional[str] = None, settings=None) -> "Deadline":
+        """Build a deadline from the request field and/or header
+
+        The smaller of the two budgets wins; without either the configured
+        default request timeout applies.
+        """
+        if settings is None:
+            from config.app_settings import settings
+        budgets = []
+        for value in (timeout_ms, header_ms):
+            try:
+                if value:
+                    budgets.append(float(value) / 1000.0)
+            except ValueError:
+                pass
+        timeout = min(budgets) if budgets else settings.request_default_timeout_seconds
+        return cls(
+            timeout,
+            connect_timeout=settings.upstream_connect_timeout_seconds,
+            first_token_timeout=settings.upstream_first_token_timeout_seconds,
+        )
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self, stage: str) -> None:
+        """Raise DeadlineExceeded if too little time is left for ``stage``"""
+        if self.remaining() < MIN_USEFUL_BUDGET:
+            raise DeadlineExceeded(f"Request deadline exceeded before {stage}")
+
+    def httpx_timeout(self) -> httpx.Timeout:
+        """Connect and first-token budgets for an upstream call
+
+        The read timeout bounds the wait for the first token (and every
+        later read); the total budget is enforced between chunks, and
+        ChatService aborts a read still waiting when the deadline passes
+        (``within_deadline``).
+        """
+        remaining = self.remaining()
+        connect = min(remaining, self.connect_timeout)
+        return httpx.Timeout(
+            connect=connect,
+            read=min(remaining, self.first_token_timeout),
+            write=connect,
+            pool=connect,
+        )
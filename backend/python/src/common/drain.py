@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Graceful draining of in-flight chat streams on shutdown.
+
+On SIGTERM uvicorn stops listening, closes idle keep-alive connections and
+waits (up to ``timeout_graceful_shutdown``) for open responses before it
+runs the lifespan shutdown. StreamDrain covers what the app has to do on
+top of that:
+
+- streams that still arrive are refused with 503 and ``/health`` reports
+  draining, so the gateway and load balancers move traffic elsewhere;
+- streams still running at the drain deadline end with a retryable error
+  chunk instead of a connection cut mid-answer; the upstream reads of
+  streams waiting for their next chunk are aborted at the deadline, so
+  they do not wait for the provider;
+- the lifespan shutdown waits for the remaining streams before pooled
+  upstream clients are closed.
+"""
+import asyncio
+import logging
+import os
+import signal
+import threading
+import time
+from typing import Optional, Set
+
+logger = logging.getLogger(__name__)
+
+DRAIN_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+class ServerDraining(ConnectionError):
+    """The worker is shutting down; the request can be retried elsewhere"""
+
+
+class StreamDrain:
+    """Tracks in-flight streams and the shutdown drain deadline"""
+
+    def __init__(self, timeout: float = 30.0):
+        self.timeout = timeout
+        self.draining = False
+        self.deadline: Optional[float] = None
+        self.active = 0
+        # UpstreamCancel of each in-flight stream, aborted at the deadline
+        self._upstreams: Set = set()
+        self._lock = threading.Lock()
+
+    def begin(self) -> None:
+        """Start draining; idempotent"""
+        if not self.draining:
+            self.deadline = time.monotonic() + self.timeout
+            self.draining = True
+            logger.info("Draining %d in-flight streams (up to %.0fs)", self.active, self.timeout)
+            timer = threading.Timer(self.timeout, self.abort_streams)
+            timer.daemon = True
+            timer.start()
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def stream_started(self, upstream=None) -> None:
+        with self._lock:
+            self.active += 1
+            if upstream is not None:
+                self._upstreams.add(upstream)
+
+    def stream_finished(self, upstream=None) -> None:
+        with self._lock:
+            self.active -= 1
+            self._upstreams.discard(upstream)
+
+    def abort_streams(self) -> None:
+        """Abort the upstream reads of the streams still running"""
+        with self._lock:
+            upstreams = list(self._upstreams)
+        if upstreams:
+            logger.warning("Drain deadline reached, aborting %d streams", len(upstreams))
+        for upstream in upstreams:
+            upstream.cancel()
+
+    async def wait(self, poll: float = 0.1) -> int:
+        """Wait until no streams are active or the deadline passes; returns streams left"""
+        self.begin()
+        while self.active > 0 and not self.expired():
+            await asyncio.sleep(poll)
+        return self.active
+
+    def install_signal_handlers(self) -> None:
+        """Begin draining on SIGTERM/SIGINT, then run the existing handler
+
+        Must run in the main thread after the server installed its own
+        handlers (i.e. during lifespan startup); elsewhere it is a no-op.
+        """
+        for sig in DRAIN_SIGNALS:
+            try:
+                previous = signal.getsignal(sig)
+                signal.signal(sig, self._handler(previous))
+            except ValueError:
+                # Not the main thread (e.g. TestClient); the lifespan wait still applies
+                return
+
+    def _handler(self, previous):
+        def handle(sig, frame):
+            self.begin()
+            if callable(previous):
+                previous(sig, frame)
+            elif previous == signal.SIG_DFL:
+                signal.signal(sig, signal.SIG_DFL)
+                os.kill(os.getpid(), sig)
+        return handle
+
+
+_drain: Optional[StreamDrain] = None
+
+
+def get_stream_drain() -> StreamDrain:
+    """Process-wide drain state built lazily from settings"""
+    global _drain
+    if _drain is None:
+        from config.app_settings import settings
+        _drain = StreamDrain(settings.shutdown_drain_seconds)
+    return _drain
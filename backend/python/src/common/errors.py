@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""Structured error chunks for streaming responses"""
+import httpx
+
+from common.deadline import DeadlineExceeded
+from common.models import ChunkError, StreamChunk
+
+# HTTP status codes worth retrying against the same or another provider
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether a failed upstream call may succeed if retried"""
+    if isinstance(exc, DeadlineExceeded):
+        # The caller has already given up, a retry cannot help
+        return False
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUS_CODES
+    if isinstance(exc, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)):
+        return True
+    return isinstance(exc, (TimeoutError, ConnectionError))
+
+
+def error_chunk(exc: BaseException, provider: str, content: str = None) -> StreamChunk:
+    """Build the final chunk of a failed stream
+
+    Args:
+        exc: The exception that ended the stream
+        provider: Model type that was being called ('glm', 'kimi', ...)
+        content: Text shown to the user, defaults to the exception message
+
+    Returns:
+        A finished StreamChunk carrying a ChunkError
+    """
+    message = str(exc) or exc.__class__.__name__
+    return StreamChunk(
+        content=content if content is not None else message,
+        finished=True,
+        error=ChunkError(
+            errorClass=exc.__class__.__name__,
+            retryable=is_retryable(exc),
+            provider=provider or "unknown",
+            message=message,
+        ),
+    )
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""Low-overhead streaming latency metrics in Prometheus text format.
+
+Histograms use fixed bucket bounds and plain list counters. Updates are not
+locked: under the GIL a concurrent increment can very rarely be lost, which
+is an acceptable trade for keeping per-token recording well under a
+microsecond.
+
+Each worker process records into its own registry. When server.py runs
+several workers (SHARED_STATE_NAME is set), every worker writes a snapshot
+of its registry to a directory shared by the server every
+METRICS_PUBLISH_INTERVAL_SECONDS, and /metrics serves the sum of all
+snapshots, so a scrape sees the whole server whichever worker answers it.
+Other workers' numbers are up to one interval old. Snapshots of workers
+that exited are kept, so counters never go backwards.
+"""
+import logging
+import marshal
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds in seconds, from sub-millisecond token gaps to long thinking runs
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+
+STAGES = (
+    "body_parse",
+    "model_resolution",
+    "create_model",
+    "upstream_connect",
+    "upstream_ttfb",
+    "first_content_token",
+    "first_thinking_token",
+    "total",
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value) -> str:
+    """Label value escaped for the text format: backslash, double quote, line feed"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """Cumulative-on-render histogram with fixed bucket bounds"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+
+class MetricsRegistry:
+    """Named, labelled histograms and counters rendered for /metrics"""
+
+    def __init__(self):
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, Counter]] = {}
+        self._help: Dict[str, str] = {}
+
+    def histogram(self, name: str, help: str = "", **labels: str) -> Histogram:
+        series = self._histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series.setdefault(key, Histogram())
+            self._help.setdefault(name, help)
+        return histogram
+
+    def counter(self, name: str, help: str = "", **labels: str) -> Counter:
+        series = self._counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        counter = series.get(key)
+        if counter is None:
+            counter = series.setdefault(key, Counter())
+            self._help.setdefault(name, help)
+        return counter
+
+    @staticmethod
+    def _labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(key) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        escaped = (f'{k}="{_escape(v)}"' for k, v in pairs)
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines: List[str] = []
+        for name, series in list(self._histograms.items()):
+            lines.append(f"# HELP {name} {self._help.get(name, '')}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in list(series.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._labels(key, ('le', repr(bound)))} {cumulative}")
+                cumulative += histogram.counts[-1]
+                lines.append(f"{name}_bucket{self._labels(key, ('le', '+Inf'))} {cumulative}")
+                lines.append(f"{name}_sum{self._labels(key)} {histogram.sum}")
+                lines.append(f"{name}_count{self._labels(key)} {histogram.count}")
+        for name, series in list(self._counters.items()):
+            lines.append(f"# HELP {name} {self._help.get(name, '')}")
+            lines.append(f"# TYPE {name} counter")
+            for key, counter in list(series.items()):
+                lines.append(f"{name}{self._labels(key)} {counter.value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current values as plain data (marshal-able), for merging in another process"""
+        return {
+            "help": dict(self._help),
+            "histograms": {
+                name: {key: (h.bounds, list(h.counts), h.sum, h.count) for key, h in list(series.items())}
+                for name, series in list(self._histograms.items())
+            },
+            "counters": {
+                name: {key: c.value for key, c in list(series.items())}
+                for name, series in list(self._counters.items())
+            },
+        }
+
+    def merge(self, snapshot: Dict[str, Any]) -> None:
+        """Add the values of ``snapshot`` to this registry"""
+        for name, help in snapshot["help"].items():
+            self._help.setdefault(name, help)
+        for name, series in snapshot["histograms"].items():
+            merged = self._histograms.setdefault(name, {})
+            for key, (bounds, counts, total, count) in series.items():
+                histogram = merged.setdefault(key, Histogram(tuple(bounds)))
+                for i, value in enumerate(counts):
+                    histogram.counts[i] += value
+                histogram.sum += total
+                histogram.count += count
+        for name, series in snapshot["counters"].items():
+            merged = self._counters.setdefault(name, {})
+            for key, value in series.items():
+                merged.setdefault(key, Counter()).inc(value)
+
+
+# Process-wide registry exposed on /metrics
+metrics = MetricsRegistry()
+
+
+def worker_metrics_dir(shared_state_name: str) -> str:
+    """Directory holding the registry snapshots of one server's workers"""
+    return os.path.join(tempfile.gettempdir(), f"{shared_state_name}-metrics")
+
+
+class WorkerMetrics:
+    """Publishes this worker's registry and renders the sum over all workers"""
+
+    def __init__(self, directory: str, registry: MetricsRegistry = metrics, interval: float = 5.0,
+                 worker: Optional[str] = None):
+        self.directory = directory
+        self.registry = registry
+        self.interval = interval
+        self.path = os.path.join(directory, f"{worker or os.getpid()}.metrics")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional["WorkerMetrics"]:
+        """None when this process is the server's only worker (no shared state)"""
+        if not settings.shared_state_name:
+            return None
+        return cls(worker_metrics_dir(settings.shared_state_name),
+                   interval=settings.metrics_publish_interval_seconds)
+
+    def publish(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        partial = f"{self.path}.tmp"
+        with open(partial, "wb") as f:
+            marshal.dump(self.registry.snapshot(), f)
+        # Readers only ever see a complete snapshot
+        os.replace(partial, self.path)
+
+    def render(self) -> str:
+        """Prometheus text of every worker's latest snapshot summed, this worker's current"""
+        self.publish()
+        total = MetricsRegistry()
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".metrics"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), "rb") as f:
+                    total.merge(marshal.load(f))
+            except (OSError, EOFError, ValueError, TypeError) as e:
+                logger.warning("Metrics: skipping unreadable snapshot %s: %s", name, e)
+        return total.render()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.publish()
+            except OSError as e:
+                logger.warning("Metrics: snapshot write failed: %s", e)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="metrics-publisher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        try:
+            self.publish()
+        except OSError:
+            pass
+
+
+class StreamTimings:
+    """Stage timestamps of one streaming request
+
+    Stages are kept on the instance and flushed to per-model histograms by
+    ``finish``; only inter-token gaps are recorded while streaming.
+    """
+
+    def __init__(self, started: Optional[float] = None, registry: MetricsRegistry = metrics):
+        self.started = started if started is not None else time.perf_counter()
+        self.registry = registry
+        self.model = "unknown"
+        self.stages: Dict[str, float] = {}
+        # perf_counter() when each non-cumulative stage ended, for tracing
+        self.stage_ends: Dict[str, float] = {}
+        self.chunks = 0
+        self.bytes = 0
+        self._last: Optional[float] = None
+        self._gaps: Optional[Histogram] = None
+        self._trace_marks: Dict[str, float] = {}
+        self._finished = False
+
+    def stage(self, name: str, seconds: float) -> None:
+        self.stages[name] = seconds
+        self.stage_ends[name] = time.perf_counter()
+
+    def mark_once(self, name: str) -> None:
+        """Record ``name`` as time since request start, first call only"""
+        if name not in self.stages:
+            self.stages[name] = time.perf_counter() - self.started
+
+    def trace(self, event_name: str, info) -> None:
+        """httpcore ``trace`` extension callback for connect and TTFB timing"""
+        now = time.perf_counter()
+        marks = self._trace_marks
+        if event_name == "connection.connect_tcp.started":
+            marks["connect"] = now
+        elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            if "connect" in marks:
+                self.stages["upstream_connect"] = now - marks["connect"]
+                self.stage_ends["upstream_connect"] = now
+        elif event_name.endswith("send_request_headers.started"):
+            marks["request"] = now
+        elif event_name.endswith("receive_response_headers.complete"):
+            if "request" in marks:
+                self.stages["upstream_ttfb"] = now - marks["request"]
+                self.stage_ends["upstream_ttfb"] = now
+
+    def on_chunk(self, nbytes: int) -> None:
+        """Hot path: called once per streamed chunk"""
+        now = time.perf_counter()
+        last = self._last
+        if last is not None:
+            gaps = self._gaps
+            if gaps is None:
+                gaps = self._gaps = self.registry.histogram(
+                    "chat_inter_token_seconds", "Gap between streamed chunks", model=self.model)
+            gaps.observe(now - last)
+        self._last = now
+        self.chunks += 1
+        self.bytes += nbytes
+
+    def finish(self, outcome: str = "ok") -> None:
+        if self._finished:
+            return
+        self._finished = True
+        self.stages.setdefault("total", time.perf_counter() - self.started)
+        registry = self.registry
+        for name, seconds in self.stages.items():
+            registry.histogram(
+                "chat_stage_seconds", "Streaming request stage latency", model=self.model, stage=name,
+            ).observe(seconds)
+        registry.counter("chat_streams_total", "Finished streaming requests", model=self.model, outcome=outcome).inc()
+        registry.counter("chat_stream_chunks_total", "Streamed chunks", model=self.model).inc(self.chunks)
+        registry.counter("chat_stream_bytes_total", "Streamed response bytes", model=self.model).inc(self.bytes)
+
+
+class RequestTimingMiddleware:
+    """Pure ASGI middleware stamping the request arrival time
+
+    Unlike BaseHTTPMiddleware it does not wrap the response stream, so it
+    adds no per-chunk cost.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["received_at"] = time.perf_counter()
+        await self.app(scope, receive, send)
@@ -1,6 +1,6 @@
 ﻿# -*- coding: utf-8 -*-
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 
 class Message(BaseModel):
@@ -22,10 +22,58 @@ class ChatStreamRequest(BaseModel):
     presencePenalty: Optional[float] = 0.0
     stop: Optional[List[str]] = None
     thinkingMode: Optional[bool] = False  # Enable thinking mode
+    timeoutMs: Optional[int] = None  # Caller's remaining time budget
+    priority: Optional[Literal["interactive", "background", "bulk"]] = "interactive"  # Scheduling class, see services/chat/scheduler.py
+    # Compare mode: stream these models side by side instead of ``model``
+    compareModels: Optional[List[str]] = None
+    compareStopAfter: Optional[int] = None  # Stop the other models once this many have finished
     
 
 
+class ChunkError(BaseModel):
+    """流式错误详情（错误类别、是否可重试、提供方）"""
+    errorClass: str
+    retryable: bool
+    provider: str
+    message: str
+
+
 class StreamChunk(BaseModel):
     """流式响应数据块（与前端/Go 对齐）"""
     content: str
     finished: bool
+    error: Optional[ChunkError] = None  # Only set on error chunks
+    # Compare mode only: the model this chunk belongs to; the model's last chunk
+    # has modelDone and its time to first token
+    model: Optional[str] = None
+    modelDone: Optional[bool] = None
+    ttftMs: Optional[float] = None
+
+
+class ChatBatchRequest(BaseModel):
+    """批量请求：多个相互独立的对话请求"""
+    requests: List[ChatStreamRequest]
+    cancelOnError: Optional[bool] = False  # Cancel the rest once one request fails
+
+
+class BatchResult(BaseModel):
+    """批量请求中单个请求的完整结果（按完成顺序返回）"""
+    index: int  # Position in ChatBatchRequest.requests
+    content: str
+    error: Optional[ChunkError] = None  # Only set on failed or cancelled requests
+
+
+class BatchSummary(BaseModel):
+    """批量请求的最后一条记录"""
+    done: bool = True
+    succeeded: int
+    failed: int
+    cancelled: int
+
+
+class ChatJobRequest(BaseModel):
+    """异步任务：后台运行一次对话，客户端轮询或通过 webhook 获取结果"""
+    request: ChatStreamRequest
+    priority: Literal["high", "normal", "low"] = "normal"
+    notBefore: Optional[float] = None  # Unix time before which the job does not start
+    webhookUrl: Optional[str] = None  # Receives the final job status as a JSON POST (https, public host)
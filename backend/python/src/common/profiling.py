@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""In-process CPU sampling and allocation tracking for live workers.
+
+The CPU sampler is a background thread that snapshots every thread's stack
+with ``sys._current_frames()`` at a fixed interval. A signal-based sampler
+would only ever see the main thread, while streaming requests run on the
+threadpool, so sampling from a thread is the one that shows the pipeline.
+Output is collapsed-stack text ("frame;frame;frame count" per line), the
+input format of flamegraph.pl and speedscope.
+
+``sys._current_frames()`` also returns threads that are only waiting: idle
+threadpool and admission workers, the log listener, the trace exporter,
+the event loop in ``select`` and streams blocked on an upstream read. By
+default a thread whose innermost Python frame is one of IDLE_FRAMES is left
+out, so the profile shows where CPU time goes. ``include_idle`` keeps them,
+which makes it a wall-clock profile of every thread.
+
+Allocation tracking wraps ``tracemalloc``: a baseline snapshot is taken at
+the start of the window and the top allocation sites are diffed against it
+at the end.
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+
+# Innermost frames of threads blocked in C (lock, queue, selector or socket waits)
+IDLE_FRAMES = frozenset({
+    "threading.py:wait",
+    "threading.py:_wait_for_tstate_lock",
+    "queue.py:get",
+    "handlers.py:dequeue",
+    "thread.py:_worker",
+    "selectors.py:select",
+    "runners.py:run",
+    "sync.py:read",
+    "ssl.py:read",
+    "ssl.py:recv_into",
+    "profiling.py:sample_cpu",
+})
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class StackSampler:
+    """Samples all thread stacks at ``interval`` seconds into collapsed stacks"""
+
+    def __init__(self, interval: float = 0.005, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample_once(self, own_id: int, names: Dict[int, str]) -> None:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            if not self.include_idle and _frame_label(frame) in IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, f"thread-{thread_id}"))
+            self.samples[";".join(reversed(stack))] += 1
+        self.sample_count += 1
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.is_set():
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            self._sample_once(own_id, names)
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        """Collapsed-stack text, most frequent stacks first"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def sample_cpu(seconds: float, interval: float = 0.005, include_idle: bool = False) -> StackSampler:
+    """Run a sampler for ``seconds`` (blocking) and return it"""
+    sampler = StackSampler(interval, include_idle)
+    sampler.start()
+    try:
+        time.sleep(seconds)
+    finally:
+        sampler.stop()
+    return sampler
+
+
+def track_allocations(seconds: float, limit: int = 25, frames: int = 10) -> List[Dict[str, Any]]:
+    """Diff allocation sites over a ``seconds`` window (blocking)
+
+    Returns the ``limit`` sites whose allocated size grew the most, as
+    JSON-ready dicts. tracemalloc is stopped again unless it was already
+    running before the call.
+    """
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start(frames)
+    try:
+        baseline = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        current = tracemalloc.take_snapshot()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+    stats = current.filter_traces(ignore).compare_to(baseline.filter_traces(ignore), "traceback")
+    top = []
+    for stat in stats[:limit]:
+        top.append({
+            "sizeDiffKb": round(stat.size_diff / 1024, 2),
+            "sizeKb": round(stat.size / 1024, 2),
+            "countDiff": stat.count_diff,
+            "count": stat.count,
+            "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+        })
+    return top
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""Counters and token buckets shared by all workers of one server.
+
+server.py creates a ``multiprocessing.shared_memory`` segment before
+uvicorn starts its workers and passes the segment name to them in
+SHARED_STATE_NAME. Each worker attaches to it, so limits such as the hedge
+budget and provider quotas hold for the whole server rather than being
+split N ways, without an external store.
+
+The segment is a fixed table of slots found by open addressing on a stable
+64-bit hash of the key. A slot holds a value and a timestamp (both
+doubles); counters use the value, token buckets use it as the token count
+and the timestamp as the last refill. Updates hold a thread lock plus an
+``fcntl`` lock on a file next to the segment. Without SHARED_STATE_NAME
+(single process, tests, platforms without ``fcntl``) the same table lives
+in a private bytearray.
+"""
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process state, each worker keeps its own
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# key hash, value, timestamp; a zero hash marks an empty slot
+_SLOT = struct.Struct("<Qdd")
+
+
+def _key_hash(key: str) -> int:
+    # hash() is randomized per process, every worker must agree on the slot
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+
+def _lock_path(name: str) -> str:
+    return os.path.join(tempfile.gettempdir(), f"{name}.lock")
+
+
+class SharedStateFull(RuntimeError):
+    """No free slot left for a new key (raise SHARED_STATE_SLOTS)"""
+
+
+class SharedState:
+    """Fixed-size key -> (value, timestamp) table in a memory buffer"""
+
+    def __init__(self, slots: int = 4096, shm: Optional[shared_memory.SharedMemory] = None,
+                 lock_file: Optional[str] = None):
+        self.slots = slots
+        self._shm = shm
+        self._buf = shm.buf if shm is not None else bytearray(slots * _SLOT.size)
+        self._lock = threading.Lock()
+        self._lock_fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o600) if lock_file else None
+
+    @property
+    def name(self) -> Optional[str]:
+        return self._shm.name if self._shm is not None else None
+
+    @classmethod
+    def create(cls, name: str, slots: int = 4096) -> "SharedState":
+        """New zeroed segment; the caller unlinks it on shutdown"""
+        shm = shared_memory.SharedMemory(name=name, create=True, size=slots * _SLOT.size)
+        return cls(slots, shm, _lock_path(name))
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedState":
+        """Segment created by the server process"""
+        # Workers are spawned from the server process and share its resource
+        # tracker, so attaching does not hand the segment to a tracker that
+        # would unlink it when one worker exits
+        shm = shared_memory.SharedMemory(name=name)
+        return cls(shm.size // _SLOT.size, shm, _lock_path(name))
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if self._lock_fd is None:
+                yield
+                return
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _slot(self, key: str, create: bool) -> Optional[int]:
+        """Byte offset of the slot for ``key``; call with the lock held"""
+        h = _key_hash(key)
+        start = h % self.slots
+        for i in range(self.slots):
+            offset = (start + i) % self.slots * _SLOT.size
+            stored = _SLOT.unpack_from(self._buf, offset)[0]
+            if stored == h:
+                return offset
+            if stored == 0:
+                if not create:
+                    return None
+                _SLOT.pack_into(self._buf, offset, h, 0.0, 0.0)
+                return offset
+        if create:
+            raise SharedStateFull(f"No free shared state slot for {key!r}")
+        return None
+
+    def get(self, key: str) -> float:
+        with self._locked():
+            offset = self._slot(key, create=False)
+            return 0.0 if offset is None else _SLOT.unpack_from(self._buf, offset)[1]
+
+    def add(self, key: str, amount: float = 1.0, limit: Optional[float] = None) -> float:
+        """Add to a counter, capped at ``limit``; returns the new value"""
+        with self._locked():
+            offset = self._slot(key, create=True)
+            h, value, _ = _SLOT.unpack_from(self._buf, offset)
+            value += amount
+            if limit is not None:
+                value = min(limit, value)
+            _SLOT.pack_into(self._buf, offset, h, value, time.time())
+            return value
+
+    def try_take(self, key: str, amount: float = 1.0) -> bool:
+        """Subtract ``amount`` from a counter if it holds at least that much"""
+        with self._locked():
+            offset = self._slot(key, create=False)
+            if offset is None:
+                return False
+            h, value, updated = _SLOT.unpack_from(self._buf, offset)
+            if value < amount:
+                return False
+            _SLOT.pack_into(self._buf, offset, h, value - amount, updated)
+            return True
+
+    def take_token(self, key: str, rate: float, burst: float, amount: float = 1.0) -> bool:
+        """Token bucket refilled at ``rate`` per second up to ``burst``; starts full"""
+        now = time.time()
+        with self._locked():
+            h = _key_hash(key)
+            offset = self._slot(key, create=False)
+            if offset is None:
+                offset = self._slot(key, create=True)
+                tokens = burst
+            else:
+                _, tokens, updated = _SLOT.unpack_from(self._buf, offset)
+                tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            ok = tokens >= amount
+            if ok:
+                tokens -= amount
+            _SLOT.pack_into(self._buf, offset, h, tokens, now)
+            return ok
+
+    def close(self) -> None:
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        if self._shm is not None:
+            self._buf = None
+            self._shm.close()
+
+    def unlink(self) -> None:
+        """Close and remove the segment and its lock file (server process only)"""
+        name = self.name
+        if self._buf is None and self._lock_fd is None:
+            # Already removed, e.g. by a signal handler
+            return
+        self.close()
+        if self._shm is not None:
+            self._shm.unlink()
+            try:
+                os.remove(_lock_path(name))
+            except OSError:
+                pass
+
+
+def create_shared_state(slots: int) -> Optional[SharedState]:
+    """Segment for the workers of this server, or None where it is unsupported"""
+    if fcntl is None:
+        logger.info("Shared state: fcntl unavailable, workers keep their own limits")
+        return None
+    return SharedState.create(f"aaanynotes-{os.getpid()}", slots)
+
+
+_state: Optional[SharedState] = None
+_state_lock = threading.Lock()
+
+
+def get_shared_state() -> SharedState:
+    """The server's shared segment when SHARED_STATE_NAME is set, else a private table"""
+    global _state
+    if _state is None:
+        with _state_lock:
+            if _state is None:
+                from config.app_settings import settings
+                state = None
+                if settings.shared_state_name and fcntl is not None:
+                    try:
+                        state = SharedState.attach(settings.shared_state_name)
+                    except OSError as e:
+                        logger.warning("Shared state %s unavailable, using per-process limits: %s",
+                                       settings.shared_state_name, e)
+                _state = state or SharedState(settings.shared_state_slots)
+    return _state
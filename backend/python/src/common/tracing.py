@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""Lightweight W3C trace-context tracing with batched OTLP export.
+
+The gateway sends a ``traceparent`` header; its sampled flag is the head
+sampling decision, and requests arriving without one are sampled at
+``TRACE_SAMPLE_RATE``. Unsampled requests get a shared no-op span, so the
+streaming path pays one attribute check.
+
+Stage spans (model resolution, upstream connect/TTFB, first token,
+stream completion) are reconstructed from the request's StreamTimings when
+the stream finishes, so spans cost nothing while tokens are flowing.
+Finished spans are queued and exported in batches by a background thread,
+via OTLP/HTTP JSON (``OTLP_ENDPOINT``) and/or a JSON-lines file
+(``TRACE_FILE``) for offline use.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Stage name in StreamTimings -> span name
+STAGE_SPANS = {
+    "body_parse": "request.body_parse",
+    "model_resolution": "model.resolution",
+    "create_model": "model.create",
+    "upstream_connect": "upstream.connect",
+    "upstream_ttfb": "upstream.ttfb",
+    "first_thinking_token": "stream.first_thinking_token",
+    "first_content_token": "stream.first_token",
+    "total": "stream.completion",
+}
+# Stages measured from request start rather than ending when recorded
+FROM_START_STAGES = ("first_thinking_token", "first_content_token", "total")
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_ERROR = 2
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace_id, parent_span_id, sampled) from a version-00 traceparent"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or parts[0] != "00" or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    trace_id, parent_id, flags = parts[1].lower(), parts[2].lower(), parts[3]
+    try:
+        int(trace_id, 16), int(parent_id, 16)
+        sampled = bool(int(flags, 16) & 0x01)
+    except ValueError:
+        return None
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, sampled
+
+
+def _random_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Span:
+    """A sampled span; times are epoch nanoseconds"""
+
+    sampled = True
+
+    def __init__(self, tracer: "Tracer", name: str, trace_id: str, parent_id: Optional[str],
+                 start_ns: int, kind: int = SPAN_KIND_INTERNAL):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _random_id(8)
+        self.parent_id = parent_id
+        self.start_ns = start_ns
+        self.end_ns: Optional[int] = None
+        self.kind = kind
+        self.attributes: Dict[str, Any] = {}
+        self.error = False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    def child(self, name: str, start_ns: int, end_ns: int, **attributes) -> "Span":
+        span = Span(self.tracer, name, self.trace_id, self.span_id, start_ns)
+        for key, value in attributes.items():
+            span.set_attribute(key, value)
+        span.end(end_ns)
+        return span
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        if self.end_ns is None:
+            self.end_ns = end_ns or time.time_ns()
+            self.tracer.processor.submit(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(k, v) for k, v in self.attributes.items()],
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.error:
+            span["status"] = {"code": STATUS_ERROR}
+        return span
+
+
+class _NoopSpan:
+    """Returned for unsampled requests; every operation is a no-op"""
+
+    sampled = False
+    trace_id = span_id = parent_id = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class OTLPHttpExporter:
+    """POSTs OTLP/HTTP JSON to ``{endpoint}/v1/traces``"""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        endpoint = endpoint.rstrip("/")
+        self.url = endpoint if endpoint.endswith("/v1/traces") else f"{endpoint}/v1/traces"
+        self.client = httpx.Client(timeout=timeout)
+
+    def export(self, payload: Dict[str, Any]) -> None:
+        self.client.post(self.url, json=payload).raise_for_status()
+
+
+class FileExporter:
+    """Appends one OTLP JSON batch per line to ``path``"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, payload: Dict[str, Any]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+
+
+class BatchSpanProcessor:
+    """Queues finished spans and exports them in batches from a background thread
+
+    The queue is bounded; when the exporters fall behind, the oldest spans
+    are dropped rather than growing memory.
+    """
+
+    def __init__(self, exporters: List[Any], service_name: str, batch_size: int = 512,
+                 flush_interval: float = 5.0, max_queue: int = 8192):
+        self.exporters = exporters
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: deque = deque(maxlen=max_queue)
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, span: Span) -> None:
+        self._queue.append(span)
+        if self._thread is None:
+            self._start()
+        if len(self._queue) >= self.batch_size:
+            self._wake.set()
+
+    def _start(self) -> None:
+        with _tracer_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def payload(self, spans: List[Span]) -> Dict[str, Any]:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{"scope": {"name": "aaanynotes.tracing"}, "spans": [s.to_otlp() for s in spans]}],
+        }]}
+
+    def flush(self) -> None:
+        while self._queue:
+            batch = []
+            while self._queue and len(batch) < self.batch_size:
+                batch.append(self._queue.popleft())
+            payload = self.payload(batch)
+            for exporter in self.exporters:
+                try:
+                    exporter.export(payload)
+                except Exception as e:
+                    logger.warning("Tracing: %s export failed: %s", type(exporter).__name__, e)
+
+    def shutdown(self) -> None:
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush()
+
+
+class Tracer:
+    """Head-sampling tracer; disabled when there are no exporters"""
+
+    def __init__(self, sample_rate: float, processor: Optional[BatchSpanProcessor]):
+        self.sample_rate = sample_rate
+        self.processor = processor
+
+    @classmethod
+    def from_settings(cls, settings) -> "Tracer":
+        exporters = []
+        if settings.otlp_endpoint:
+            exporters.append(OTLPHttpExporter(settings.otlp_endpoint))
+        if settings.trace_file:
+            exporters.append(FileExporter(settings.trace_file))
+        processor = None
+        if exporters:
+            processor = BatchSpanProcessor(
+                exporters, settings.trace_service_name,
+                batch_size=settings.trace_batch_size, flush_interval=settings.trace_flush_interval_seconds,
+            )
+        return cls(settings.trace_sample_rate, processor)
+
+    def start_request_span(self, name: str, traceparent: Optional[str], started: Optional[float] = None):
+        """Root span of a request, or NOOP_SPAN when not sampled
+
+        ``started`` is the perf_counter() time the request arrived.
+        """
+        if self.processor is None:
+            return NOOP_SPAN
+        parent = parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = None, None
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled:
+            return NOOP_SPAN
+        now_ns, now = time.time_ns(), time.perf_counter()
+        start_ns = now_ns - int((now - started) * 1e9) if started is not None else now_ns
+        span = Span(self, name, trace_id or _random_id(16), parent_id, start_ns, kind=SPAN_KIND_SERVER)
+        # Anchor for converting perf_counter() stage times to epoch time
+        span.perf_anchor = (now, now_ns)
+        return span
+
+    def shutdown(self) -> None:
+        if self.processor is not None:
+            self.processor.shutdown()
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """Process-wide tracer built lazily from settings"""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                from config.app_settings import settings
+                _tracer = Tracer.from_settings(settings)
+    return _tracer
+
+
+def shutdown_tracer() -> None:
+    if _tracer is not None:
+        _tracer.shutdown()
+
+
+def _model_attributes(model_id: str) -> Dict[str, Any]:
+    from config.app_settings import settings
+    from config.model_mappings import get_model_type
+    model = settings.get_model_by_id(model_id)
+    return {
+        "llm.model": model_id,
+        "llm.provider": getattr(model, "type", None) or get_model_type(model_id),
+        # Identifies the key pool without exposing the key
+        "llm.api_key_env": getattr(model, "env_key", None),
+    }
+
+
+def record_stream_spans(span, timings, outcome: str = "ok") -> None:
+    """Turn a finished request's stage timings into child spans and end ``span``"""
+    if not span.sampled:
+        return
+    anchor_perf, anchor_ns = span.perf_anchor
+
+    def epoch_ns(perf: float) -> int:
+        return anchor_ns + int((perf - anchor_perf) * 1e9)
+
+    attributes = _model_attributes(timings.model)
+    for key, value in attributes.items():
+        span.set_attribute(key, value)
+    span.set_attribute("stream.chunks", timings.chunks)
+    span.set_attribute("stream.bytes", timings.bytes)
+    span.set_attribute("stream.outcome", outcome)
+    span.error = outcome != "ok"
+
+    for stage, seconds in timings.stages.items():
+        name = STAGE_SPANS.get(stage)
+        if name is None:
+            continue
+        if stage in FROM_START_STAGES:
+            start, end = timings.started, timings.started + seconds
+        else:
+            end = timings.stage_ends.get(stage, timings.started + seconds)
+            start = end - seconds
+        span.child(name, epoch_ns(start), epoch_ns(end), **attributes)
+    span.end(epoch_ns(timings.started + timings.stages.get("total", time.perf_counter() - timings.started)))
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""Token usage accounting per model, API key and user.
+
+Providers report ``usage`` on the final stream chunk (requested with
+``stream_options.include_usage``); when it is missing the counts are
+estimated locally from the prompt and streamed text and the request is
+flagged as estimated.
+
+Each finished request appends one tuple to a deque, a lock-free operation,
+and nothing else happens on the streaming path. A background thread drains
+the deque every USAGE_FLUSH_INTERVAL_SECONDS, folds it into hourly
+per-(model, key, user) rows and upserts them in one transaction into SQLite
+or Postgres, chosen by DB_TYPE. Rows that fail to write are kept and
+retried on the next flush.
+"""
+import logging
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# CJK ideographs, kana, hangul and full-width forms: roughly one token each
+_CJK = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+GROUP_COLUMNS = {"model": "model", "key": "api_key_env", "user": "user_id"}
+
+# (bucket, model, api_key_env, user_id) -> [requests, prompt, completion, estimated]
+UsageKey = Tuple[int, str, str, str]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: one per CJK character, one per four other characters"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+class RequestUsage:
+    """Token counts for one streaming request"""
+
+    def __init__(self, user: str = "anonymous", messages=None, aggregator: Optional["UsageAggregator"] = None):
+        self.user = user or "anonymous"
+        self.model = "unknown"
+        self.messages = messages or []
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.aggregator = aggregator
+        self._completion: List[str] = []
+        self._finished = False
+        self._attempt: Optional["RequestUsage"] = None
+
+    def add_completion(self, text: str) -> None:
+        """Keep streamed text in case the provider does not report usage"""
+        if text:
+            self._completion.append(text)
+
+    def report(self, usage: Dict[str, Any]) -> None:
+        """Provider-reported ``usage`` object"""
+        self.prompt_tokens = usage.get("prompt_tokens", self.prompt_tokens)
+        self.completion_tokens = usage.get("completion_tokens", self.completion_tokens)
+
+    @property
+    def estimated(self) -> bool:
+        return self.prompt_tokens is None or self.completion_tokens is None
+
+    def discard(self) -> None:
+        """Record nothing for this request, its tokens are counted elsewhere"""
+        self._finished = True
+
+    def follow(self, attempt: "RequestUsage") -> None:
+        """Record ``attempt`` instead when finished (the hedged attempt that answered)"""
+        self._attempt = attempt
+
+    def finish(self) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        if self._attempt is not None:
+            self._attempt.finish()
+            return
+        estimated = self.estimated
+        prompt = self.prompt_tokens
+        if prompt is None:
+            prompt = sum(estimate_tokens(m.content if hasattr(m, "content") else m.get("content", ""))
+                         for m in self.messages)
+        completion = self.completion_tokens
+        if completion is None:
+            completion = estimate_tokens("".join(self._completion))
+        (self.aggregator or get_usage_aggregator()).record(self.model, self.user, prompt, completion, estimated)
+
+
+class SQLiteUsageStore:
+    """Hourly usage rows in a local SQLite file"""
+
+    placeholder = "?"
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def connect(self):
+        return sqlite3.connect(self.path)
+
+    def setup(self) -> None:
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_usage ("
+                "bucket BIGINT NOT NULL, model TEXT NOT NULL, api_key_env TEXT NOT NULL, user_id TEXT NOT NULL, "
+                "requests BIGINT NOT NULL, prompt_tokens BIGINT NOT NULL, completion_tokens BIGINT NOT NULL, "
+                "estimated_requests BIGINT NOT NULL, PRIMARY KEY (bucket, model, api_key_env, user_id))"
+            )
+
+    @contextmanager
+    def _connection(self):
+        conn = self.connect()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def upsert(self, rows: Dict[UsageKey, List[int]]) -> None:
+        p = self.placeholder
+        sql = (
+            "INSERT INTO token_usage (bucket, model, api_key_env, user_id, requests, prompt_tokens, "
+            f"completion_tokens, estimated_requests) VALUES ({', '.join([p] * 8)}) "
+            "ON CONFLICT (bucket, model, api_key_env, user_id) DO UPDATE SET "
+            "requests = token_usage.requests + excluded.requests, "
+            "prompt_tokens = token_usage.prompt_tokens + excluded.prompt_tokens, "
+            "completion_tokens = token_usage.completion_tokens + excluded.completion_tokens, "
+            "estimated_requests = token_usage.estimated_requests + excluded.estimated_requests"
+        )
+        with self._connection() as conn:
+            conn.cursor().executemany(sql, [key + tuple(values) for key, values in rows.items()])
+
+    def query(self, since: int, group_by: str) -> List[tuple]:
+        """(group value, model, requests, prompt, completion, estimated) rows"""
+        column = GROUP_COLUMNS[group_by]
+        sql = (
+            f"SELECT {column}, model, SUM(requests), SUM(prompt_tokens), SUM(completion_tokens), "
+            f"SUM(estimated_requests) FROM token_usage WHERE bucket >= {self.placeholder} "
+            f"GROUP BY {column}, model"
+        )
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, (since,))
+            return cursor.fetchall()
+
+
+class PostgresUsageStore(SQLiteUsageStore):
+    """Same schema in Postgres (requires the optional ``psycopg`` package)"""
+
+    placeholder = "%s"
+
+    def __init__(self, host: str, port: str, dbname: str, user: str, password: str):
+        self.params = {"host": host, "port": port, "dbname": dbname, "user": user, "password": password}
+
+    def connect(self):
+        try:
+            import psycopg
+        except ImportError as e:
+            raise RuntimeError("DB_TYPE=postgres requires the psycopg package") from e
+        return psycopg.connect(**self.params)
+
+
+def create_store(settings) -> SQLiteUsageStore:
+    if settings.db_type == "postgres":
+        return PostgresUsageStore(settings.db_host, settings.db_port, settings.db_name,
+                                  settings.db_user, settings.db_password)
+    return SQLiteUsageStore(settings.db_sqlite_path)
+
+
+class UsageAggregator:
+    """Collects finished requests and flushes hourly aggregates in batches"""
+
+    def __init__(self, store: SQLiteUsageStore, flush_interval: float = 10.0, bucket_seconds: int = 3600):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.bucket_seconds = bucket_seconds
+        self._pending: deque = deque()
+        # Aggregated rows not yet written; only touched under _flush_lock
+        self._unflushed: Dict[UsageKey, List[int]] = {}
+        self._flush_lock = threading.Lock()
+        self._key_envs: Dict[str, str] = {}
+        self._ready = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, model: str, user: str, prompt_tokens: int, completion_tokens: int, estimated: bool) -> None:
+        """Called once per finished request; deque.append needs no lock"""
+        self._pending.append((time.time(), model, user, prompt_tokens, completion_tokens, estimated))
+
+    def _key_env(self, model: str) -> str:
+        env = self._key_envs.get(model)
+        if env is None:
+            from config.app_settings import settings
+            config = settings.get_model_by_id(model)
+            env = self._key_envs[model] = (config.env_key if config else "") or "unknown"
+        return env
+
+    def _drain(self) -> None:
+        pending = self._pending
+        rows = self._unflushed
+        while pending:
+            at, model, user, prompt, completion, estimated = pending.popleft()
+            key = (int(at // self.bucket_seconds) * self.bucket_seconds, model, self._key_env(model), user)
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = [0, 0, 0, 0]
+            row[0] += 1
+            row[1] += prompt
+            row[2] += completion
+            row[3] += int(estimated)
+
+    def flush(self) -> bool:
+        """Write everything recorded so far; False if the store write failed"""
+        with self._flush_lock:
+            self._drain()
+            if not self._unflushed:
+                return True
+            try:
+                if not self._ready:
+                    self.store.setup()
+                    self._ready = True
+                self.store.upsert(self._unflushed)
+            except Exception as e:
+                logger.warning("Usage: flush of %d rows failed, will retry: %s", len(self._unflushed), e)
+                return False
+            self._unflushed = {}
+            return True
+
+    def summary(self, since: int = 0, group_by: str = "model") -> List[Dict[str, Any]]:
+        """Totals per ``group_by`` value, with cost where models.json has pricing"""
+        from config.app_settings import settings
+        since = since // self.bucket_seconds * self.bucket_seconds
+        self.flush()
+        with self._flush_lock:
+            if not self._ready:
+                self.store.setup()
+                self._ready = True
+        totals: Dict[str, Dict[str, Any]] = {}
+        for group, model, requests, prompt, completion, estimated in self.store.query(since, group_by):
+            entry = totals.setdefault(group, {
+                group_by: group, "requests": 0, "promptTokens": 0, "completionTokens": 0,
+                "estimatedRequests": 0, "cost": None,
+            })
+            entry["requests"] += requests
+            entry["promptTokens"] += prompt
+            entry["completionTokens"] += completion
+            entry["estimatedRequests"] += estimated
+            config = settings.get_model_by_id(model)
+            pricing = getattr(config, "pricing", None)
+            if pricing:
+                cost = (prompt * pricing.get("promptPer1M", 0) + completion * pricing.get("completionPer1M", 0)) / 1e6
+                entry["cost"] = round((entry["cost"] or 0) + cost, 6)
+        return sorted(totals.values(), key=lambda e: e["promptTokens"] + e["completionTokens"], reverse=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="usage-flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+
+
+_aggregator: Optional[UsageAggregator] = None
+_aggregator_lock = threading.Lock()
+
+
+def get_usage_aggregator() -> UsageAggregator:
+    """Process-wide aggregator built lazily from settings"""
+    global _aggregator
+    if _aggregator is None:
+        with _aggregator_lock:
+            if _aggregator is None:
+                from config.app_settings import settings
+                _aggregator = UsageAggregator(create_store(settings), settings.usage_flush_interval_seconds)
+    return _aggregator
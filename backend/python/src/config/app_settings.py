@@ -1,12 +1,22 @@
 # -*- coding: utf-8 -*-
 import os
 import json
+import logging
 from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 
 
-# Load environment variables from shared .env file
-load_dotenv(dotenv_path="../../../config/.env")
+from config.snapshot import load_json
+
+# Shared .env and models.json at the repository root, independent of the working directory
+CONFIG_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "..", "config"))
+ENV_FILE = os.path.join(CONFIG_DIR, ".env")
+MODELS_FILE = os.path.join(CONFIG_DIR, "models.json")
+
+# Load environment variables from shared .env file (the only load at startup)
+load_dotenv(dotenv_path=ENV_FILE)
+
+logger = logging.getLogger(__name__)
 
 
 class ModelConfig:
@@ -23,6 +33,8 @@ class ModelConfig:
         self.max_tokens = data.get("maxTokens", 4096)
         self.temperature = data.get("temperature", {"min": 0.0, "max": 2.0, "default": 0.7})
         self.features = data.get("features", [])
+        # Optional {"promptPer1M": ..., "completionPer1M": ...} for /api/usage cost
+        self.pricing = data.get("pricing", {})
 
     def get_features_by_id(self, model_id: str) -> Optional[List[str]]:
         """Get specific feature by ID"""
@@ -36,6 +48,7 @@ class ModelsConfig:
         self.default_model = data.get("defaultModel", "")
         self.model_types = data.get("modelTypes", {})
         self.categories = data.get("categories", {})
+        self.routing_groups = data.get("routingGroups", {})
     
     @staticmethod
     def get_modelconfig_by_id(self, model_id: str) -> Optional[ModelConfig]:
@@ -91,12 +104,66 @@ class AppSettings:
         # Load environment-based settings
         self.debug = data.get('debug', os.getenv("DEBUG", "false").lower() == "true")
         self.log_level = data.get('log_level', os.getenv("LOG_LEVEL", "INFO"))
+        # Fraction of requests that emit debug traces when LOG_LEVEL=DEBUG
+        self.log_debug_sample_rate = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
         self.default_model = data.get('default_model', os.getenv("DEFAULT_MODEL", "glm"))
         
         # Service settings
         self.port_go = os.getenv("PORT_GO", "8080")
         self.port_python = os.getenv("PORT_PYTHON", "8000")
+        # Unix domain socket for a gateway on the same host; when set, server.py
+        # listens here instead of on PORT_PYTHON
+        self.socket_python = os.getenv("SOCKET_PYTHON", "")
+        # Permission bits (octal) and owning group of the socket file
+        self.socket_python_mode = int(os.getenv("SOCKET_PYTHON_MODE", "660"), 8)
+        self.socket_python_group = os.getenv("SOCKET_PYTHON_GROUP", "")
         self.frontend_url = os.getenv("FRONTEND_URL", "http://localhost:5173")
+
+        # Server launch settings (see server.py)
+        # "development": single worker with auto-reload; "production": multi-worker
+        self.server_mode = os.getenv("SERVER_MODE", "development" if self.debug else "production").lower()
+        self.server_host = os.getenv("SERVER_HOST", "0.0.0.0")
+        # 0 sizes the worker count to the available cores
+        self.server_workers = int(os.getenv("SERVER_WORKERS", "0"))
+        self.server_backlog = int(os.getenv("SERVER_BACKLOG", "2048"))
+        # Longer than the gateway's idle timeout, so the gateway closes idle connections first
+        self.server_keepalive_seconds = int(os.getenv("SERVER_KEEPALIVE_SECONDS", "75"))
+        # How long in-flight streams may run after SIGTERM before they are ended
+        self.shutdown_drain_seconds = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "30"))
+        # Shared memory segment for limits shared by all workers; set by server.py
+        self.shared_state_name = os.getenv("SHARED_STATE_NAME", "")
+        self.shared_state_slots = int(os.getenv("SHARED_STATE_SLOTS", "4096"))
+        # How often each worker publishes its metrics for /metrics to sum across workers
+        self.metrics_publish_interval_seconds = float(os.getenv("METRICS_PUBLISH_INTERVAL_SECONDS", "5"))
+        # WebSocket chat (/api/chat/ws): concurrent streams per connection and
+        # chunk frames a stream may send before the client grants more credit
+        self.ws_max_streams = int(os.getenv("WS_MAX_STREAMS", "64"))
+        self.ws_initial_credits = int(os.getenv("WS_INITIAL_CREDITS", "64"))
+        # gRPC ChatService (backend/proto/chat.proto) next to the HTTP API; 0 disables it
+        self.grpc_port = int(os.getenv("GRPC_PORT", "0"))
+        self.grpc_max_streams = int(os.getenv("GRPC_MAX_STREAMS", "1000"))
+        # Batch chat (/api/chat/batch): requests per batch and concurrent requests
+        # per provider within a batch, with per-provider overrides ("kimi=4,glm=16")
+        self.batch_max_requests = int(os.getenv("BATCH_MAX_REQUESTS", "500"))
+        self.batch_concurrency = int(os.getenv("BATCH_CONCURRENCY", "8"))
+        self.batch_provider_concurrency = {
+            provider: int(limit)
+            for provider, limit in self._parse_model_map(os.getenv("BATCH_PROVIDER_CONCURRENCY", "")).items()
+        }
+        # Async chat jobs (/api/jobs, stored in DB_SQLITE_PATH): jobs run at once per
+        # process (0 = this process only accepts jobs) and per tenant across processes
+        self.job_workers = int(os.getenv("JOB_WORKERS", "4"))
+        self.job_tenant_max_running = int(os.getenv("JOB_TENANT_MAX_RUNNING", "2"))
+        self.job_poll_interval_seconds = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1"))
+        self.job_progress_interval_seconds = float(os.getenv("JOB_PROGRESS_INTERVAL_SECONDS", "1"))
+        # Running jobs of a worker silent this long are queued again
+        self.job_stale_seconds = float(os.getenv("JOB_STALE_SECONDS", "60"))
+        self.job_retention_hours = float(os.getenv("JOB_RETENTION_HOURS", "72"))
+        # Webhook hosts trusted as they are (http allowed, no address check), e.g. internal
+        # receivers; other webhooks must be https to public addresses
+        self.job_webhook_allowed_hosts = [
+            host.strip().lower() for host in os.getenv("JOB_WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()
+        ]
         
         # Database settings
         self.db_host = os.getenv("DB_HOST", "localhost")
@@ -104,36 +171,112 @@ class AppSettings:
         self.db_name = os.getenv("DB_NAME", "aanynotes")
         self.db_user = os.getenv("DB_USER", "")
         self.db_password = os.getenv("DB_PASSWORD", "")
+        # "sqlite" (DB_SQLITE_PATH) or "postgres" (DB_HOST/DB_PORT/..., needs psycopg)
+        self.db_type = os.getenv("DB_TYPE", "sqlite").lower()
+        self.db_sqlite_path = os.getenv("DB_SQLITE_PATH", "aanynotes.db")
+        # Token usage aggregates are written in batches at this interval
+        self.usage_flush_interval_seconds = float(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", "10"))
         
         # Security settings
         self.jwt_secret = os.getenv("JWT_SECRET", "")
         self.encryption_key = os.getenv("ENCRYPTION_KEY", "")
+        # Admin diagnostics endpoints are disabled unless a token is set
+        self.admin_token = os.getenv("ADMIN_TOKEN", "")
+        self.profile_max_seconds = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
         
         # External service URLs
         self.python_api_url = os.getenv("PYTHON_API_URL", "http://localhost:8000")
         self.go_api_url = os.getenv("GO_API_URL", "http://localhost:8080")
-        
+
+        # Hedged request settings (opt-in)
+        self.hedge_enabled = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+        self.hedge_delay_percentile = float(os.getenv("HEDGE_DELAY_PERCENTILE", "95"))
+        self.hedge_min_delay_ms = float(os.getenv("HEDGE_MIN_DELAY_MS", "500"))
+        self.hedge_max_delay_ms = float(os.getenv("HEDGE_MAX_DELAY_MS", "5000"))
+        self.hedge_budget_percent = float(os.getenv("HEDGE_BUDGET_PERCENT", "5"))
+        self.hedge_alternate_models = self._parse_model_map(os.getenv("HEDGE_ALTERNATE_MODELS", ""))
+
+        # Health scoreboard and routing settings
+        self.breaker_failure_threshold = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+        self.breaker_cooldown_seconds = float(os.getenv("BREAKER_COOLDOWN_SECONDS", "30"))
+        self.routing_probe_interval_seconds = float(os.getenv("ROUTING_PROBE_INTERVAL_SECONDS", "0"))
+        # Requests per minute allowed per provider API key, e.g. "MOONSHOT_API_KEY=60"
+        self.provider_rate_limits = {
+            env: float(limit) for env, limit in self._parse_model_map(os.getenv("PROVIDER_RATE_LIMITS", "")).items()
+        }
+
+        # Priority scheduling (services/chat/scheduler.py): upstream streams per provider
+        # and worker shared out between interactive, background and bulk requests; 0 disables
+        self.scheduler_capacity = int(os.getenv("SCHEDULER_CAPACITY", "0"))
+        self.scheduler_provider_capacity = {
+            provider: int(limit)
+            for provider, limit in self._parse_model_map(os.getenv("SCHEDULER_PROVIDER_CAPACITY", "")).items()
+        }
+        self.scheduler_weights = {
+            name: float(weight)
+            for name, weight in self._parse_model_map(
+                os.getenv("SCHEDULER_WEIGHTS", "interactive=8,background=2,bulk=1")).items()
+        }
+        self.scheduler_interactive_reserved_percent = float(os.getenv("SCHEDULER_INTERACTIVE_RESERVED_PERCENT", "25"))
+        # Threads for requests waiting in the scheduler queue, apart from the request threads
+        self.scheduler_admission_threads = int(os.getenv("SCHEDULER_ADMISSION_THREADS", "256"))
+        # Compare mode (compareModels, services/chat/compare.py): models per request
+        self.compare_max_models = int(os.getenv("COMPARE_MAX_MODELS", "4"))
+
+        # Upstream connection pool, DNS cache and warm-up settings
+        self.upstream_max_connections = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+        self.upstream_max_keepalive = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+        self.upstream_keepalive_expiry_seconds = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY_SECONDS", "90"))
+        self.upstream_warm_min_idle = int(os.getenv("UPSTREAM_WARM_MIN_IDLE", "2"))
+        self.upstream_warm_interval_seconds = float(os.getenv("UPSTREAM_WARM_INTERVAL_SECONDS", "30"))
+        self.dns_cache_ttl_seconds = float(os.getenv("DNS_CACHE_TTL_SECONDS", "300"))
+
+        # Request deadline budgets (callers may send X-Request-Timeout-Ms or timeoutMs)
+        self.request_default_timeout_seconds = float(os.getenv("REQUEST_DEFAULT_TIMEOUT_SECONDS", "300"))
+        self.upstream_connect_timeout_seconds = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT_SECONDS", "10"))
+        self.upstream_first_token_timeout_seconds = float(os.getenv("UPSTREAM_FIRST_TOKEN_TIMEOUT_SECONDS", "60"))
+
+        # Provider stream record/replay (see models/cassette.py)
+        self.cassette_record_dir = os.getenv("CASSETTE_RECORD_DIR", "")
+        self.cassette_replay = os.getenv("CASSETTE_REPLAY", "")
+        self.cassette_replay_speed = float(os.getenv("CASSETTE_REPLAY_SPEED", "1.0"))
+
+        # Distributed tracing (disabled unless an exporter is configured)
+        self.trace_sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "0.0"))
+        self.otlp_endpoint = os.getenv("OTLP_ENDPOINT", "")
+        self.trace_file = os.getenv("TRACE_FILE", "")
+        self.trace_service_name = os.getenv("TRACE_SERVICE_NAME", "aaanynotes-python")
+        self.trace_batch_size = int(os.getenv("TRACE_BATCH_SIZE", "512"))
+        self.trace_flush_interval_seconds = float(os.getenv("TRACE_FLUSH_INTERVAL_SECONDS", "5"))
+
         # Load models configuration
         self.models_config = self._load_models_config()
     
+    @staticmethod
+    def _parse_model_map(value: str) -> Dict[str, str]:
+        """Parse 'model-a=model-b,model-c=model-d' into a dict"""
+        mapping = {}
+        for pair in value.split(","):
+            if "=" in pair:
+                source, target = pair.split("=", 1)
+                if source.strip() and target.strip():
+                    mapping[source.strip()] = target.strip()
+        return mapping
+
     def _load_models_config(self) -> Optional[ModelsConfig]:
         """Load models configuration from models.json file"""
         try:
-            models_config_path = os.path.join(
-                os.path.dirname(__file__), 
-                "../../../../config/models.json"
-            )
-            with open(models_config_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return ModelsConfig(data)
+            models_config_path = MODELS_FILE
+            # Parsed once per file version, shared across workers via a snapshot
+            return ModelsConfig(load_json(models_config_path))
         except FileNotFoundError:
-            print(f"Warning: models.json not found at {models_config_path}, using default config")
+            logger.warning("models.json not found at %s, using default config", models_config_path)
             return self._create_default_models_config()
         except json.JSONDecodeError as e:
-            print(f"Error parsing models.json: {e}, using default config")
+            logger.error("Error parsing models.json: %s, using default config", e)
             return self._create_default_models_config()
         except Exception as e:
-            print(f"Error loading models.json: {e}, using default config")
+            logger.error("Error loading models.json: %s, using default config", e)
             return self._create_default_models_config()
     
     def _create_default_models_config(self) -> ModelsConfig:
@@ -273,7 +416,7 @@ class AppSettings:
         """Reload configuration from files"""
         try:
             # Reload environment variables
-            load_dotenv(dotenv_path="../../../config/.env", override=True)
+            load_dotenv(dotenv_path=ENV_FILE, override=True)
             
             # Reload models configuration
             self.models_config = self._load_models_config()
@@ -285,7 +428,7 @@ class AppSettings:
             
             return True
         except Exception as e:
-            print(f"Error reloading configuration: {e}")
+            logger.error("Error reloading configuration: %s", e)
             return False
     
     def get_config_summary(self) -> Dict[str, Any]:
@@ -300,10 +443,11 @@ class AppSettings:
             "total_models": len(self.models_config.models),
             "port_go": self.port_go,
             "port_python": self.port_python,
+            "socket_python": self.socket_python,
             "frontend_url": self.frontend_url,
             "models_config_loaded": self.models_config is not None
         }
 
 
 # Global settings instance
-settings = AppSettings(debug=True)  # Enable debug mode for development
+settings = AppSettings()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Queue-based logging setup.
+
+Request threads only merge the message and enqueue the record; a single
+listener thread formats the log line and writes to the console, so a slow
+stdout pipe never blocks request handling. Log calls use ``%s`` arguments
+so nothing is formatted for records below ``LOG_LEVEL``.
+
+Debug tracing of individual requests is sampled: with ``LOG_LEVEL=DEBUG``
+only ``LOG_DEBUG_SAMPLE_RATE`` of requests emit per-request and per-chunk
+debug records; at any other level the check is a single level comparison.
+"""
+import atexit
+import copy
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[QueueListener] = None
+_sample_rate = 1.0
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting the log line to the listener thread
+
+    ``msg % args`` is still merged in the calling thread, as the stock
+    handler does, since the arguments may change or go away before the
+    listener gets to the record. Timestamp, level and exception text are
+    formatted by the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_handler: Optional[DeferredQueueHandler] = None
+
+
+def setup_logging(level: Optional[str] = None, sample_rate: Optional[float] = None) -> QueueListener:
+    """Route root logging through a queue drained by a background thread
+
+    Safe to call more than once; later calls only update level and sample rate.
+    """
+    global _listener, _handler, _sample_rate
+    if level is None or sample_rate is None:
+        from config.app_settings import settings
+        level = level or settings.log_level
+        sample_rate = settings.log_debug_sample_rate if sample_rate is None else sample_rate
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    _sample_rate = max(0.0, min(1.0, sample_rate))
+
+    if _listener is None:
+        log_queue = queue.SimpleQueue()
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter(LOG_FORMAT))
+        # Handlers added by others (e.g. test log capture) stay in place
+        if _handler is not None:
+            root.removeHandler(_handler)
+        _handler = DeferredQueueHandler(log_queue)
+        root.addHandler(_handler)
+        _listener = QueueListener(log_queue, console, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def trace_request(logger: logging.Logger) -> bool:
+    """Whether this request should emit debug traces (sampled)"""
+    return logger.isEnabledFor(logging.DEBUG) and (_sample_rate >= 1.0 or random.random() < _sample_rate)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Cached loading of JSON config files, keyed by file mtime and size.
+
+Parsed data is memoised per process, so reloading an unchanged file is a
+single stat. Across processes a marshal snapshot (the format .pyc files
+use) is kept in ``__pycache__`` next to this module; every worker after the
+first reads that instead of re-parsing the JSON. A stale or unreadable
+snapshot is ignored and rewritten.
+"""
+import json
+import logging
+import marshal
+import os
+import zlib
+from typing import Any, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__")
+
+# path -> ((mtime_ns, size), data)
+_memo: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+
+
+def _snapshot_path(path: str) -> str:
+    name = os.path.basename(path)
+    # Different files with the same name get different snapshots
+    return os.path.join(SNAPSHOT_DIR, f"{name}.{zlib.crc32(os.path.abspath(path).encode()):08x}.snapshot")
+
+
+def load_json(path: str) -> Any:
+    """Parsed contents of ``path``, from cache when the file is unchanged
+
+    Raises the same errors as ``open`` and ``json.load`` when the file must
+    be parsed.
+    """
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _memo.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    snapshot = _snapshot_path(path)
+    data = None
+    try:
+        with open(snapshot, "rb") as f:
+            stored_key, stored_data = marshal.load(f)
+        if tuple(stored_key) == key:
+            data = stored_data
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    if data is None:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        try:
+            os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+            tmp = f"{snapshot}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                marshal.dump((key, data), f)
+            os.replace(tmp, snapshot)
+        except OSError as e:
+            logger.debug("Config snapshot for %s not written: %s", path, e)
+
+    _memo[path] = (key, data)
+    return data
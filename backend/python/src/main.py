@@ -9,53 +9,47 @@ This service handles:
 - Multi-model configuration management
 - API key validation and security
 """
+import asyncio
 import os
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from api.endpoints.chat_endpoint import router as chat_router
+from api.endpoints.chat_ws_endpoint import router as chat_ws_router
+from api.endpoints.chat_batch_endpoint import router as chat_batch_router
+from api.endpoints.admin_endpoint import router as admin_router
+from api.endpoints.usage_endpoint import router as usage_router
+from api.endpoints.jobs_endpoint import router as jobs_router
 from config.app_settings import settings
+from config.logging_config import setup_logging
+from common.drain import get_stream_drain
+from common.metrics import RequestTimingMiddleware, WorkerMetrics, metrics
+from common.tracing import shutdown_tracer
+from common.usage import get_usage_aggregator
+from services.chat.jobs import get_job_queue
+from services.chat.prober import HealthProber
+from models.http_pool import close_clients
+from models.warmup import ConnectionWarmer
 
-# Load environment variables from shared .env file
-from dotenv import load_dotenv
-load_dotenv(dotenv_path="../../config/.env")
-
-# Configure logging to show all debug messages
-logging.basicConfig(
-    level=logging.DEBUG,  # Force DEBUG level for troubleshooting
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),  # Console output
-    ]
-)
+# Queue-based logging at LOG_LEVEL; records are written by a background thread
+setup_logging()
 logger = logging.getLogger(__name__)
 
-# FastAPI application
-app = FastAPI(
-    title="AAAnyNotes AI Service",
-    description="AI model integration service for AAAnyNotes platform",
-    version="1.0.0",
-    docs_url="/docs",
-    redoc_url="/redoc"
-)
+# Background prober for idle models (disabled when ROUTING_PROBE_INTERVAL_SECONDS=0)
+health_prober = HealthProber(settings.routing_probe_interval_seconds)
 
-# CORS middleware configuration
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # In production, specify allowed origins
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+# Upstream connection warmer (disabled when UPSTREAM_WARM_MIN_IDLE=0)
+connection_warmer = ConnectionWarmer(
+    settings.upstream_warm_min_idle,
+    settings.upstream_warm_interval_seconds,
 )
 
-# Include API routers
-print(f"DEBUG: Including chat router with prefix /api")
-app.include_router(chat_router, prefix="/api")
-
-print(f"DEBUG: Registered routes: {[route.path for route in app.routes]}")
+# Snapshots summed across workers for /metrics (None with a single process)
+worker_metrics = WorkerMetrics.from_settings(settings)
 
-@app.on_event("startup")
-async def startup_event():
+def log_startup():
     """Validate configuration and log startup information"""
     logger.info("Starting AAAnyNotes AI Service...")
     # Log configuration status
@@ -63,8 +57,7 @@ async def startup_event():
         available_models = settings.get_available_models()
         configured_models = [model for model, available in available_models.items() if available]
         
-        print(f"DEBUG: Available models: {available_models}")
-        print(f"DEBUG: Configured models: {configured_models}")
+        logger.debug("Available models: %s", available_models)
         
         if not configured_models:
             logger.warning("No AI models configured. Please set API keys in config/.env file.")
@@ -77,26 +70,101 @@ async def startup_event():
         # Log debug mode
         if settings.debug:
             logger.info("Debug mode enabled")
-            print("DEBUG: Debug mode is enabled")
         
         # Log service URLs
         logger.info("Service URLs:")
-        logger.info("   - API Documentation: http://localhost:8000/docs")
-        logger.info("   - ReDoc Documentation: http://localhost:8000/redoc")
-        logger.info("   - Health Check: http://localhost:8000/health")
+        logger.info("   - API Documentation: http://localhost:%s/docs", settings.port_python)
+        logger.info("   - ReDoc Documentation: http://localhost:%s/redoc", settings.port_python)
+        logger.info("   - Health Check: http://localhost:%s/health", settings.port_python)
         
         logger.info("AAAnyNotes AI Service started successfully!")
-        print("DEBUG: Service startup completed successfully")
         
     except Exception as e:
-        print(f"DEBUG: Startup error: {str(e)}")
-        import traceback
-        print(f"DEBUG: Startup traceback: {traceback.format_exc()}")
+        logger.exception("Startup error: %s", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background services; on shutdown drain streams, then release resources"""
+    log_startup()
+    drain = get_stream_drain()
+    drain.install_signal_handlers()
+    # Background prober feeding the model scoreboard
+    health_prober.start()
+    # Pre-warm pooled connections to every configured provider
+    await connection_warmer.start()
+    # Periodic token usage flush
+    get_usage_aggregator().start()
+    if worker_metrics is not None:
+        worker_metrics.start()
+    # Background chat jobs (disabled when JOB_WORKERS=0)
+    await get_job_queue().start()
+    # gRPC ChatService for the gateway (disabled when GRPC_PORT=0)
+    grpc_server = None
+    if settings.grpc_port:
+        from rpc.server import start_grpc_server
+        grpc_server = await start_grpc_server(settings.server_host, settings.grpc_port, settings.grpc_max_streams)
+    yield
+
+    # The server has stopped accepting connections; let in-flight streams finish
+    remaining = await drain.wait()
+    if remaining:
+        logger.warning("Shutdown: %d streams still running after the drain deadline", remaining)
+    if grpc_server is not None:
+        # Calls still open after the drain are cancelled, which closes their upstream streams
+        await grpc_server.stop(grace=1.0)
+    # Jobs still running are queued again for the next worker
+    await get_job_queue().stop()
+    await health_prober.stop()
+    # Stop keep-alive maintenance and close pooled upstream clients
+    await connection_warmer.stop()
+    close_clients()
+    # Write the remaining token usage aggregates and queued spans
+    get_usage_aggregator().stop()
+    shutdown_tracer()
+    if worker_metrics is not None:
+        worker_metrics.stop()
+
+# FastAPI application
+app = FastAPI(
+    title="AAAnyNotes AI Service",
+    description="AI model integration service for AAAnyNotes platform",
+    version="1.0.0",
+    docs_url="/docs",
+    redoc_url="/redoc",
+    lifespan=lifespan,
+)
+
+# CORS middleware configuration
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # In production, specify allowed origins
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Outermost middleware: stamps request arrival for stage latency metrics
+app.add_middleware(RequestTimingMiddleware)
+
+# Include API routers
+app.include_router(chat_router, prefix="/api")
+app.include_router(chat_ws_router, prefix="/api")
+app.include_router(chat_batch_router, prefix="/api")
+app.include_router(admin_router, prefix="/api")
+app.include_router(usage_router, prefix="/api")
+app.include_router(jobs_router, prefix="/api")
+
+if logger.isEnabledFor(logging.DEBUG):
+    logger.debug("Registered routes: %s", [route.path for route in app.routes])
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    print("DEBUG: Health check endpoint called")
+    """Health check endpoint (503 while draining, so load balancers stop routing here)"""
+    if get_stream_drain().draining:
+        return JSONResponse(
+            {"status": "draining", "service": "AAAnyNotes AI Service", "activeStreams": get_stream_drain().active},
+            status_code=503,
+        )
     try:
         available_models = settings.get_available_models()
         configured_models = [model for model, available in available_models.items() if available]
@@ -110,39 +178,33 @@ async def health_check():
             "debug_mode": settings.debug
         }
     except Exception as e:
-        print(f"ERROR: Health check failed: {str(e)}")
+        logger.error("Health check failed: %s", e)
         return {
             "status": "unhealthy",
             "service": "AAAnyNotes AI Service",
             "error": str(e)
         }
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Streaming latency metrics in Prometheus text format, summed over all workers"""
+    text = await asyncio.to_thread(worker_metrics.render) if worker_metrics is not None else metrics.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     """Root endpoint"""
-    print("DEBUG: Root endpoint called")
     return {
         "message": "AAAnyNotes AI Service",
         "docs": "/docs",
         "health": "/health",
+        "metrics": "/metrics",
+        "usage": "/api/usage",
         "version": "1.0.0"
     }
 
-print("DEBUG: FastAPI app configured and ready to run")
-
 if __name__ == "__main__":
-    import uvicorn
-    
-    logger.info("Starting uvicorn server...")
-    print("DEBUG: About to start uvicorn server")
-    print(f"DEBUG: Host: 0.0.0.0, Port: 8000")
-    print(f"DEBUG: Debug mode: {settings.debug}")
-    
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=settings.debug,
-        # log_level="debug",  # Force debug logging
-        # access_log=True  # Enable access logs
-    )
+    # Same as `python server.py`: SERVER_MODE (or DEBUG) picks development or production
+    from server import main
+
+    main()
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""Record and replay raw provider streams.
+
+A cassette is a gzip-compressed JSON-lines file. The first line holds the
+request (with credentials redacted) and the response status and headers;
+every following line is one raw body chunk as it came off the socket,
+with its arrival time relative to the start of the request:
+
+    {"version": 1, "request": {...}, "response": {"status": 200, "headers": [...]}}
+    {"t": 0.412, "b": "<base64 bytes>"}
+
+Set ``CASSETTE_RECORD_DIR`` to record every upstream call made through the
+pooled clients, or ``CASSETTE_REPLAY`` (a glob, comma-separated globs
+allowed) to serve upstream calls from cassettes instead of the network,
+at ``CASSETTE_REPLAY_SPEED`` times the recorded pace (0 = no delays).
+"""
+import base64
+import glob
+import gzip
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_VERSION = 1
+REDACTED = "REDACTED"
+SENSITIVE_HEADERS = ("authorization", "proxy-authorization", "cookie", "set-cookie", "x-api-key", "api-key")
+
+
+def redact_headers(headers: httpx.Headers) -> List[List[str]]:
+    return [
+        [name, REDACTED if name.lower() in SENSITIVE_HEADERS else value]
+        for name, value in headers.multi_items()
+    ]
+
+
+def _request_model(body: str) -> Optional[str]:
+    try:
+        return json.loads(body).get("model")
+    except (ValueError, AttributeError):
+        return None
+
+
+class Cassette:
+    """One recorded request/response exchange with chunk arrival times"""
+
+    def __init__(self, request: Dict[str, Any], response: Dict[str, Any], events: List[Tuple[float, bytes]]):
+        self.request = request
+        self.response = response
+        self.events = events
+
+    @property
+    def model(self) -> Optional[str]:
+        return _request_model(self.request.get("body", ""))
+
+    @property
+    def duration(self) -> float:
+        return self.events[-1][0] if self.events else 0.0
+
+    def body(self) -> bytes:
+        return b"".join(chunk for _, chunk in self.events)
+
+    def save(self, path: str) -> None:
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            header = {"version": CASSETTE_VERSION, "request": self.request, "response": self.response}
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            for offset, chunk in self.events:
+                f.write(json.dumps({"t": round(offset, 6), "b": base64.b64encode(chunk).decode("ascii")}) + "\n")
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != CASSETTE_VERSION:
+                raise ValueError(f"Unsupported cassette version in {path}: {header.get('version')}")
+            events = []
+            for line in f:
+                if line.strip():
+                    event = json.loads(line)
+                    events.append((event["t"], base64.b64decode(event["b"])))
+        return cls(header["request"], header["response"], events)
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, started: float, on_close):
+        self._stream = stream
+        self._started = started
+        self._on_close = on_close
+        self.events: List[Tuple[float, bytes]] = []
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._stream:
+            self.events.append((time.perf_counter() - self._started, chunk))
+            yield chunk
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._on_close(self.events)
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """Wraps a transport and writes a cassette for every exchange"""
+
+    def __init__(self, transport: httpx.BaseTransport, directory: str):
+        self._transport = transport
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path_for(self, request: Dict[str, Any]) -> str:
+        name = _request_model(request["body"]) or httpx.URL(request["url"]).host
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        return os.path.join(self.directory, f"{stamp}-{name}-{uuid.uuid4().hex[:8]}.jsonl.gz")
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "POST":
+            # Connection warm-up pings are not worth a cassette
+            return self._transport.handle_request(request)
+        started = time.perf_counter()
+        recorded_request = {
+            "method": request.method,
+            "url": str(request.url),
+            "headers": redact_headers(request.headers),
+            "body": request.read().decode("utf-8", errors="replace"),
+        }
+        response = self._transport.handle_request(request)
+        recorded_response = {"status": response.status_code, "headers": redact_headers(response.headers)}
+
+        def save(events):
+            try:
+                Cassette(recorded_request, recorded_response, events).save(self._path_for(recorded_request))
+            except OSError as e:
+                logger.warning("RecordingTransport: failed to write cassette: %s", e)
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response.stream, started, save),
+            extensions=response.extensions,
+        )
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, events: List[Tuple[float, bytes]], speed: float):
+        self._events = events
+        self._speed = speed
+
+    def __iter__(self) -> Iterator[bytes]:
+        started = time.perf_counter()
+        for offset, chunk in self._events:
+            if self._speed > 0:
+                wait = offset / self._speed - (time.perf_counter() - started)
+                if wait > 0:
+                    time.sleep(wait)
+            yield chunk
+
+
+class ReplayTransport(httpx.BaseTransport):
+    """Serves requests from cassettes at original, accelerated or max speed
+
+    ``speed`` 1.0 reproduces the recorded timing, 10.0 plays ten times
+    faster and 0 disables delays. Requests are answered from cassettes
+    recorded for the same model when there are any, round-robin otherwise.
+    """
+
+    def __init__(self, cassettes: List[Cassette], speed: float = 1.0):
+        if not cassettes:
+            raise ValueError("ReplayTransport needs at least one cassette")
+        self.speed = speed
+        self._all = itertools.cycle(cassettes)
+        self._by_model: Dict[str, Iterator[Cassette]] = {}
+        grouped: Dict[str, List[Cassette]] = {}
+        for cassette in cassettes:
+            if cassette.model:
+                grouped.setdefault(cassette.model, []).append(cassette)
+        for model, group in grouped.items():
+            self._by_model[model] = itertools.cycle(group)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_glob(cls, patterns: str, speed: float = 1.0) -> "ReplayTransport":
+        paths = sorted(path for pattern in patterns.split(",") if pattern.strip() for path in glob.glob(pattern.strip()))
+        return cls([Cassette.load(path) for path in paths], speed)
+
+    def _pick(self, request: httpx.Request) -> Cassette:
+        model = _request_model(request.read().decode("utf-8", errors="replace"))
+        with self._lock:
+            return next(self._by_model.get(model) or self._all)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "POST":
+            return httpx.Response(200)
+        cassette = self._pick(request)
+        return httpx.Response(
+            status_code=cassette.response["status"],
+            headers=[(name, value) for name, value in cassette.response["headers"]],
+            stream=_ReplayStream(cassette.events, self.speed),
+        )
@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 import asyncio
+import json
 from typing import Generator, AsyncGenerator
-import httpx
 from config import GLMConfig, KimiConfig, get_model_config
 from common.models import StreamChunk
+from common.deadline import Deadline, DeadlineExceeded
+from common.errors import error_chunk
+from models.http_pool import get_client
+from models.sse import DONE, first_choice, parse_data_line
 
 
 class GLMModel:
@@ -22,18 +26,8 @@ class GLMModel:
             "Content-Type": "application/json"
         }
         
-    def stream_chat(self, messages, temperature=0.7, max_tokens=2000, **kwargs):
-        """Stream chat completion from GLM API
-        
-        Args:
-            messages: List of message dictionaries with 'sender' and 'content'
-            temperature: Sampling temperature
-            max_tokens: Maximum tokens to generate
-            **kwargs: Additional parameters
-            
-        Yields:
-            StreamChunk objects
-        """
+    def build_payload(self, messages, temperature=0.7, max_tokens=2000):
+        """Build the chat/completions request body"""
         # Convert to GLM API format - handle both Message objects and dictionaries
         api_messages = []
         for msg in messages:
@@ -58,56 +52,79 @@ class GLMModel:
             "messages": api_messages,
             "temperature": temperature,
             "max_tokens": max_tokens,
-            "stream": True
+            "stream": True,
+            # Ask for token usage on the final chunk
+            "stream_options": {"include_usage": True}
         }
+        return payload
+        
+    def stream_chat(self, messages, temperature=0.7, max_tokens=2000, **kwargs):
+        """Stream chat completion from GLM API
+        
+        Args:
+            messages: List of message dictionaries with 'sender' and 'content'
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens to generate
+            **kwargs: Additional parameters
+            
+        Yields:
+            StreamChunk objects
+        """
+        payload = self.build_payload(messages, temperature, max_tokens)
+        
+        deadline = kwargs.get("deadline") or Deadline.from_request()
+        timings = kwargs.get("timings")
+        usage = kwargs.get("usage")
         
         try:
-            with httpx.stream(
+            deadline.check("GLM upstream connect")
+            with get_client(self.base_url).stream(
                 "POST",
                 f"{self.base_url}chat/completions",
                 headers=self.headers,
                 json=payload,
-                timeout=60.0
+                timeout=deadline.httpx_timeout(),
+                extensions={"trace": timings.trace} if timings else None
             ) as response:
                 response.raise_for_status()
                 
                 for line in response.iter_lines():
-                    if line.startswith("data: "):
-                        data_str = line[6:]  # Remove "data: " prefix
-                        if data_str.strip() == "[DONE]":
-                            break
-                            
-                        try:
-                            import json
-                            data = json.loads(data_str)
-                            
-                            if "choices" in data and len(data["choices"]) > 0:
-                                choice = data["choices"][0]
-                                if "delta" in choice and "content" in choice["delta"]:
-                                    content = choice["delta"]["content"]
-                                    finished = choice.get("finish_reason") is not None
-                                    
-                                    yield StreamChunk(
-                                        content=content,
-                                        finished=finished
-                                    )
-                        except json.JSONDecodeError:
-                            continue
+                    if deadline.expired():
+                        raise DeadlineExceeded("Request deadline exceeded while streaming from GLM")
+                    try:
+                        data = parse_data_line(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if data is None:
+                        continue
+                    if data is DONE:
+                        break
+                    if usage and data.get("usage"):
+                        usage.report(data["usage"])
+
+                    choice = first_choice(data)
+                    if choice and "delta" in choice and "content" in choice["delta"]:
+                        content = choice["delta"]["content"]
+                        finished = choice.get("finish_reason") is not None
+                        if timings:
+                            timings.mark_once("first_content_token")
+                        if usage:
+                            usage.add_completion(content)
+
+                        yield StreamChunk(
+                            content=content,
+                            finished=finished
+                        )
                             
         except Exception as e:
-            yield StreamChunk(
-                content=f"GLM API error: {str(e)}",
-                finished=True
-            )
+            yield error_chunk(e, "glm", content=f"GLM API error: {str(e)}")
 
 
-def create_model(model_type: str, model_id=None):
-    """Factory function to create model instances"""
-    if model_type.lower() == "glm":
-        return GLMModel(model_id=model_id)
-    elif model_type.lower() == "kimi":
-        from .kimi_model import KimiModel
-        return KimiModel(model_id=model_id)
-    else:
-        raise ValueError(f"Unsupported model type: {model_type}")
+# Moved to models.registry; kept here for callers that still import them from glm_model
+from models.registry import SUPPORTED_MODEL_TYPES  # noqa: E402,F401
 
+
+def create_model(model_type: str, model_id=None):
+    """Factory function to create model instances (see models.registry)"""
+    from models.registry import create_model
+    return create_model(model_type, model_id)
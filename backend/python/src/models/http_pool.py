@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""Shared pooled HTTP clients for upstream providers.
+
+One ``httpx.Client`` is kept per upstream origin so TCP and TLS
+connections are reused across requests. Host names are resolved through a
+process-wide DNS cache with a TTL, so neither new connections nor the
+connection warmer pay a resolver round trip on every connect.
+
+Responses opened while an UpstreamCancel is bound to the thread are
+attached to it, so another thread can abort a read that is blocked
+waiting for the provider, or a timer can abort it at the request deadline.
+"""
+import heapq
+import itertools
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpcore
+import httpx
+
+from config.app_settings import settings
+
+
+class DNSCache:
+    """Thread-safe getaddrinfo cache with a TTL
+
+    Stale entries are served when a refresh fails, so a flaky resolver does
+    not take an otherwise healthy provider down.
+    """
+
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host: str, port: int, refresh: bool = False) -> List[str]:
+        """Return the IP addresses for ``host``, resolving when expired"""
+        key = (host, port)
+        entry = self._entries.get(key)
+        if entry is not None and not refresh and entry[0] > time.monotonic():
+            return entry[1]
+        try:
+            infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except OSError:
+            if entry is not None:
+                return entry[1]
+            raise
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class CachingDNSBackend(httpcore.SyncBackend):
+    """httpcore network backend that connects through the DNS cache"""
+
+    def __init__(self, cache: DNSCache):
+        self.cache = cache
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        try:
+            addresses = self.cache.resolve(host, port)
+        except OSError:
+            addresses = [host]
+        last_error = None
+        for address in addresses:
+            try:
+                # TLS still uses the original host name for SNI and verification
+                return super().connect_tcp(address, port, timeout, local_address, socket_options)
+            except Exception as e:
+                last_error = e
+        raise last_error
+
+
+dns_cache = DNSCache(ttl=settings.dns_cache_ttl_seconds)
+
+
+@contextmanager
+def _httpx_errors():
+    """Raise httpcore errors as the httpx errors of the same name, as httpx does"""
+    try:
+        yield
+    except (httpcore.TimeoutException, httpcore.NetworkError, httpcore.ProtocolError, httpcore.ProxyError,
+            httpcore.UnsupportedProtocol) as e:
+        raise _httpx_error(e) from e
+
+
+def _httpx_error(error: Exception) -> httpx.TransportError:
+    for cls in type(error).__mro__:
+        mapped = getattr(httpx, cls.__name__, None)
+        if isinstance(mapped, type) and issubclass(mapped, httpx.TransportError):
+            return mapped(str(error))
+    return httpx.TransportError(str(error))
+
+
+class _ResponseStream(httpx.SyncByteStream):
+    """httpcore response body with its errors raised as httpx errors"""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def __iter__(self) -> Iterator[bytes]:
+        with _httpx_errors():
+            for part in self._stream:
+                yield part
+
+    def close(self) -> None:
+        if hasattr(self._stream, "close"):
+            self._stream.close()
+
+
+class PooledTransport(httpx.BaseTransport):
+    """httpx transport over an httpcore connection pool using CachingDNSBackend
+
+    httpx.HTTPTransport offers no way to choose the pool's network backend,
+    so the pool is built here through httpcore's public API.
+    """
+
+    def __init__(self, limits: httpx.Limits, network_backend: httpcore.NetworkBackend):
+        self.pool = httpcore.ConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            network_backend=network_backend,
+        )
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        url = request.url
+        core_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(scheme=url.raw_scheme, host=url.raw_host, port=url.port, target=url.raw_path),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions,
+        )
+        with _httpx_errors():
+            response = self.pool.handle_request(core_request)
+        return httpx.Response(
+            status_code=response.status,
+            headers=response.headers,
+            stream=_ResponseStream(response.stream),
+            extensions=response.extensions,
+        )
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+_bound = threading.local()
+
+
+def _shutdown(response: httpx.Response) -> None:
+    """Make a read blocked on ``response`` fail at once"""
+    stream = response.extensions.get("network_stream")
+    sock = stream.get_extra_info("socket") if stream is not None else None
+    if sock is None:
+        # Replayed cassettes have no connection to abort
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class _DetachingStream(httpx.SyncByteStream):
+    """Response body that leaves its UpstreamCancel before closing"""
+
+    def __init__(self, stream: httpx.SyncByteStream, cancel: "UpstreamCancel", response: httpx.Response):
+        self._stream = stream
+        self._cancel = cancel
+        self._response = response
+
+    def __iter__(self):
+        return iter(self._stream)
+
+    def close(self) -> None:
+        # Detached first: once closed, the connection may serve another request
+        self._cancel.detach(self._response)
+        self._stream.close()
+
+
+class UpstreamCancel:
+    """Aborts the upstream responses of one stream from another thread
+
+    ``call`` runs a step of the stream with the cancel bound to the calling
+    thread; responses the pooled clients open meanwhile are attached.
+    ``cancel`` shuts down the sockets of the attached responses that are
+    still open, so a read waiting for the first or next byte fails at once
+    instead of at the read timeout, and runs the callbacks registered with
+    ``on_cancel`` (nested attempts such as hedges). ``cancel_at`` schedules
+    the cancel for a deadline on a shared timer thread.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._responses: List[httpx.Response] = []
+        self._callbacks: List[Callable[[], None]] = []
+        self._timer: Optional[list] = None
+
+    def call(self, fn: Callable[..., Any], *args) -> Any:
+        previous = getattr(_bound, "cancel", None)
+        _bound.cancel = self
+        try:
+            return fn(*args)
+        finally:
+            _bound.cancel = previous
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def attach(self, response: httpx.Response) -> None:
+        with self._lock:
+            if not self.cancelled:
+                response.stream = _DetachingStream(response.stream, self, response)
+                self._responses.append(response)
+                return
+        _shutdown(response)
+
+    def detach(self, response: httpx.Response) -> None:
+        with self._lock:
+            if response in self._responses:
+                self._responses.remove(response)
+
+    def cancel_at(self, when: float) -> None:
+        """Cancel at ``time.monotonic()`` value ``when`` unless disarmed first"""
+        self._timer = _cancel_timer.schedule(when, self)
+
+    def disarm(self) -> None:
+        if self._timer is not None:
+            self._timer[0] = None
+            self._timer = None
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            # Under the lock, so no response is closed and reused meanwhile
+            for response in self._responses:
+                _shutdown(response)
+            self._responses.clear()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+class _CancelTimer:
+    """One daemon thread cancelling UpstreamCancels at their scheduled times
+
+    Entries are ``[cancel]`` lists; disarming clears the slot and the entry
+    is dropped when its time comes.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, list]] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, when: float, cancel: UpstreamCancel) -> list:
+        entry = [cancel]
+        with self._condition:
+            heapq.heappush(self._heap, (when, next(self._sequence), entry))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="upstream-deadlines", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return entry
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._condition.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                cancel = heapq.heappop(self._heap)[2][0]
+            if cancel is not None:
+                cancel.cancel()
+
+
+_cancel_timer = _CancelTimer()
+
+
+def current_cancel() -> Optional[UpstreamCancel]:
+    """The UpstreamCancel bound to this thread, if any"""
+    return getattr(_bound, "cancel", None)
+
+
+def _attach_response(response: httpx.Response) -> None:
+    cancel = current_cancel()
+    if cancel is not None:
+        cancel.attach(response)
+
+
+_clients: Dict[str, httpx.Client] = {}
+# Connection pool behind each pooled client, for idle_connections
+_pools: Dict[str, httpcore.ConnectionPool] = {}
+_clients_lock = threading.Lock()
+
+
+def origin_of(url: str) -> str:
+    """scheme://host[:port] of a URL, the key clients are pooled by"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _build_client(origin: str) -> httpx.Client:
+    if settings.cassette_replay:
+        from models.cassette import ReplayTransport
+        return httpx.Client(transport=ReplayTransport.from_glob(settings.cassette_replay, settings.cassette_replay_speed))
+
+    transport = PooledTransport(
+        httpx.Limits(
+            max_connections=settings.upstream_max_connections,
+            max_keepalive_connections=settings.upstream_max_keepalive,
+            keepalive_expiry=settings.upstream_keepalive_expiry_seconds,
+        ),
+        CachingDNSBackend(dns_cache),
+    )
+    _pools[origin] = transport.pool
+    hooks = {"response": [_attach_response]}
+    if settings.cassette_record_dir:
+        from models.cassette import RecordingTransport
+        return httpx.Client(transport=RecordingTransport(transport, settings.cassette_record_dir), event_hooks=hooks)
+    return httpx.Client(transport=transport, event_hooks=hooks)
+
+
+def get_client(url: str) -> httpx.Client:
+    """Shared pooled client for the origin of ``url``"""
+    key = origin_of(url)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = _build_client(key)
+    return client
+
+
+def pooled_origins() -> List[str]:
+    return list(_clients.keys())
+
+
+def close_clients() -> None:
+    """Close every pooled client, used on shutdown"""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        _pools.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+
+def idle_connections(url: str) -> Optional[int]:
+    """Number of idle pooled connections to the origin of ``url``"""
+    key = origin_of(url)
+    if key not in _clients:
+        return None
+    pool = _pools.get(key)
+    connections = pool.connections if pool is not None else []
+    return sum(1 for connection in connections if connection.is_idle())
@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
 import json
 import logging
-import httpx
 from common.models import StreamChunk
+from common.deadline import Deadline, DeadlineExceeded
+from common.errors import error_chunk
+from config import get_model_config
+from models.http_pool import get_client
+from models.sse import DONE, first_choice, parse_data_line
 from config.app_settings import settings
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class ContentType:
@@ -34,69 +36,86 @@ class KimiModel:
         
         # 安全获取 features
         features = getattr(self.model_config, "features", []) if self.model_config else []
-        logger.info(f"KimiModel: Loaded features for model {self.model_id}: {features}")
+        logger.debug("KimiModel: Loaded features for model %s: %s", self.model_id, features)
         self.is_thinking_model = "thinking" in features
         
-        self.base_url = "https://api.moonshot.cn/v1"
+        self.base_url = get_model_config("kimi").get_base_url()
         self.headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json; charset=utf-8",
             "Accept": "text/event-stream"
         }
     
+    def build_payload(self, messages, temperature, max_tokens, top_p, should_enable_reasoning):
+        """Build the chat/completions request body"""
+        # 2. 构建消息与Prompt
+        api_messages = []
+        
+        # 系统提示词处理
+        system_text = (
+            "You are Kimi, provided by Moonshot AI. "
+            "拒绝回答恐怖主义、种族歧视、色情、暴力问题。"
+        )
+        if should_enable_reasoning:
+            system_text += " (Thinking Mode Enabled)" # 可选：根据需要调整提示词
+
+        api_messages.append({"role": "system", "content": system_text})
+        
+        for msg in messages:
+            # 兼容对象属性访问和字典访问
+            sender = getattr(msg, 'sender', None) or msg.get('sender', 'user')
+            content = getattr(msg, 'content', None) or msg.get('content', '')
+            
+            if not content: continue
+            role = "user" if sender == "user" else "assistant"
+            api_messages.append({"role": role, "content": content})
+        # 3. 构建请求体
+        payload = {
+            "model": self.model_id,
+            "messages": api_messages,
+            "temperature": temperature,
+            "top_p": top_p,
+            "max_tokens": max_tokens,
+            "stream": True,
+            # 请求在最后一个数据块中返回token用量
+            "stream_options": {"include_usage": True}
+        }
+        
+        if should_enable_reasoning:
+            logger.debug("KimiModel: Enabling reasoning feature in payload")
+            payload["enable_reasoning"] = True
+        return payload
+
     def stream_chat(self, messages, temperature=0.3, max_tokens=20000, top_p=0.9, **kwargs):
         # 1. 核心判定逻辑
         thinking_mode = kwargs.get("thinkingMode", False)
         should_enable_reasoning = self.is_thinking_model and thinking_mode
+        deadline = kwargs.get("deadline") or Deadline.from_request()
+        timings = kwargs.get("timings")
+        usage = kwargs.get("usage")
         
-        logger.info(f"Kimi Req | Model: {self.model_id} | Thinking: {should_enable_reasoning}")
+        logger.debug("Kimi Req | Model: %s | Thinking: %s", self.model_id, should_enable_reasoning)
 
         try:
-            # 2. 构建消息与Prompt
-            api_messages = []
-            
-            # 系统提示词处理
-            system_text = (
-                "You are Kimi, provided by Moonshot AI. "
-                "拒绝回答恐怖主义、种族歧视、色情、暴力问题。"
-            )
-            if should_enable_reasoning:
-                system_text += " (Thinking Mode Enabled)" # 可选：根据需要调整提示词
-
-            api_messages.append({"role": "system", "content": system_text})
-            
-            for msg in messages:
-                # 兼容对象属性访问和字典访问
-                sender = getattr(msg, 'sender', None) or msg.get('sender', 'user')
-                content = getattr(msg, 'content', None) or msg.get('content', '')
-                
-                if not content: continue
-                role = "user" if sender == "user" else "assistant"
-                api_messages.append({"role": role, "content": content})
-            # 3. 构建请求体
-            payload = {
-                "model": self.model_id,
-                "messages": api_messages,
-                "temperature": temperature,
-                "top_p": top_p,
-                "max_tokens": max_tokens,
-                "stream": True
-            }
-            
-            if should_enable_reasoning:
-                logger.info("KimiModel: Enabling reasoning feature in payload")
-                payload["enable_reasoning"] = True
+            payload = self.build_payload(messages, temperature, max_tokens, top_p, should_enable_reasoning)
 
             # 4. 发起请求
-            with httpx.stream("POST", f"{self.base_url}/chat/completions", headers=self.headers, json=payload, timeout=300.0) as response:
+            deadline.check("Kimi upstream connect")
+            with get_client(self.base_url).stream("POST", f"{self.base_url}/chat/completions", headers=self.headers, json=payload, timeout=deadline.httpx_timeout(),
+                                            extensions={"trace": timings.trace} if timings else None) as response:
                 response.raise_for_status()
                 
                 for line in response.iter_lines():
-                    if not line or not line.startswith("data: "):
+                    if deadline.expired():
+                        raise DeadlineExceeded("Request deadline exceeded while streaming from Kimi")
+                    try:
+                        data = parse_data_line(line)
+                    except ValueError as e:
+                        logger.error("Stream Parse Error: %s", e)
                         continue
-                    
-                    data_str = line[6:].strip()
-                    if data_str == "[DONE]":
+                    if data is None:
+                        continue
+                    if data is DONE:
                         # 发送结束信号
                         yield StreamChunk(
                             content=wrap_chunk("", True, ContentType.CONTENT),
@@ -105,10 +124,14 @@ class KimiModel:
                         break
                     
                     try:
-                        data = json.loads(data_str)
-                        if not data.get("choices"): continue
+                        if usage and data.get("usage"):
+                            usage.report(data["usage"])
+                        choice = first_choice(data)
+                        if not choice: continue
                         
-                        choice = data["choices"][0]
+                        # Moonshot 将用量放在最后一个 choice 中
+                        if usage and choice.get("usage"):
+                            usage.report(choice["usage"])
                         delta = choice.get("delta", {})
                         finish_reason = choice.get("finish_reason")
                         
@@ -120,6 +143,10 @@ class KimiModel:
                             reasoning = delta.get("reasoning_content")
                             # 关键修复：使用 is not None，防止 strip() 吞掉换行符和空格
                             if reasoning is not None:
+                                if timings:
+                                    timings.mark_once("first_thinking_token")
+                                if usage:
+                                    usage.add_completion(reasoning)
                                 yield StreamChunk(
                                     content=wrap_chunk(reasoning, False, ContentType.THINKING),
                                     finished=False
@@ -129,6 +156,10 @@ class KimiModel:
                         content = delta.get("content")
                         # 关键修复：允许空字符串（有时作为占位符），防止格式丢失
                         if content is not None:
+                            if timings:
+                                timings.mark_once("first_content_token")
+                            if usage:
+                                usage.add_completion(content)
                             yield StreamChunk(
                                 content=wrap_chunk(content, is_finished, ContentType.CONTENT),
                                 finished=is_finished
@@ -141,13 +172,10 @@ class KimiModel:
                             )
                             
                     except Exception as e:
-                        logger.error(f"Stream Parse Error: {e}")
+                        logger.error("Stream Parse Error: %s", e)
                         continue
 
         except Exception as e:
             err_msg = f"Error: {str(e)}"
             logger.error(err_msg)
-            yield StreamChunk(
-                content=wrap_chunk(err_msg, True, ContentType.ERROR),
-                finished=True
-            )
\ No newline at end of file
+            yield error_chunk(e, "kimi", content=wrap_chunk(err_msg, True, ContentType.ERROR))
\ No newline at end of file
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Provider registry: model type -> implementing class, imported on first use.
+
+Provider modules are only loaded when a model of their type is created,
+so worker boot does not pay for providers that are never called.
+"""
+import importlib
+import threading
+from typing import Dict
+
+# Model type -> (module, class)
+PROVIDERS = {
+    "glm": ("models.glm_model", "GLMModel"),
+    "kimi": ("models.kimi_model", "KimiModel"),
+}
+
+# Model types that create_model can instantiate
+SUPPORTED_MODEL_TYPES = tuple(PROVIDERS)
+
+_classes: Dict[str, type] = {}
+_lock = threading.Lock()
+
+
+def provider_class(model_type: str) -> type:
+    """Class implementing ``model_type``, importing its module on first use"""
+    model_type = model_type.lower()
+    cls = _classes.get(model_type)
+    if cls is None:
+        if model_type not in PROVIDERS:
+            raise ValueError(f"Unsupported model type: {model_type}")
+        module_name, class_name = PROVIDERS[model_type]
+        with _lock:
+            cls = _classes[model_type] = getattr(importlib.import_module(module_name), class_name)
+    return cls
+
+
+def create_model(model_type: str, model_id=None):
+    """Factory function to create model instances"""
+    return provider_class(model_type)(model_id=model_id)
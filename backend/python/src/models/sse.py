@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""Per-line parsing of OpenAI-style chat completion SSE streams.
+
+Shared by the GLM and Kimi adapters; bench/micro times these functions as
+the per-token parse cost.
+"""
+import json
+from typing import Any, Dict, Optional
+
+# Returned for the ``data: [DONE]`` line that ends a stream
+DONE: Dict[str, Any] = {"done": True}
+
+
+def parse_data_line(line: str) -> Optional[Dict[str, Any]]:
+    """JSON payload of a ``data:`` line, DONE at the end, None for other lines
+
+    Raises json.JSONDecodeError for a malformed payload.
+    """
+    if not line.startswith("data: "):
+        return None
+    data_str = line[6:].strip()
+    if data_str == "[DONE]":
+        return DONE
+    return json.loads(data_str)
+
+
+def first_choice(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The first ``choices`` entry of a payload, if any"""
+    choices = data.get("choices")
+    return choices[0] if choices else None
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Upstream connection pre-warming and keep-alive maintenance.
+
+On startup every configured provider base URL is resolved and a minimum
+number of pooled connections is opened with lightweight HEAD requests.
+The same round repeats periodically, which refreshes the DNS cache and
+keeps idle connections from expiring, so the first chat request after a
+deploy or an idle period does not pay DNS, TCP and TLS setup.
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+from config import get_model_config
+from models.registry import SUPPORTED_MODEL_TYPES
+from models.http_pool import dns_cache, get_client, idle_connections, origin_of
+
+logger = logging.getLogger(__name__)
+
+
+def provider_base_urls(settings) -> List[str]:
+    """Base URLs of every enabled provider that has an API key"""
+    urls = []
+    for model in settings.models_config.models:
+        if not model.enabled or model.type not in SUPPORTED_MODEL_TYPES:
+            continue
+        if not settings.has_api_key_for_env(model.env_key):
+            continue
+        url = get_model_config(model.type).get_base_url()
+        if url not in urls:
+            urls.append(url)
+    return urls
+
+
+class ConnectionWarmer:
+    """Keeps a minimum number of warm idle connections per provider"""
+
+    def __init__(self, min_idle: int, interval: float, timeout: float = 5.0, settings=None):
+        self.min_idle = min_idle
+        self.interval = interval
+        self.timeout = timeout
+        self._settings = settings
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def settings(self):
+        if self._settings is None:
+            from config.app_settings import settings
+            self._settings = settings
+        return self._settings
+
+    def _ping(self, url: str) -> None:
+        # Any response proves the connection is up; status codes are irrelevant
+        get_client(url).head(origin_of(url) + "/", timeout=self.timeout)
+
+    def warm(self, url: str) -> int:
+        """Refresh DNS and open connections until ``min_idle`` are pooled"""
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        dns_cache.resolve(parts.hostname, port, refresh=True)
+
+        # Requests in flight concurrently each check out their own connection,
+        # so min_idle of them refresh existing idle connections and open the
+        # missing ones; all return to the pool as idle afterwards.
+        with ThreadPoolExecutor(max_workers=self.min_idle) as pool:
+            list(pool.map(lambda _: self._ping(url), range(self.min_idle)))
+        return idle_connections(url) or 0
+
+    def warm_all(self) -> None:
+        for url in provider_base_urls(self.settings):
+            try:
+                idle = self.warm(url)
+                logger.debug("ConnectionWarmer: %s has %d warm connections", origin_of(url), idle)
+            except Exception as e:
+                logger.warning(f"ConnectionWarmer: warming {origin_of(url)} failed: {str(e)}")
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await asyncio.to_thread(self.warm_all)
+
+    async def start(self) -> None:
+        """Warm every provider once, then keep connections alive in the background"""
+        if self.min_idle <= 0:
+            return
+        try:
+            await asyncio.wait_for(asyncio.to_thread(self.warm_all), timeout=self.timeout * 2)
+        except asyncio.TimeoutError:
+            logger.warning("ConnectionWarmer: initial warm-up timed out, continuing startup")
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# NO CHECKED-IN PROTOBUF GENCODE
+# source: chat.proto
+# Protobuf Python Version: 7.35.1
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import runtime_version as _runtime_version
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+_runtime_version.ValidateProtobufRuntimeVersion(
+    _runtime_version.Domain.PUBLIC,
+    7,
+    35,
+    1,
+    '',
+    'chat.proto'
+)
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nchat.proto\x12\x12\x61\x61\x61nynotes.chat.v1\"D\n\x07Message\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0f\n\x07\x63ontent\x18\x02 \x01(\t\x12\x0e\n\x06sender\x18\x03 \x01(\t\x12\x0c\n\x04time\x18\x04 \x01(\t\"\x92\x04\n\x11\x43hatStreamRequest\x12-\n\x08messages\x18\x01 \x03(\x0b\x32\x1b.aaanynotes.chat.v1.Message\x12\x12\n\x05model\x18\x02 \x01(\tH\x00\x88\x01\x01\x12\x18\n\x0btemperature\x18\x03 \x01(\x01H\x01\x88\x01\x01\x12\x12\n\x05top_p\x18\x04 \x01(\x01H\x02\x88\x01\x01\x12\x17\n\nmax_tokens\x18\x05 \x01(\x05H\x03\x88\x01\x01\x12\x1e\n\x11\x66requency_penalty\x18\x06 \x01(\x01H\x04\x88\x01\x01\x12\x1d\n\x10presence_penalty\x18\x07 \x01(\x01H\x05\x88\x01\x01\x12\x0c\n\x04stop\x18\x08 \x03(\t\x12\x1a\n\rthinking_mode\x18\t \x01(\x08H\x06\x88\x01\x01\x12\x17\n\ntimeout_ms\x18\n \x01(\x03H\x07\x88\x01\x01\x12\x15\n\x08priority\x18\x0b \x01(\tH\x08\x88\x01\x01\x12\x16\n\x0e\x63ompare_models\x18\x0c \x03(\t\x12\x1f\n\x12\x63ompare_stop_after\x18\r \x01(\x05H\t\x88\x01\x01\x42\x08\n\x06_modelB\x0e\n\x0c_temperatureB\x08\n\x06_top_pB\r\n\x0b_max_tokensB\x14\n\x12_frequency_penaltyB\x13\n\x11_presence_penaltyB\x10\n\x0e_thinking_modeB\r\n\x0b_timeout_msB\x0b\n\t_priorityB\x15\n\x13_compare_stop_after\"W\n\nChunkError\x12\x13\n\x0b\x65rror_class\x18\x01 \x01(\t\x12\x11\n\tretryable\x18\x02 \x01(\x08\x12\x10\n\x08provider\x18\x03 \x01(\t\x12\x0f\n\x07message\x18\x04 \x01(\t\"\xb3\x01\n\x0bStreamChunk\x12\x0f\n\x07\x63ontent\x18\x01 \x01(\t\x12\x10\n\x08\x66inished\x18\x02 \x01(\x08\x12-\n\x05\x65rror\x18\x03 \x01(\x0b\x32\x1e.aaanynotes.chat.v1.ChunkError\x12\x12\n\x05model\x18\x04 \x01(\tH\x00\x88\x01\x01\x12\x12\n\nmodel_done\x18\x05 \x01(\x08\x12\x14\n\x07ttft_ms\x18\x06 \x01(\x01H\x01\x88\x01\x01\x42\x08\n\x06_modelB\n\n\x08_ttft_ms\"\x13\n\x11ListModelsRequest\"\x83\x01\n\tModelInfo\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\x10\n\x08provider\x18\x03 \x01(\t\x12\x13\n\x0b\x64\x65scription\x18\x04 \x01(\t\x12\x0c\n\x04type\x18\x05 \x01(\t\x12\x12\n\nmax_tokens\x18\x06 \x01(\x05\x12\x13\n\x0bhas_api_key\x18\x07 \x01(\x08\"Z\n\x12ListModelsResponse\x12-\n\x06models\x18\x01 \x03(\x0b\x32\x1d.aaanynotes.chat.v1.ModelInfo\x12\x15\n\rdefault_model\x18\x02 \x01(\t2\xc2\x01\n\x0b\x43hatService\x12V\n\nChatStream\x12%.aaanynotes.chat.v1.ChatStreamRequest\x1a\x1f.aaanynotes.chat.v1.StreamChunk0\x01\x12[\n\nListModels\x12%.aaanynotes.chat.v1.ListModelsRequest\x1a&.aaanynotes.chat.v1.ListModelsResponseB;Z9AAAnynotes/backend/go/internal/infrastructure/grpc/chatpbb\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'chat_pb2', _globals)
+if not _descriptor._USE_C_DESCRIPTORS:
+  _globals['DESCRIPTOR']._loaded_options = None
+  _globals['DESCRIPTOR']._serialized_options = b'Z9AAAnynotes/backend/go/internal/infrastructure/grpc/chatpb'
+  _globals['_MESSAGE']._serialized_start=34
+  _globals['_MESSAGE']._serialized_end=102
+  _globals['_CHATSTREAMREQUEST']._serialized_start=105
+  _globals['_CHATSTREAMREQUEST']._serialized_end=635
+  _globals['_CHUNKERROR']._serialized_start=637
+  _globals['_CHUNKERROR']._serialized_end=724
+  _globals['_STREAMCHUNK']._serialized_start=727
+  _globals['_STREAMCHUNK']._serialized_end=906
+  _globals['_LISTMODELSREQUEST']._serialized_start=908
+  _globals['_LISTMODELSREQUEST']._serialized_end=927
+  _globals['_MODELINFO']._serialized_start=930
+  _globals['_MODELINFO']._serialized_end=1061
+  _globals['_LISTMODELSRESPONSE']._serialized_start=1063
+  _globals['_LISTMODELSRESPONSE']._serialized_end=1153
+  _globals['_CHATSERVICE']._serialized_start=1156
+  _globals['_CHATSERVICE']._serialized_end=1350
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,107 @@
+from google.protobuf.internal import containers as _containers
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import message as _message
+from collections.abc import Iterable as _Iterable, Mapping as _Mapping
+from typing import ClassVar as _ClassVar, Optional as _Optional, Union as _Union
+
+DESCRIPTOR: _descriptor.FileDescriptor
+
+class Message(_message.Message):
+    __slots__ = ("id", "content", "sender", "time")
+    ID_FIELD_NUMBER: _ClassVar[int]
+    CONTENT_FIELD_NUMBER: _ClassVar[int]
+    SENDER_FIELD_NUMBER: _ClassVar[int]
+    TIME_FIELD_NUMBER: _ClassVar[int]
+    id: str
+    content: str
+    sender: str
+    time: str
+    def __init__(self, id: _Optional[str] = ..., content: _Optional[str] = ..., sender: _Optional[str] = ..., time: _Optional[str] = ...) -> None: ...
+
+class ChatStreamRequest(_message.Message):
+    __slots__ = ("messages", "model", "temperature", "top_p", "max_tokens", "frequency_penalty", "presence_penalty", "stop", "thinking_mode", "timeout_ms", "priority", "compare_models", "compare_stop_after")
+    MESSAGES_FIELD_NUMBER: _ClassVar[int]
+    MODEL_FIELD_NUMBER: _ClassVar[int]
+    TEMPERATURE_FIELD_NUMBER: _ClassVar[int]
+    TOP_P_FIELD_NUMBER: _ClassVar[int]
+    MAX_TOKENS_FIELD_NUMBER: _ClassVar[int]
+    FREQUENCY_PENALTY_FIELD_NUMBER: _ClassVar[int]
+    PRESENCE_PENALTY_FIELD_NUMBER: _ClassVar[int]
+    STOP_FIELD_NUMBER: _ClassVar[int]
+    THINKING_MODE_FIELD_NUMBER: _ClassVar[int]
+    TIMEOUT_MS_FIELD_NUMBER: _ClassVar[int]
+    PRIORITY_FIELD_NUMBER: _ClassVar[int]
+    COMPARE_MODELS_FIELD_NUMBER: _ClassVar[int]
+    COMPARE_STOP_AFTER_FIELD_NUMBER: _ClassVar[int]
+    messages: _containers.RepeatedCompositeFieldContainer[Message]
+    model: str
+    temperature: float
+    top_p: float
+    max_tokens: int
+    frequency_penalty: float
+    presence_penalty: float
+    stop: _containers.RepeatedScalarFieldContainer[str]
+    thinking_mode: bool
+    timeout_ms: int
+    priority: str
+    compare_models: _containers.RepeatedScalarFieldContainer[str]
+    compare_stop_after: int
+    def __init__(self, messages: _Optional[_Iterable[_Union[Message, _Mapping]]] = ..., model: _Optional[str] = ..., temperature: _Optional[float] = ..., top_p: _Optional[float] = ..., max_tokens: _Optional[int] = ..., frequency_penalty: _Optional[float] = ..., presence_penalty: _Optional[float] = ..., stop: _Optional[_Iterable[str]] = ..., thinking_mode: _Optional[bool] = ..., timeout_ms: _Optional[int] = ..., priority: _Optional[str] = ..., compare_models: _Optional[_Iterable[str]] = ..., compare_stop_after: _Optional[int] = ...) -> None: ...
+
+class ChunkError(_message.Message):
+    __slots__ = ("error_class", "retryable", "provider", "message")
+    ERROR_CLASS_FIELD_NUMBER: _ClassVar[int]
+    RETRYABLE_FIELD_NUMBER: _ClassVar[int]
+    PROVIDER_FIELD_NUMBER: _ClassVar[int]
+    MESSAGE_FIELD_NUMBER: _ClassVar[int]
+    error_class: str
+    retryable: bool
+    provider: str
+    message: str
+    def __init__(self, error_class: _Optional[str] = ..., retryable: _Optional[bool] = ..., provider: _Optional[str] = ..., message: _Optional[str] = ...) -> None: ...
+
+class StreamChunk(_message.Message):
+    __slots__ = ("content", "finished", "error", "model", "model_done", "ttft_ms")
+    CONTENT_FIELD_NUMBER: _ClassVar[int]
+    FINISHED_FIELD_NUMBER: _ClassVar[int]
+    ERROR_FIELD_NUMBER: _ClassVar[int]
+    MODEL_FIELD_NUMBER: _ClassVar[int]
+    MODEL_DONE_FIELD_NUMBER: _ClassVar[int]
+    TTFT_MS_FIELD_NUMBER: _ClassVar[int]
+    content: str
+    finished: bool
+    error: ChunkError
+    model: str
+    model_done: bool
+    ttft_ms: float
+    def __init__(self, content: _Optional[str] = ..., finished: _Optional[bool] = ..., error: _Optional[_Union[ChunkError, _Mapping]] = ..., model: _Optional[str] = ..., model_done: _Optional[bool] = ..., ttft_ms: _Optional[float] = ...) -> None: ...
+
+class ListModelsRequest(_message.Message):
+    __slots__ = ()
+    def __init__(self) -> None: ...
+
+class ModelInfo(_message.Message):
+    __slots__ = ("id", "name", "provider", "description", "type", "max_tokens", "has_api_key")
+    ID_FIELD_NUMBER: _ClassVar[int]
+    NAME_FIELD_NUMBER: _ClassVar[int]
+    PROVIDER_FIELD_NUMBER: _ClassVar[int]
+    DESCRIPTION_FIELD_NUMBER: _ClassVar[int]
+    TYPE_FIELD_NUMBER: _ClassVar[int]
+    MAX_TOKENS_FIELD_NUMBER: _ClassVar[int]
+    HAS_API_KEY_FIELD_NUMBER: _ClassVar[int]
+    id: str
+    name: str
+    provider: str
+    description: str
+    type: str
+    max_tokens: int
+    has_api_key: bool
+    def __init__(self, id: _Optional[str] = ..., name: _Optional[str] = ..., provider: _Optional[str] = ..., description: _Optional[str] = ..., type: _Optional[str] = ..., max_tokens: _Optional[int] = ..., has_api_key: _Optional[bool] = ...) -> None: ...
+
+class ListModelsResponse(_message.Message):
+    __slots__ = ("models", "default_model")
+    MODELS_FIELD_NUMBER: _ClassVar[int]
+    DEFAULT_MODEL_FIELD_NUMBER: _ClassVar[int]
+    models: _containers.RepeatedCompositeFieldContainer[ModelInfo]
+    default_model: str
+    def __init__(self, models: _Optional[_Iterable[_Union[ModelInfo, _Mapping]]] = ..., default_model: _Optional[str] = ...) -> None: ...
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Regenerate the protobuf and gRPC stubs in this package from
+backend/proto/chat.proto (requires grpcio-tools).
+
+Usage:
+    python src/rpc/generate.py
+"""
+import os
+import sys
+
+RPC_DIR = os.path.dirname(os.path.abspath(__file__))
+PROTO_DIR = os.path.join(RPC_DIR, "..", "..", "..", "proto")
+
+
+def main():
+    from grpc_tools import protoc
+
+    code = protoc.main([
+        "grpc_tools.protoc",
+        f"-I{PROTO_DIR}",
+        f"--python_out={RPC_DIR}",
+        f"--pyi_out={RPC_DIR}",
+        f"--grpc_python_out={RPC_DIR}",
+        os.path.join(PROTO_DIR, "chat.proto"),
+    ])
+    if code != 0:
+        sys.exit(code)
+    # protoc emits a top-level import; the stubs live in the rpc package
+    path = os.path.join(RPC_DIR, "chat_pb2_grpc.py")
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(source.replace("import chat_pb2 as chat__pb2", "from rpc import chat_pb2 as chat__pb2"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""gRPC ChatService (backend/proto/chat.proto) served next to the HTTP API.
+
+Started from the app lifespan when GRPC_PORT is set, on the same event loop
+as FastAPI. Every uvicorn worker binds the port with SO_REUSEPORT, so the
+kernel spreads gateway connections across workers, and each connection
+multiplexes many streams over HTTP/2.
+
+``ChatStream`` runs the same pipeline as ``/api/chat/stream``: the same
+deadline, usage, tracing and drain handling, with the values the HTTP path
+reads from headers taken from request metadata. Chunks are serialized once
+in ``encoded_stream``, which counts their size, so the handler passes the
+bytes through without a response serializer. A cancelled call (client gone
+or deadline exceeded) closes the upstream provider stream.
+"""
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import grpc
+from pydantic import ValidationError
+
+from api.endpoints.chat_endpoint import aiter_stream, encoded_stream
+from common.deadline import Deadline
+from common.drain import get_stream_drain
+from common.metrics import StreamTimings
+from common.models import ChatStreamRequest, StreamChunk
+from common.tracing import get_tracer
+from common.usage import RequestUsage
+from config.logging_config import trace_request
+from rpc import chat_pb2
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "aaanynotes.chat.v1.ChatService"
+
+# ChatStreamRequest field -> optional proto field
+_OPTIONAL_FIELDS = {
+    "model": "model",
+    "temperature": "temperature",
+    "topP": "top_p",
+    "maxTokens": "max_tokens",
+    "frequencyPenalty": "frequency_penalty",
+    "presencePenalty": "presence_penalty",
+    "thinkingMode": "thinking_mode",
+    "timeoutMs": "timeout_ms",
+    "priority": "priority",
+    "compareStopAfter": "compare_stop_after",
+}
+
+
+def request_from_proto(message: chat_pb2.ChatStreamRequest) -> ChatStreamRequest:
+    fields: Dict[str, Any] = {
+        "messages": [{"id": m.id, "content": m.content, "sender": m.sender, "time": m.time}
+                     for m in message.messages],
+    }
+    for name, proto_name in _OPTIONAL_FIELDS.items():
+        if message.HasField(proto_name):
+            fields[name] = getattr(message, proto_name)
+    if message.stop:
+        fields["stop"] = list(message.stop)
+    if message.compare_models:
+        fields["compareModels"] = list(message.compare_models)
+    return ChatStreamRequest(**fields)
+
+
+def encode_chunk_proto(chunk: StreamChunk) -> bytes:
+    """Serialized StreamChunk message"""
+    error = None
+    if chunk.error is not None:
+        error = chat_pb2.ChunkError(
+            error_class=chunk.error.errorClass,
+            retryable=chunk.error.retryable,
+            provider=chunk.error.provider,
+            message=chunk.error.message,
+        )
+    if chunk.model is not None:
+        return chat_pb2.StreamChunk(content=chunk.content, finished=chunk.finished, error=error, model=chunk.model,
+                                    model_done=bool(chunk.modelDone), ttft_ms=chunk.ttftMs).SerializeToString()
+    return chat_pb2.StreamChunk(content=chunk.content, finished=chunk.finished, error=error).SerializeToString()
+
+
+def _timeout_ms(metadata: Dict[str, str], context) -> Optional[float]:
+    """Tighter of the x-request-timeout-ms metadata and the gRPC deadline"""
+    budgets = []
+    try:
+        if metadata.get("x-request-timeout-ms"):
+            budgets.append(float(metadata["x-request-timeout-ms"]))
+    except ValueError:
+        pass
+    remaining = context.time_remaining()
+    if remaining is not None:
+        budgets.append(remaining * 1000.0)
+    return min(budgets) if budgets else None
+
+
+class ChatServicer:
+    """Implements ChatService on top of the HTTP streaming pipeline"""
+
+    async def ChatStream(self, message, context):
+        received_at = time.perf_counter()
+        if get_stream_drain().draining:
+            await context.abort(grpc.StatusCode.UNAVAILABLE, "Server is shutting down, retry the request")
+        try:
+            req = request_from_proto(message)
+        except ValidationError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"Invalid request: {e}")
+
+        metadata = {key: value for key, value in context.invocation_metadata() if isinstance(value, str)}
+        timings = StreamTimings(received_at)
+        timings.stage("body_parse", time.perf_counter() - received_at)
+        span = get_tracer().start_request_span("gRPC ChatService/ChatStream", metadata.get("traceparent"), received_at)
+        usage = RequestUsage(metadata.get("x-user-id"), req.messages)
+        deadline = Deadline.from_request(req.timeoutMs, _timeout_ms(metadata, context))
+
+        stream = aiter_stream(encoded_stream(req, deadline, timings, usage, span, trace_request(logger),
+                                             encode_chunk_proto))
+        try:
+            async for data in stream:
+                yield data
+        finally:
+            await stream.aclose()
+
+    async def ListModels(self, message, context):
+        from config.app_settings import settings
+        enabled = settings.get_enabled_models()
+        return chat_pb2.ListModelsResponse(
+            models=[
+                chat_pb2.ModelInfo(
+                    id=model["id"], name=model["name"], provider=model["provider"],
+                    description=model["description"], type=model["type"],
+                    max_tokens=model["maxTokens"], has_api_key=model["hasApiKey"],
+                )
+                for model in enabled.get("models", [])
+            ],
+            default_model=enabled.get("defaultModel") or "",
+        )
+
+
+def method_handlers(servicer: ChatServicer) -> grpc.GenericRpcHandler:
+    return grpc.method_handlers_generic_handler(SERVICE_NAME, {
+        "ChatStream": grpc.unary_stream_rpc_method_handler(
+            servicer.ChatStream,
+            request_deserializer=chat_pb2.ChatStreamRequest.FromString,
+            # Already serialized by encode_chunk_proto
+            response_serializer=None,
+        ),
+        "ListModels": grpc.unary_unary_rpc_method_handler(
+            servicer.ListModels,
+            request_deserializer=chat_pb2.ListModelsRequest.FromString,
+            response_serializer=chat_pb2.ListModelsResponse.SerializeToString,
+        ),
+    })
+
+
+async def start_grpc_server(host: str, port: int, max_streams: int = 1000) -> grpc.aio.Server:
+    server = grpc.aio.server(options=[
+        ("grpc.so_reuseport", 1),
+        ("grpc.max_concurrent_streams", max_streams),
+        # Keep idle gateway connections alive through NAT and load balancers
+        ("grpc.keepalive_time_ms", 60000),
+        ("grpc.http2.max_pings_without_data", 0),
+    ])
+    server.add_generic_rpc_handlers((method_handlers(ChatServicer()),))
+    address = f"{host}:{port}"
+    server.add_insecure_port(address)
+    await server.start()
+    logger.info("gRPC ChatService listening on %s", address)
+    return server
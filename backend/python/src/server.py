@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Launcher for the AI service.
+
+Development mode runs one worker with auto-reload. Production mode runs one
+worker per available core, uses uvloop and httptools when they are
+installed (``uvicorn[standard]``), raises the listen backlog and keeps idle
+connections open longer than the gateway does. On SIGTERM each worker
+stops accepting connections and lets in-flight streams finish for up to
+SHUTDOWN_DRAIN_SECONDS (see common/drain.py) before closing pooled
+upstream clients. Limits that must hold for the whole server live in a
+shared memory segment this process owns (see common/shared_state.py);
+workers sum their metrics through snapshot files (see common/metrics.py).
+
+When SOCKET_PYTHON is set the service listens on that Unix domain socket
+instead of PORT_PYTHON, for a gateway on the same host. The socket is bound
+here, before the workers start, so its permission bits and group are in
+place before anyone can connect, and it is removed on exit. ``--probe``
+checks /health over whichever transport is configured and exits non-zero
+when the service is down or draining (for container health checks).
+
+Usage:
+    python server.py                       # mode from SERVER_MODE / DEBUG
+    python server.py --mode production --workers 8
+    python server.py --probe
+"""
+import argparse
+import functools
+import importlib.util
+import logging
+import math
+import os
+import shutil
+import signal
+import socket
+import stat
+import sys
+from typing import Any, Callable, Dict, Optional
+
+from common.metrics import worker_metrics_dir
+from common.shared_state import create_shared_state
+from config.app_settings import settings
+from config.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Extra time uvicorn waits after the app's drain deadline, so drained
+# streams can send their final chunk before connections are closed
+SHUTDOWN_GRACE_SECONDS = 2
+
+
+def available_cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def server_options(mode: str, workers: Optional[int] = None, fd: Optional[int] = None) -> Dict[str, Any]:
+    """uvicorn.run keyword arguments for ``mode``, listening on socket ``fd`` when given"""
+    listen: Dict[str, Any] = {"fd": fd} if fd is not None else {
+        "host": settings.server_host,
+        "port": int(settings.port_python),
+    }
+    options: Dict[str, Any] = {
+        **listen,
+        # Logging is configured by the app (config/logging_config.py)
+        "log_config": None,
+        "timeout_keep_alive": settings.server_keepalive_seconds,
+        "timeout_graceful_shutdown": math.ceil(settings.shutdown_drain_seconds) + SHUTDOWN_GRACE_SECONDS,
+    }
+    if mode == "development":
+        options.update(reload=True, workers=1)
+        return options
+
+    options.update(
+        workers=workers or settings.server_workers or available_cores(),
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        http="httptools" if importlib.util.find_spec("httptools") else "h11",
+        backlog=settings.server_backlog,
+        access_log=False,
+    )
+    return options
+
+
+def bind_unix_socket(path: str, mode: int, group: str = "") -> socket.socket:
+    """Unix socket bound at ``path`` with permission bits ``mode``
+
+    A socket file left behind by a crashed server is replaced; one that a
+    running server still accepts connections on is not.
+    """
+    if os.path.lexists(path):
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            raise RuntimeError(f"{path} exists and is not a socket")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as other:
+            if other.connect_ex(path) == 0:
+                raise RuntimeError(f"{path} is in use by a running server")
+        os.unlink(path)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Owner-only until the configured mode and group are applied
+    umask = os.umask(0o177)
+    try:
+        sock.bind(path)
+    finally:
+        os.umask(umask)
+    if group:
+        import grp
+        os.chown(path, -1, grp.getgrnam(group).gr_gid)
+    os.chmod(path, mode)
+    return sock
+
+
+def remove_unix_socket(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def probe_health(timeout: float = 2.0) -> bool:
+    """Whether GET /health answers 200, over SOCKET_PYTHON when it is set"""
+    import httpx
+
+    if settings.socket_python:
+        transport, url = httpx.HTTPTransport(uds=settings.socket_python), "http://localhost/health"
+    else:
+        transport, url = None, f"http://127.0.0.1:{settings.port_python}/health"
+    try:
+        with httpx.Client(transport=transport, timeout=timeout) as client:
+            return client.get(url).status_code == 200
+    except httpx.HTTPError:
+        return False
+
+
+def _cleanup_on_signal(cleanup: Callable[[], None]) -> None:
+    """Run ``cleanup`` when a signal ends the process
+
+    A single-worker uvicorn re-raises SIGTERM/SIGINT once it has shut down,
+    which would kill the process before ``main`` can clean up.
+    """
+    def handle(sig, frame):
+        cleanup()
+        signal.signal(sig, signal.SIG_DFL)
+        os.kill(os.getpid(), sig)
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, handle)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the AAAnyNotes AI service")
+    parser.add_argument("--mode", choices=("development", "production"), default=settings.server_mode)
+    parser.add_argument("--workers", type=int, default=None, help="Production worker count (default: cores)")
+    parser.add_argument("--probe", action="store_true", help="Check /health and exit 0 when the service is up")
+    args = parser.parse_args(argv)
+    if args.probe:
+        sys.exit(0 if probe_health() else 1)
+
+    import uvicorn
+
+    setup_logging()
+    cleanups = []
+    # Created before the workers start; they find it through the environment
+    state = create_shared_state(settings.shared_state_slots)
+    if state is not None:
+        os.environ["SHARED_STATE_NAME"] = state.name
+        cleanups.append(state.unlink)
+        cleanups.append(functools.partial(shutil.rmtree, worker_metrics_dir(state.name), ignore_errors=True))
+    sock = None
+    if settings.socket_python:
+        sock = bind_unix_socket(settings.socket_python, settings.socket_python_mode, settings.socket_python_group)
+        cleanups.append(functools.partial(remove_unix_socket, settings.socket_python))
+        logger.info("Listening on %s (mode %o)", settings.socket_python, settings.socket_python_mode)
+
+    def cleanup():
+        for step in cleanups:
+            step()
+
+    _cleanup_on_signal(cleanup)
+    options = server_options(args.mode, args.workers, fd=sock.fileno() if sock is not None else None)
+    logger.info("Starting uvicorn in %s mode: %s", args.mode, options)
+    try:
+        uvicorn.run("main:app", **options)
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
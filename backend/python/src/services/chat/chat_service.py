@@ -1,66 +1,190 @@
 # -*- coding: utf-8 -*-
-from typing import Generator
+from functools import partial
+from typing import Generator, Iterator, List, Optional, Tuple
 from common.models import ChatStreamRequest, StreamChunk, Message
-from models.glm_model import create_model
+from common.deadline import Deadline, DeadlineExceeded
+from common.errors import error_chunk
+from common.metrics import StreamTimings
+from common.usage import RequestUsage
+from models.http_pool import UpstreamCancel, current_cancel
+from models.registry import create_model
 from config.model_mappings import get_model_type, get_model_id
+from services.chat.compare import compare_stream
+from services.chat.hedging import HedgePolicy
+from services.chat.quota import get_provider_quota
+from services.chat.routing import resolve_model
+from services.chat.scheduler import get_scheduler
+from services.chat.scoreboard import get_scoreboard
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+_hedge_policy: Optional[HedgePolicy] = None
+
+
+def get_hedge_policy() -> HedgePolicy:
+    """Process-wide hedge policy built lazily from settings"""
+    global _hedge_policy
+    if _hedge_policy is None:
+        from config.app_settings import settings
+        _hedge_policy = HedgePolicy.from_settings(settings)
+    return _hedge_policy
+
+
+def model_label(model_id: Optional[str]) -> str:
+    """Model recorded in metrics and usage for ``model_id``
+
+    Only ids configured in models.json are used as is; anything else a
+    client sends is recorded as "unknown", so it cannot add label series.
+    """
+    if not model_id:
+        return "kimi"
+    from config.app_settings import settings
+    known = get_model_id(model_id)
+    return known if settings.get_model_by_id(known) is not None else "unknown"
+
+
+def within_deadline(stream: Iterator[StreamChunk], deadline: Deadline,
+                    provider: str) -> Generator[StreamChunk, None, None]:
+    """``stream`` with its upstream read aborted when ``deadline`` passes
+
+    The provider's read timeout is fixed when the call starts and the total
+    budget is only checked between chunks, so without this a read stalled
+    near the end of the budget would outlive the request by up to the
+    first-token timeout.
+    """
+    upstream = UpstreamCancel()
+    parent = current_cancel()
+    if parent is not None:
+        # Cancelling the request still aborts this read
+        parent.on_cancel(upstream.cancel)
+    upstream.cancel_at(deadline.expires_at)
+    finished = False
+    try:
+        for chunk in iter(partial(upstream.call, next, stream, None), None):
+            if chunk.error is not None and upstream.cancelled and deadline.expired():
+                break
+            finished = finished or chunk.finished
+            yield chunk
+        # The aborted read shows up as an error or, for a body ended by the
+        # connection closing, as the end of the stream
+        if not finished and upstream.cancelled and deadline.expired():
+            yield error_chunk(DeadlineExceeded("Request deadline exceeded while waiting for the provider"), provider)
+    finally:
+        upstream.disarm()
+        if hasattr(stream, "close"):
+            upstream.call(stream.close)
+
 
 class ChatService:
     """AI model chat service supporting multiple models (GLM, Kimi, OpenAI, Claude)"""
     
     @staticmethod
-    def stream_chat(req: ChatStreamRequest) -> Generator[StreamChunk, None, None]:
-        print(f"DEBUG: ChatService.stream_chat() called with model: {req.model}")
+    def stream_chat(req: ChatStreamRequest, deadline: Optional[Deadline] = None,
+                    timings: Optional[StreamTimings] = None,
+                    usage: Optional[RequestUsage] = None) -> Generator[StreamChunk, None, None]:
+        logger.debug("ChatService.stream_chat() called with model: %s", req.model)
+        # Budget for the whole request, passed down to the provider
+        deadline = deadline or Deadline.from_request(req.timeoutMs)
         try:
-            model_type = get_model_type(req.model) if req.model else "kimi"
-            model_id = get_model_id(req.model) if req.model else None
-            model = create_model(model_type, model_id)
-
-            # Convert messages to working format (based on tmp.py)
-            converted_messages = []
-            for msg in req.messages:
-                # Handle both Message objects and dictionaries (more robust check)
-                if hasattr(msg, "sender") and hasattr(msg, "content") and hasattr(msg, "id") and hasattr(msg, "time"):
-                    sender = msg.sender
-                    content = msg.content
-                else:
-                    # Assume dictionary format
-                    sender = msg.get('sender', 'user')
-                    content = msg.get('content', '')
-                
-                converted_messages.append({
-                    "sender": sender,
-                    "content": content
-                })
-            
-            
-            # Use simpler parameter passing
-            for chunk in model.stream_chat(
-                messages=converted_messages,
-                temperature=req.temperature or 0.6,
-                maxTokens=req.maxTokens or 2000,
-                thinkingMode=getattr(req, "thinkingMode", False),
-            ):
+            if req.compareModels:
+                yield from compare_stream(req, deadline, timings, usage, ChatService.stream_chat)
+                return
+
+            converted_messages = ChatService.convert_messages(req.messages)
+
+            thinking_mode = getattr(req, "thinkingMode", False)
+            # Resolve routed ids such as "auto" to the fastest healthy model
+            started = time.perf_counter()
+            resolved_model = resolve_model(req.model, thinking=thinking_mode)
+            if timings:
+                timings.stage("model_resolution", time.perf_counter() - started)
+                timings.model = model_label(resolved_model)
+            if usage:
+                usage.model = model_label(resolved_model)
+            deadline.check("model resolution")
+
+            def open_stream(requested_model: Optional[str],
+                            attempt_usage: Optional[RequestUsage] = usage) -> Iterator[StreamChunk]:
+                model_type = get_model_type(requested_model) if requested_model else "kimi"
+                model_id = get_model_id(requested_model) if requested_model else None
+
+                def start() -> Iterator[StreamChunk]:
+                    # Shared across workers, so the limit holds for the whole server
+                    get_provider_quota().acquire(model_id)
+                    started = time.perf_counter()
+                    model = create_model(model_type, model_id)
+                    if timings:
+                        timings.stage("create_model", time.perf_counter() - started)
+
+                    # Use simpler parameter passing
+                    return within_deadline(get_scoreboard().observe(model_id or model_type, model.stream_chat(
+                        messages=converted_messages,
+                        temperature=req.temperature or 0.6,
+                        maxTokens=req.maxTokens or 2000,
+                        thinkingMode=thinking_mode,
+                        deadline=deadline,
+                        timings=timings,
+                        usage=attempt_usage,
+                    )), deadline, model_type)
+
+                # Waits for an upstream slot of the request's priority class
+                return get_scheduler().admit(model_type, req.priority, deadline, start)
+
+            policy = get_hedge_policy()
+            if policy.enabled and resolved_model:
+                # Each attempt counts its own tokens; only the one that answers is recorded
+                attempts: List[Tuple[Iterator[StreamChunk], str, Optional[RequestUsage]]] = []
+
+                def open_attempt(requested_model: str) -> Iterator[StreamChunk]:
+                    attempt_usage = RequestUsage(usage.user, req.messages, usage.aggregator) if usage else None
+                    if attempt_usage:
+                        attempt_usage.model = model_label(requested_model)
+                    attempt = open_stream(requested_model, attempt_usage)
+                    attempts.append((attempt, requested_model, attempt_usage))
+                    return attempt
+
+                def on_winner(winner: Iterator[StreamChunk]) -> None:
+                    for attempt, requested_model, attempt_usage in list(attempts):
+                        if attempt is winner:
+                            if timings:
+                                timings.model = model_label(requested_model)
+                            if usage:
+                                usage.follow(attempt_usage)
+
+                stream = policy.stream(resolved_model, open_attempt, on_winner)
+            else:
+                stream = open_stream(resolved_model)
+
+            for chunk in stream:
                 yield chunk
                 
         except Exception as e:
-            import time
-            error_msg = f"Model call failed: {str(e)}\n\n"
             logger.error(f"ChatService: Error occurred: {str(e)}")
+            # Fail fast with a single structured chunk so the worker is released immediately
+            provider = (get_model_type(req.model) if req.model else "kimi") or "unknown"
+            yield error_chunk(e, provider, content=f"Model call failed: {str(e)}")
+
+    @staticmethod
+    def convert_messages(messages) -> List[dict]:
+        """Convert messages to working format (based on tmp.py)"""
+        converted_messages = []
+        for msg in messages:
+            # Handle both Message objects and dictionaries (more robust check)
+            if hasattr(msg, "sender") and hasattr(msg, "content") and hasattr(msg, "id") and hasattr(msg, "time"):
+                sender = msg.sender
+                content = msg.content
+            else:
+                # Assume dictionary format
+                sender = msg.get('sender', 'user')
+                content = msg.get('content', '')
             
-            # Fallback response (split into tokens for streaming simulation)
-            tokens = error_msg.split(" ")
-            tokens = [token + " " for token in tokens]
-            if tokens:
-                tokens[-1] = tokens[-1].strip()
-            
-            for i, token in enumerate(tokens):
-                time.sleep(0.5)
-                chunk = StreamChunk(content=token, finished=(i == len(tokens) - 1))
-                yield chunk
+            converted_messages.append({
+                "sender": sender,
+                "content": content
+            })
+        return converted_messages
 
     @staticmethod
     def get_available_models():
@@ -68,7 +192,7 @@ class ChatService:
         try:
             from config.app_settings import settings
             available_models = settings.get_available_models()
-            logger.info(f"ChatService: Available models: {available_models}")
+            logger.debug("ChatService: Available models: %s", available_models)
             return available_models
         except Exception as e:
             logger.error(f"ChatService: Error getting available models: {str(e)}")
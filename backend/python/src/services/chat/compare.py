@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""Compare mode: several models answering one request in one stream.
+
+With ``compareModels`` the request runs once per listed model, all at
+once, each in a StreamPump thread (see hedging.py) through the normal
+ChatService path (routing, quotas, scheduling, pooled clients). Chunks are
+passed on as they arrive, tagged with their model:
+
+    {"content": "Hel", "finished": false, "model": "glm-4"}
+    {"content": "Hi", "finished": false, "model": "kimi-k2-turbo-preview"}
+    {"content": "lo", "finished": false, "model": "glm-4", "modelDone": true, "ttftMs": 412.3}
+    ...
+    {"content": "", "finished": true}
+
+A model's last chunk has ``modelDone`` and its time to first token since
+the comparison started. A model that fails ends with its error chunk and
+the others go on. With ``compareStopAfter`` the models still running once
+that many have succeeded are stopped and end with a ``CompareCancelled``
+error. One untagged finished chunk ends the stream.
+
+Every model has its own timings and usage record, so metrics and token
+accounting stay per model.
+"""
+import queue
+import time
+from functools import partial
+from typing import Callable, Dict, Generator, Iterator, List, Optional
+
+from common.deadline import Deadline
+from common.errors import error_chunk
+from common.metrics import StreamTimings
+from common.models import ChatStreamRequest, ChunkError, StreamChunk
+from common.usage import RequestUsage
+from config.model_mappings import get_model_type
+from services.chat.hedging import StreamPump
+
+CANCELLED = "CompareCancelled"
+
+StreamChat = Callable[[ChatStreamRequest, Deadline, Optional[StreamTimings], Optional[RequestUsage]],
+                      Iterator[StreamChunk]]
+
+
+class ModelRun:
+    """One model's stream within a comparison"""
+
+    def __init__(self, model: str, timings: Optional[StreamTimings], usage: Optional[RequestUsage]):
+        self.model = model
+        self.provider = get_model_type(model) or "unknown"
+        self.timings = timings
+        self.usage = usage
+        self.pump: Optional[StreamPump] = None
+        self.ttft_ms: Optional[float] = None
+        self.done = False
+
+    def chunk(self, content: str) -> StreamChunk:
+        if self.timings:
+            self.timings.on_chunk(len(content))
+        return StreamChunk(content=content, finished=False, model=self.model)
+
+    def end(self, content: str = "", error: Optional[ChunkError] = None, outcome: str = "ok") -> StreamChunk:
+        """Stop the model and build its last chunk"""
+        self.done = True
+        self.pump.cancel()
+        if self.timings:
+            self.timings.finish(outcome)
+        if self.usage:
+            self.usage.finish()
+        return StreamChunk(content=content, finished=False, error=error, model=self.model, modelDone=True,
+                           ttftMs=self.ttft_ms)
+
+
+class Comparison:
+    """Runs one request against several models and interleaves their chunks"""
+
+    def __init__(self, req: ChatStreamRequest, deadline: Deadline, timings: Optional[StreamTimings],
+                 usage: Optional[RequestUsage], stream_chat: StreamChat, max_models: int):
+        models = list(dict.fromkeys(req.compareModels))
+        if len(models) > max_models:
+            raise ValueError(f"At most {max_models} models can be compared")
+        self.req = req
+        self.deadline = deadline
+        self.stream_chat = stream_chat
+        self.stop_after = req.compareStopAfter or len(models)
+        self.out: "queue.Queue" = queue.Queue()
+        self.runs: Dict[StreamPump, ModelRun] = {}
+        self.models = models
+        self.succeeded = 0
+        self.started = 0.0
+        self.timings = timings
+        self.usage = usage
+        if timings:
+            timings.model = "compare"
+        if usage:
+            # Recorded per model instead
+            usage.discard()
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+        for model in self.models:
+            single = self.req.model_copy(update={"model": model, "compareModels": None, "compareStopAfter": None})
+            usage = self.usage
+            run = ModelRun(model, StreamTimings() if self.timings else None,
+                           RequestUsage(usage.user, self.req.messages, usage.aggregator) if usage else None)
+            run.pump = StreamPump(model, partial(self.stream_chat, single, self.deadline, run.timings, run.usage),
+                                  self.out)
+            self.runs[run.pump] = run
+            run.pump.start()
+
+    def running(self) -> List[ModelRun]:
+        return [run for run in self.runs.values() if not run.done]
+
+    def on_item(self, run: ModelRun, item) -> Generator[StreamChunk, None, None]:
+        """Chunks to send for one item from ``run``'s pump"""
+        if StreamPump.is_done(item):
+            # Ended without a finished chunk
+            yield run.end()
+            return
+        if isinstance(item, Exception):
+            item = error_chunk(item, run.provider)
+        if item.error is not None:
+            yield run.end(item.content, item.error, "error")
+            return
+        if run.ttft_ms is None and item.content:
+            run.ttft_ms = round((time.perf_counter() - self.started) * 1000.0, 1)
+        if not item.finished:
+            yield run.chunk(item.content)
+            return
+        if run.timings:
+            run.timings.on_chunk(len(item.content))
+        yield run.end(item.content)
+        self.succeeded += 1
+        if self.succeeded >= self.stop_after:
+            for other in self.running():
+                yield other.end(error=ChunkError(
+                    errorClass=CANCELLED, retryable=False, provider=other.provider,
+                    message=f"Stopped after {self.succeeded} of {len(self.runs)} models finished",
+                ), outcome="cancelled")
+
+    def stream(self) -> Generator[StreamChunk, None, None]:
+        try:
+            while self.running():
+                pump, item = self.out.get()
+                run = self.runs[pump]
+                if not run.done:
+                    yield from self.on_item(run, item)
+            yield StreamChunk(content="", finished=True)
+        finally:
+            # Client gone or stream closed: stop every model still running
+            for run in self.running():
+                run.end(outcome="cancelled")
+
+
+def compare_stream(req: ChatStreamRequest, deadline: Deadline, timings: Optional[StreamTimings],
+                   usage: Optional[RequestUsage], stream_chat: StreamChat) -> Generator[StreamChunk, None, None]:
+    """Stream ``req`` from every model in ``req.compareModels``, tagged by model"""
+    from config.app_settings import settings
+    comparison = Comparison(req, deadline, timings, usage, stream_chat, settings.compare_max_models)
+    comparison.start()
+    yield from comparison.stream()
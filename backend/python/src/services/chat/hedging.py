@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""Hedged streaming requests to cut tail time-to-first-token.
+
+When hedging is enabled, the primary upstream stream runs in a pump thread.
+If no chunk has arrived after a delay derived from the observed TTFT
+percentile of the model, a second attempt is started against the same or an
+alternate model. The first attempt to produce a chunk wins and the other one
+is cancelled. A token budget caps the extra upstream load.
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Generator, Iterator, List, Optional
+
+from common.models import StreamChunk
+from common.shared_state import SharedState, get_shared_state
+from models.http_pool import UpstreamCancel, current_cancel
+from services.chat.scoreboard import LatencyWindow
+
+logger = logging.getLogger(__name__)
+
+
+class HedgeBudget:
+    """Token bucket limiting hedges to a percentage of requests
+
+    Every request deposits ``percent / 100`` tokens and every hedge costs one
+    token, so in the long run hedges never exceed ``percent`` of traffic.
+    With the server's shared state the bucket covers all workers.
+    """
+
+    def __init__(self, percent: float, burst: float = 10.0, state: Optional[SharedState] = None):
+        self._ratio = max(0.0, percent) / 100.0
+        self._burst = burst
+        self._state = state or SharedState(slots=1)
+
+    def deposit(self) -> None:
+        self._state.add("hedge:budget", self._ratio, limit=self._burst)
+
+    def try_spend(self) -> bool:
+        return self._state.try_take("hedge:budget")
+
+
+class StreamPump:
+    """Runs one upstream attempt in a daemon thread, feeding a shared queue
+
+    ``cancel`` also aborts the attempt's upstream read, so a cancelled
+    attempt still waiting for its first byte gives back its thread,
+    connection and scheduler slot at once. A pump created while another
+    stream's UpstreamCancel is bound is cancelled with that stream.
+    """
+
+    _DONE = object()
+
+    def __init__(self, name: str, factory: Callable[[], Iterator[StreamChunk]], out: "queue.Queue"):
+        self.name = name
+        self._factory = factory
+        self._out = out
+        self._cancelled = threading.Event()
+        self.stream: Optional[Iterator[StreamChunk]] = None
+        self._upstream = UpstreamCancel()
+        self._thread = threading.Thread(target=self._upstream.call, args=(self._run,), name=f"hedge-{name}",
+                                        daemon=True)
+        parent = current_cancel()
+        if parent is not None:
+            parent.on_cancel(self.cancel)
+
+    def start(self) -> "StreamPump":
+        self._thread.start()
+        return self
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+        self._upstream.cancel()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def _run(self) -> None:
+        stream = None
+        try:
+            stream = self.stream = self._factory()
+            for chunk in stream:
+                if self._cancelled.is_set():
+                    break
+                self._out.put((self, chunk))
+        except Exception as e:
+            self._out.put((self, e))
+        finally:
+            if stream is not None and hasattr(stream, "close"):
+                try:
+                    stream.close()
+                except Exception:
+                    pass
+            self._out.put((self, self._DONE))
+
+    @classmethod
+    def is_done(cls, item) -> bool:
+        return item is cls._DONE
+
+
+class HedgePolicy:
+    """Decides when and where to send a hedged request"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        percentile: float = 95.0,
+        min_delay: float = 0.5,
+        max_delay: float = 5.0,
+        min_samples: int = 20,
+        budget_percent: float = 5.0,
+        alternates: Optional[Dict[str, str]] = None,
+        state: Optional[SharedState] = None,
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.alternates = alternates or {}
+        self.budget = HedgeBudget(budget_percent, state=state)
+        self._windows: Dict[str, LatencyWindow] = {}
+
+    @classmethod
+    def from_settings(cls, settings) -> "HedgePolicy":
+        return cls(
+            enabled=settings.hedge_enabled,
+            percentile=settings.hedge_delay_percentile,
+            min_delay=settings.hedge_min_delay_ms / 1000.0,
+            max_delay=settings.hedge_max_delay_ms / 1000.0,
+            budget_percent=settings.hedge_budget_percent,
+            alternates=settings.hedge_alternate_models,
+            state=get_shared_state(),
+        )
+
+    def record_ttft(self, model_id: str, seconds: float) -> None:
+        window = self._windows.get(model_id)
+        if window is None:
+            window = self._windows.setdefault(model_id, LatencyWindow())
+        window.add(seconds)
+
+    def hedge_delay(self, model_id: str) -> float:
+        """Delay before hedging, clamped to [min_delay, max_delay]
+
+        Falls back to ``max_delay`` until enough TTFT samples are known, so a
+        cold model is hedged conservatively.
+        """
+        window = self._windows.get(model_id)
+        if window is None or len(window) < self.min_samples:
+            return self.max_delay
+        return min(self.max_delay, max(self.min_delay, window.percentile(self.percentile)))
+
+    def alternate_for(self, model_id: str) -> str:
+        return self.alternates.get(model_id, model_id)
+
+    def stream(
+        self,
+        model_id: str,
+        open_stream: Callable[[str], Iterator[StreamChunk]],
+        on_winner: Optional[Callable[[Iterator[StreamChunk]], None]] = None,
+    ) -> Generator[StreamChunk, None, None]:
+        """Stream from ``model_id``, hedging once if the first chunk is late
+
+        ``on_winner`` is called with the stream ``open_stream`` returned for
+        the attempt whose chunks are passed on.
+        """
+        self.budget.deposit()
+        out: "queue.Queue" = queue.Queue()
+        started = time.perf_counter()
+        pumps: List[StreamPump] = [
+            StreamPump("primary", lambda: open_stream(model_id), out).start()
+        ]
+        winner: Optional[StreamPump] = None
+        hedged = False
+
+        try:
+            while True:
+                if winner is None and not hedged:
+                    timeout = self.hedge_delay(model_id) - (time.perf_counter() - started)
+                    try:
+                        pump, item = out.get(timeout=max(0.0, timeout))
+                    except queue.Empty:
+                        hedged = True
+                        if self.budget.try_spend():
+                            hedge_model = self.alternate_for(model_id)
+                            logger.info("Hedge: no first token from %s, hedging to %s", model_id, hedge_model)
+                            pumps.append(StreamPump("hedge", lambda: open_stream(hedge_model), out).start())
+                        continue
+                else:
+                    pump, item = out.get()
+
+                if winner is None:
+                    if pump not in pumps:
+                        continue
+                    failed = (
+                        StreamPump.is_done(item)
+                        or isinstance(item, Exception)
+                        or getattr(item, "error", None) is not None
+                    )
+                    if failed and len(pumps) > 1:
+                        # One attempt failed before producing output, keep waiting for the other.
+                        pump.cancel()
+                        pumps.remove(pump)
+                        continue
+                    winner = pump
+                    if on_winner is not None and pump.stream is not None:
+                        on_winner(pump.stream)
+                    if isinstance(item, StreamChunk) and item.error is None:
+                        self.record_ttft(model_id, time.perf_counter() - started)
+                    for other in pumps:
+                        if other is not winner:
+                            other.cancel()
+
+                if pump is not winner:
+                    continue
+                if StreamPump.is_done(item):
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            for pump in pumps:
+                pump.cancel()
@@ -0,0 +1,509 @@
+# -*- coding: utf-8 -*-
+"""Asynchronous chat jobs for long generations (``/api/jobs``).
+
+A client that does not need live tokens submits a job and disconnects;
+it polls for the status and reads the text by offset, or receives the
+final status on a webhook. Jobs live in a SQLite table (DB_SQLITE_PATH)
+shared by every worker process, so they survive restarts.
+
+Each process runs a dispatcher with JOB_WORKERS slots. It claims the next
+job in one ``BEGIN IMMEDIATE`` transaction, so two processes never run the
+same job. The next job comes from the highest priority class with runnable
+jobs, then from the tenant with the fewest jobs running, then first come
+first served. A tenant never runs more than JOB_TENANT_MAX_RUNNING jobs at
+once. A job with ``notBefore`` waits until then, for off-peak scheduling.
+
+Jobs run through the same pipeline as ``/api/chat/stream``. The text so
+far is saved every JOB_PROGRESS_INTERVAL_SECONDS and the dispatcher
+heartbeats its running jobs. A running job whose worker stopped
+heartbeating for JOB_STALE_SECONDS (crash, restart) is queued again and
+runs from the start, with ``attempt`` incremented. Cancelling a running
+job marks it ``cancelling`` until the worker running it, in whichever
+process, stops it. On shutdown no new jobs are claimed; jobs still running
+after the drain are queued again.
+
+A ``webhookUrl`` must be https and resolve to public addresses only, unless
+its host is in JOB_WEBHOOK_ALLOWED_HOSTS; it is checked on submit and again
+on delivery, which connects to the checked address and follows no
+redirects.
+"""
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from common.deadline import Deadline
+from common.drain import get_stream_drain
+from common.metrics import StreamTimings
+from common.models import ChatStreamRequest, ChunkError, StreamChunk
+from common.tracing import get_tracer
+from common.usage import RequestUsage
+from services.chat.scheduler import BULK, with_default_priority
+
+logger = logging.getLogger(__name__)
+
+# Priority class -> sort order (lower runs first)
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+PRIORITY_NAMES = {order: name for name, order in PRIORITIES.items()}
+
+QUEUED, RUNNING, CANCELLING = "queued", "running", "cancelling"
+SUCCEEDED, FAILED, CANCELLED = "succeeded", "failed", "cancelled"
+TERMINAL = (SUCCEEDED, FAILED, CANCELLED)
+
+# Webhook delivery attempts and the wait before each retry
+WEBHOOK_ATTEMPTS = 3
+WEBHOOK_BACKOFF_SECONDS = 1.0
+
+
+class WebhookRejected(ValueError):
+    """The webhook URL points somewhere jobs may not POST to"""
+
+
+def webhook_address(url: str, allowed_hosts: List[str]) -> Optional[str]:
+    """Check ``url`` as a job webhook; returns the address to deliver to
+
+    Hosts in ``allowed_hosts`` are trusted, over http or https, and give
+    None. Any other URL must be https and its host must resolve to public
+    addresses only (no private, loopback or link-local ones); the first is
+    returned so delivery connects to the address that was checked.
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or not host:
+        raise WebhookRejected("webhookUrl must be an http(s) URL")
+    if host in allowed_hosts:
+        return None
+    if parts.scheme != "https":
+        raise WebhookRejected("webhookUrl must use https")
+    try:
+        infos = socket.getaddrinfo(host, parts.port or 443, type=socket.SOCK_STREAM)
+    except OSError as e:
+        raise WebhookRejected(f"webhookUrl host {host} does not resolve") from e
+    addresses = [ipaddress.ip_address(info[4][0].split("%")[0]) for info in infos]
+    for address in addresses:
+        if not (getattr(address, "ipv4_mapped", None) or address).is_global:
+            raise WebhookRejected(f"webhookUrl host {host} resolves to a non-public address")
+    return str(addresses[0])
+
+
+def job_view(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Public status of a job row"""
+    view = {
+        "id": row["id"],
+        "status": row["status"],
+        "priority": PRIORITY_NAMES.get(row["priority"], "normal"),
+        "tenant": row["tenant"],
+        "attempt": row["attempt"],
+        "createdAt": row["created_at"],
+        "notBefore": row["not_before"],
+        "startedAt": row["started_at"],
+        "finishedAt": row["finished_at"],
+        "contentLength": len(row["content"] or ""),
+    }
+    if row["error"]:
+        view["error"] = json.loads(row["error"])
+    return view
+
+
+class SQLiteJobStore:
+    """Job rows in a local SQLite file, shared by every worker process"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def connect(self):
+        # Autocommit; transactions are opened explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self.connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def setup(self) -> None:
+        conn = self.connect()
+        try:
+            # Readers (status polls) do not block the writer
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_jobs ("
+                "id TEXT PRIMARY KEY, tenant TEXT NOT NULL, priority INTEGER NOT NULL, status TEXT NOT NULL, "
+                "request TEXT NOT NULL, webhook_url TEXT, not_before REAL NOT NULL, created_at REAL NOT NULL, "
+                "started_at REAL, finished_at REAL, heartbeat_at REAL, worker TEXT, "
+                "attempt INTEGER NOT NULL DEFAULT 0, content TEXT NOT NULL DEFAULT '', error TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS chat_jobs_queue ON chat_jobs (status, priority, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS chat_jobs_tenant ON chat_jobs (tenant, status)")
+        finally:
+            conn.close()
+
+    def insert(self, row: Dict[str, Any]) -> None:
+        columns = ", ".join(row)
+        with self._transaction() as conn:
+            conn.execute(f"INSERT INTO chat_jobs ({columns}) VALUES ({', '.join('?' * len(row))})",
+                         tuple(row.values()))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        conn = self.connect()
+        try:
+            row = conn.execute("SELECT * FROM chat_jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row else None
+
+    def claim(self, worker: str, now: float, tenant_limit: int) -> Optional[Dict[str, Any]]:
+        """Mark the next runnable job as running on ``worker`` and return it"""
+        with self._transaction() as conn:
+            row = conn.execute(
+                "WITH busy AS (SELECT tenant, COUNT(*) AS n FROM chat_jobs "
+                "WHERE status IN ('running', 'cancelling') GROUP BY tenant) "
+                "SELECT j.id FROM chat_jobs AS j LEFT JOIN busy AS b ON b.tenant = j.tenant "
+                "WHERE j.status = 'queued' AND j.not_before <= ? AND COALESCE(b.n, 0) < ? "
+                "ORDER BY j.priority, COALESCE(b.n, 0), j.created_at LIMIT 1",
+                (now, tenant_limit),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE chat_jobs SET status = 'running', worker = ?, started_at = ?, heartbeat_at = ?, "
+                "attempt = attempt + 1, content = '', error = NULL WHERE id = ?",
+                (worker, now, now, row["id"]),
+            )
+            return dict(conn.execute("SELECT * FROM chat_jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    def progress(self, job_id: str, content: str) -> Optional[str]:
+        """Save the text so far; returns the job's status (``cancelling`` asks the worker to stop)"""
+        with self._transaction() as conn:
+            conn.execute("UPDATE chat_jobs SET content = ? WHERE id = ?", (content, job_id))
+            row = conn.execute("SELECT status FROM chat_jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["status"] if row else None
+
+    def heartbeat(self, job_ids: List[str], now: float) -> List[str]:
+        """Mark ``job_ids`` as alive; returns those asked to stop"""
+        with self._transaction() as conn:
+            conn.executemany("UPDATE chat_jobs SET heartbeat_at = ? WHERE id = ?", [(now, i) for i in job_ids])
+            rows = conn.execute(
+                f"SELECT id FROM chat_jobs WHERE status = 'cancelling' AND id IN ({', '.join('?' * len(job_ids))})",
+                job_ids,
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def finish(self, job_id: str, status: str, content: str, error: Optional[Dict[str, Any]],
+               now: float) -> Optional[Dict[str, Any]]:
+        """Record the outcome of a run; a job cancelled meanwhile stays cancelled"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE chat_jobs SET status = CASE WHEN status = 'cancelling' THEN 'cancelled' ELSE ? END, "
+                "content = ?, error = ?, finished_at = ?, worker = NULL "
+                "WHERE id = ? AND status IN ('running', 'cancelling')",
+                (status, content, json.dumps(error) if error else None, now, job_id),
+            )
+            row = conn.execute("SELECT * FROM chat_jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def requeue(self, job_ids: List[str]) -> None:
+        """Queue running jobs again (a cancelled one ends as cancelled)"""
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE chat_jobs SET status = CASE WHEN status = 'cancelling' THEN 'cancelled' ELSE 'queued' END, "
+                "worker = NULL WHERE id = ? AND status IN ('running', 'cancelling')",
+                [(i,) for i in job_ids],
+            )
+
+    def cancel(self, job_id: str, now: float) -> Optional[Dict[str, Any]]:
+        """Cancel a queued job, or ask the worker running it to stop"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE chat_jobs SET finished_at = CASE WHEN status = 'queued' THEN ? ELSE finished_at END, "
+                "status = CASE status WHEN 'queued' THEN 'cancelled' WHEN 'running' THEN 'cancelling' "
+                "ELSE status END WHERE id = ?",
+                (now, job_id),
+            )
+            row = conn.execute("SELECT * FROM chat_jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def recover(self, stale_before: float, finished_before: float) -> int:
+        """Requeue jobs of workers that stopped heartbeating; drop old finished jobs"""
+        with self._transaction() as conn:
+            recovered = conn.execute(
+                "UPDATE chat_jobs SET status = CASE WHEN status = 'cancelling' THEN 'cancelled' ELSE 'queued' END, "
+                "worker = NULL WHERE status IN ('running', 'cancelling') AND heartbeat_at < ?",
+                (stale_before,),
+            ).rowcount
+            conn.execute(
+                "DELETE FROM chat_jobs WHERE status IN ('succeeded', 'failed', 'cancelled') AND finished_at < ?",
+                (finished_before,),
+            )
+        return recovered
+
+
+class JobQueue:
+    """Dispatcher and worker slots for the jobs of one process"""
+
+    def __init__(self, store: SQLiteJobStore, workers: int = 4, tenant_limit: int = 2,
+                 poll_interval: float = 1.0, progress_interval: float = 1.0, stale_seconds: float = 60.0,
+                 retention_seconds: float = 72 * 3600.0, webhook_allowed_hosts: Optional[List[str]] = None):
+        self.store = store
+        self.workers = workers
+        self.tenant_limit = tenant_limit
+        self.poll_interval = poll_interval
+        self.progress_interval = progress_interval
+        self.stale_seconds = stale_seconds
+        self.retention_seconds = retention_seconds
+        self.webhook_allowed_hosts = [host.lower() for host in webhook_allowed_hosts or []]
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._ready = False
+        self._setup_lock = threading.Lock()
+        self._running: Dict[str, asyncio.Task] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        # Webhook deliveries in flight; referenced so they are not collected
+        self._deliveries: set = set()
+        self._stopping = False
+
+    def _setup(self) -> None:
+        if not self._ready:
+            with self._setup_lock:
+                if not self._ready:
+                    self.store.setup()
+                    self._ready = True
+
+    def _notify(self) -> None:
+        """Wake the dispatcher, from any thread or event loop"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    # -- API ---------------------------------------------------------------
+
+    async def submit(self, request: ChatStreamRequest, tenant: str, priority: str = "normal",
+                     not_before: Optional[float] = None, webhook_url: Optional[str] = None) -> Dict[str, Any]:
+        if webhook_url:
+            # Raises WebhookRejected
+            await asyncio.to_thread(webhook_address, webhook_url, self.webhook_allowed_hosts)
+        now = time.time()
+        # Jobs run behind live chats and batches unless the request says otherwise
+        request = with_default_priority(request, BULK)
+        row = {
+            "id": uuid.uuid4().hex,
+            "tenant": tenant,
+            "priority": PRIORITIES[priority],
+            "status": QUEUED,
+            "request": request.model_dump_json(exclude_none=True),
+            "webhook_url": webhook_url,
+            "not_before": max(now, not_before or now),
+            "created_at": now,
+        }
+        await asyncio.to_thread(self._setup)
+        await asyncio.to_thread(self.store.insert, row)
+        self._notify()
+        return job_view({**row, "attempt": 0, "started_at": None, "finished_at": None, "content": "", "error": None})
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The full job row, or None"""
+        await asyncio.to_thread(self._setup)
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        await asyncio.to_thread(self._setup)
+        row = await asyncio.to_thread(self.store.cancel, job_id, time.time())
+        task = self._running.get(job_id)
+        if task is not None and self._loop is not None:
+            # Running here: stop it now instead of at the next progress save
+            self._loop.call_soon_threadsafe(task.cancel)
+        return row
+
+    # -- Lifecycle -------------------------------------------------------------
+
+    async def start(self) -> None:
+        if self._dispatcher is not None or self.workers <= 0:
+            return
+        await asyncio.to_thread(self._setup)
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self) -> None:
+        """Stop claiming jobs; jobs still running are queued again"""
+        self._stopping = True
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _dispatch(self) -> None:
+        drain = get_stream_drain()
+        next_recovery = 0.0
+        while True:
+            now = time.time()
+            if now >= next_recovery:
+                next_recovery = now + self.stale_seconds / 2
+                try:
+                    recovered = await asyncio.to_thread(
+                        self.store.recover, now - self.stale_seconds, now - self.retention_seconds)
+                    if recovered:
+                        logger.warning("Jobs: requeued %d jobs of stopped workers", recovered)
+                except sqlite3.Error as e:
+                    logger.warning("Jobs: recovery failed: %s", e)
+
+            job = None
+            if len(self._running) < self.workers and not drain.draining:
+                try:
+                    job = await asyncio.to_thread(self.store.claim, self.worker_id, now, self.tenant_limit)
+                except sqlite3.Error as e:
+                    logger.warning("Jobs: claim failed: %s", e)
+            if job is not None:
+                self._running[job["id"]] = asyncio.create_task(self._run(job))
+                continue
+
+            if self._running:
+                try:
+                    # Also stops jobs cancelled through another process
+                    for job_id in await asyncio.to_thread(self.store.heartbeat, list(self._running), now):
+                        if job_id in self._running:
+                            self._running[job_id].cancel()
+                except sqlite3.Error as e:
+                    logger.warning("Jobs: heartbeat failed: %s", e)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        # The streaming pipeline shared with the HTTP endpoint
+        from api.endpoints.chat_endpoint import aiter_stream, encoded_stream
+
+        job_id = job["id"]
+        parts: List[str] = []
+        errors: List[ChunkError] = []
+
+        def collect(chunk: StreamChunk) -> bytes:
+            if chunk.error is not None:
+                errors.append(chunk.error)
+                return b""
+            parts.append(chunk.content)
+            return chunk.content.encode("utf-8")
+
+        status = SUCCEEDED
+        try:
+            req = ChatStreamRequest(**json.loads(job["request"]))
+            timings = StreamTimings()
+            span = get_tracer().start_request_span("JOB /api/jobs", None, timings.started)
+            usage = RequestUsage(job["tenant"], req.messages)
+            stream = aiter_stream(encoded_stream(req, Deadline.from_request(req.timeoutMs), timings, usage, span,
+                                                 encode=collect))
+            try:
+                saved_at = time.monotonic()
+                async for _ in stream:
+                    if time.monotonic() - saved_at >= self.progress_interval:
+                        saved_at = time.monotonic()
+                        if await asyncio.to_thread(self.store.progress, job_id, "".join(parts)) == CANCELLING:
+                            status = CANCELLED
+                            break
+            finally:
+                await stream.aclose()
+        except asyncio.CancelledError:
+            if self._stopping:
+                await asyncio.to_thread(self.store.requeue, [job_id])
+                self._running.pop(job_id, None)
+                return
+            status = CANCELLED
+        except Exception as e:
+            logger.exception("Jobs: job %s failed to run: %s", job_id, e)
+            status = FAILED
+            errors.append(ChunkError(errorClass=type(e).__name__, retryable=False, provider="unknown", message=str(e)))
+
+        error = errors[-1] if errors else None
+        if error is not None and error.errorClass == "ServerDraining":
+            # Cut by the shutdown drain deadline: another worker picks it up
+            await asyncio.to_thread(self.store.requeue, [job_id])
+            self._running.pop(job_id, None)
+            return
+        if error is not None and status == SUCCEEDED:
+            status = FAILED
+        row = await asyncio.to_thread(self.store.finish, job_id, status, "".join(parts),
+                                      error.model_dump() if error else None, time.time())
+        self._running.pop(job_id, None)
+        self._wake.set()
+        if row is not None and row["webhook_url"]:
+            delivery = asyncio.create_task(self._deliver(row["webhook_url"], job_view(row)))
+            self._deliveries.add(delivery)
+            delivery.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, url: str, payload: Dict[str, Any]) -> None:
+        """POST the final status to the job's webhook, retrying transient failures"""
+        import httpx
+
+        try:
+            # Checked again: the host may resolve elsewhere than on submit
+            address = await asyncio.to_thread(webhook_address, url, self.webhook_allowed_hosts)
+        except WebhookRejected as e:
+            logger.warning("Jobs: not delivering the webhook for job %s: %s", payload["id"], e)
+            return
+        target = httpx.URL(url)
+        headers: Dict[str, str] = {}
+        extensions: Dict[str, Any] = {}
+        if address is not None:
+            # Connect to the checked address; Host and TLS still use the host name
+            headers["Host"] = target.netloc.decode("ascii")
+            extensions["sni_hostname"] = target.host
+            target = target.copy_with(host=address)
+        async with httpx.AsyncClient(timeout=10.0, follow_redirects=False) as client:
+            for attempt in range(WEBHOOK_ATTEMPTS):
+                try:
+                    response = await client.post(target, json=payload, headers=headers, extensions=extensions)
+                    if response.status_code < 500:
+                        return
+                except httpx.HTTPError as e:
+                    logger.debug("Jobs: webhook for %s failed: %s", payload["id"], e)
+                await asyncio.sleep(WEBHOOK_BACKOFF_SECONDS * 2 ** attempt)
+        logger.warning("Jobs: gave up delivering the webhook for job %s", payload["id"])
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide job queue built lazily from settings"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                from config.app_settings import settings
+                _queue = JobQueue(
+                    SQLiteJobStore(settings.db_sqlite_path),
+                    workers=settings.job_workers,
+                    tenant_limit=settings.job_tenant_max_running,
+                    poll_interval=settings.job_poll_interval_seconds,
+                    progress_interval=settings.job_progress_interval_seconds,
+                    stale_seconds=settings.job_stale_seconds,
+                    retention_seconds=settings.job_retention_hours * 3600.0,
+                    webhook_allowed_hosts=settings.job_webhook_allowed_hosts,
+                )
+    return _queue
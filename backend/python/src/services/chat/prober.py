@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Background prober keeping scoreboard data fresh for idle models.
+
+Models that served real traffic recently are skipped; only models idle for
+longer than the probe interval receive a one-token request, so probing adds
+almost no upstream load while routing still sees current latencies.
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from config.model_mappings import get_model_type
+from models.registry import create_model
+from services.chat.routing import routable_models
+from services.chat.scoreboard import Scoreboard, get_scoreboard
+
+logger = logging.getLogger(__name__)
+
+PROBE_MESSAGES = [{"sender": "user", "content": "ping"}]
+
+
+class HealthProber:
+    """Periodically probes idle routable models"""
+
+    def __init__(self, interval: float, scoreboard: Optional[Scoreboard] = None, settings=None):
+        self.interval = interval
+        self.scoreboard = scoreboard or get_scoreboard()
+        self._settings = settings
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def settings(self):
+        if self._settings is None:
+            from config.app_settings import settings
+            self._settings = settings
+        return self._settings
+
+    def probe(self, model_id: str) -> None:
+        """Send a one-token request through the scoreboard"""
+        model = create_model(get_model_type(model_id), model_id)
+        stream = model.stream_chat(messages=PROBE_MESSAGES, max_tokens=1)
+        for _ in self.scoreboard.observe(model_id, stream):
+            pass
+
+    def probe_idle_models(self) -> int:
+        """Probe every routable model idle for longer than the interval"""
+        probed = 0
+        now = time.time()
+        for model in routable_models(self.settings):
+            if now - self.scoreboard.last_seen(model.id) < self.interval:
+                continue
+            try:
+                self.probe(model.id)
+                probed += 1
+            except Exception as e:
+                logger.warning(f"HealthProber: probe of {model.id} failed: {str(e)}")
+        return probed
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.probe_idle_models)
+            except Exception as e:
+                logger.error(f"HealthProber: probe round failed: {str(e)}")
+
+    def start(self) -> None:
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+            logger.info(f"HealthProber: probing idle models every {self.interval:.0f}s")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
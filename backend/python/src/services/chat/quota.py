@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Per-API-key request quotas for upstream providers.
+
+PROVIDER_RATE_LIMITS caps requests per minute for each provider API key
+(models.json ``envKey``). The limit is a token bucket in the server's shared
+state, so it holds across all workers; a request over the limit fails fast
+with a retryable error instead of being rejected by the provider.
+"""
+from typing import Dict, Optional
+
+from common.shared_state import SharedState, get_shared_state
+
+
+class QuotaExceeded(ConnectionError):
+    """The provider API key is at its configured request rate; retry later"""
+
+
+class ProviderQuota:
+    """Requests-per-minute limits keyed by API key environment variable"""
+
+    def __init__(self, limits: Optional[Dict[str, float]] = None, state: Optional[SharedState] = None):
+        self.limits = limits or {}
+        self.state = state or SharedState(slots=max(1, len(self.limits) * 2))
+        self._key_envs: Dict[str, str] = {}
+
+    @classmethod
+    def from_settings(cls, settings) -> "ProviderQuota":
+        return cls(settings.provider_rate_limits, get_shared_state())
+
+    def _key_env(self, model_id: str) -> str:
+        env = self._key_envs.get(model_id)
+        if env is None:
+            from config.app_settings import settings
+            config = settings.get_model_by_id(model_id)
+            env = self._key_envs[model_id] = (config.env_key if config else "") or ""
+        return env
+
+    def acquire(self, model_id: Optional[str]) -> None:
+        """Count one request against the model's API key; raises QuotaExceeded"""
+        if not self.limits or not model_id:
+            return
+        env = self._key_env(model_id)
+        per_minute = self.limits.get(env)
+        if not per_minute:
+            return
+        if not self.state.take_token(f"quota:{env}", per_minute / 60.0, max(1.0, per_minute)):
+            raise QuotaExceeded(f"Rate limit of {per_minute:g} requests/min for {env} reached")
+
+
+_quota: Optional[ProviderQuota] = None
+
+
+def get_provider_quota() -> ProviderQuota:
+    """Process-wide quota built lazily from settings"""
+    global _quota
+    if _quota is None:
+        from config.app_settings import settings
+        _quota = ProviderQuota.from_settings(settings)
+    return _quota
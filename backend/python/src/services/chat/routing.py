@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Latency-aware resolution of routed model ids such as ``auto``.
+
+A routed id names a routing group from models.json (``auto`` is always
+available and spans every routable model), optionally followed by a
+capability class taken from model ``features``, e.g. ``auto:long-context``.
+The group resolves to the healthy member with the lowest median TTFT
+divided by its configured weight.
+"""
+from typing import Dict, List, Optional
+
+from config.app_settings import ModelConfig
+from models.registry import SUPPORTED_MODEL_TYPES
+from services.chat.scoreboard import Scoreboard, get_scoreboard
+
+AUTO_MODEL_ID = "auto"
+
+# TTFT assumed for models without samples, low enough that they get explored
+DEFAULT_TTFT_PRIOR = 1.0
+
+
+def routable_models(settings) -> List[ModelConfig]:
+    """Enabled models with an API key whose provider can be instantiated"""
+    return [
+        model for model in settings.models_config.models
+        if model.enabled
+        and model.type in SUPPORTED_MODEL_TYPES
+        and settings.has_api_key_for_env(model.env_key)
+    ]
+
+
+def is_routed_model(model_id: Optional[str], settings=None) -> bool:
+    """Whether ``model_id`` names a routing group rather than a concrete model"""
+    if not model_id:
+        return False
+    if settings is None:
+        from config.app_settings import settings
+    group = model_id.split(":", 1)[0]
+    return group == AUTO_MODEL_ID or group in settings.models_config.routing_groups
+
+
+def resolve_model(
+    model_id: Optional[str],
+    thinking: bool = False,
+    settings=None,
+    scoreboard: Optional[Scoreboard] = None,
+) -> Optional[str]:
+    """Resolve a routed model id to the currently fastest healthy model
+
+    Args:
+        model_id: Requested model id, e.g. 'auto', 'auto:thinking' or 'glm-4'
+        thinking: Whether thinking mode was requested, implies the 'thinking'
+            capability when the group has such models
+        settings: AppSettings instance, defaults to the global settings
+        scoreboard: Scoreboard instance, defaults to the process scoreboard
+
+    Returns:
+        A concrete model id; non-routed ids are returned unchanged
+
+    Raises:
+        ValueError: If no routable model matches the group and capability
+    """
+    if settings is None:
+        from config.app_settings import settings
+    if not is_routed_model(model_id, settings):
+        return model_id
+    scoreboard = scoreboard or get_scoreboard()
+
+    group_name, _, capability = model_id.partition(":")
+    group = settings.models_config.routing_groups.get(group_name, {})
+    weights: Optional[Dict[str, float]] = group.get("models")
+
+    candidates = [
+        model for model in routable_models(settings)
+        if weights is None or model.id in weights
+    ]
+    if capability:
+        candidates = [model for model in candidates if capability in model.features]
+    elif thinking:
+        thinking_models = [model for model in candidates if "thinking" in model.features]
+        candidates = thinking_models or candidates
+
+    if not candidates:
+        raise ValueError(f"No routable model available for '{model_id}'")
+
+    healthy = [model for model in candidates if scoreboard.is_healthy(model.id)] or candidates
+
+    def cost(model: ModelConfig) -> float:
+        weight = float(weights.get(model.id, 1.0)) if weights else 1.0
+        return scoreboard.ttft_estimate(model.id, DEFAULT_TTFT_PRIOR) / max(weight, 1e-6)
+
+    return min(healthy, key=cost).id
+
+
+def routing_groups_summary(settings=None) -> Dict[str, Dict]:
+    """Routing groups with their currently resolved model, for /api/chat/models"""
+    if settings is None:
+        from config.app_settings import settings
+    summary = {}
+    for name in [AUTO_MODEL_ID] + [g for g in settings.models_config.routing_groups if g != AUTO_MODEL_ID]:
+        group = settings.models_config.routing_groups.get(name, {})
+        try:
+            resolved = resolve_model(name, settings=settings)
+        except ValueError:
+            resolved = None
+        summary[name] = {
+            "description": group.get("description", ""),
+            "models": group.get("models", {}),
+            "resolvedModel": resolved,
+        }
+    return summary
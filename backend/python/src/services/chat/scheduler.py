@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""Priority scheduling of upstream streams between traffic classes.
+
+Every ``ChatStreamRequest`` has a ``priority`` class: ``interactive``
+(live chat, the default), ``background`` (batches) or ``bulk`` (async
+jobs). With SCHEDULER_CAPACITY set, a request waits for one of that many
+upstream stream slots per provider before the provider is called:
+
+- Slots are handed out weighted-fair between the classes with waiting
+  requests (SCHEDULER_WEIGHTS, stride scheduling). Under contention each
+  class gets its weight's share of the freed slots; an idle class's share
+  goes to the others.
+- SCHEDULER_INTERACTIVE_RESERVED_PERCENT of the slots are only used by
+  interactive requests, so a backlog of batch work never leaves a live
+  chat without a slot.
+- Queued requests hold no slot: an interactive request arriving behind a
+  queue of background work is served ahead of it. Streams that are already
+  running are never interrupted.
+
+A request waits at most until its deadline, then fails with
+DeadlineExceeded. The limits are per worker process; wait times are
+recorded per provider and class as ``chat_scheduler_wait_seconds``.
+
+The wait blocks the thread running the stream's first step. Async callers
+(see ``aiter_stream``) run that step on the scheduler's own executor of
+SCHEDULER_ADMISSION_THREADS threads, never on the event loop's worker
+threads: those also carry every chunk of the streams holding slots, and
+with all of them stuck in the queue no stream could finish and free its
+slot.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Iterator, Optional
+
+from common.deadline import Deadline, DeadlineExceeded
+from common.metrics import MetricsRegistry, metrics
+from common.models import ChatStreamRequest, StreamChunk
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+BULK = "bulk"
+# Also the tie-break order between classes
+PRIORITY_CLASSES = (INTERACTIVE, BACKGROUND, BULK)
+
+
+def with_default_priority(req: ChatStreamRequest, priority: str) -> ChatStreamRequest:
+    """``req`` in class ``priority`` unless the caller chose a class"""
+    if "priority" in req.model_fields_set:
+        return req
+    return req.model_copy(update={"priority": priority})
+
+
+class _Waiter:
+    __slots__ = ("event", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class ProviderLane:
+    """Slots of one provider and the requests waiting for them"""
+
+    def __init__(self, capacity: int, reserved: int, weights: Dict[str, float]):
+        self.capacity = capacity
+        self.reserved = min(reserved, capacity - 1)
+        self.weights = weights
+        self.in_use = 0
+        self.queues: Dict[str, Deque[_Waiter]] = {name: deque() for name in PRIORITY_CLASSES}
+        # Stride scheduling: a class's pass advances by 1/weight per grant and
+        # the waiting class with the lowest pass goes next
+        self.passes: Dict[str, float] = {name: 0.0 for name in PRIORITY_CLASSES}
+        self.virtual_time = 0.0
+        self.lock = threading.Lock()
+
+    def limit(self, priority: str) -> int:
+        return self.capacity if priority == INTERACTIVE else self.capacity - self.reserved
+
+    def enqueue(self, priority: str) -> _Waiter:
+        """Queue a waiter and hand out free slots; call with the lock held"""
+        queue = self.queues[priority]
+        if not queue:
+            # A class that was idle does not bank credit for the time it waited
+            self.passes[priority] = max(self.passes[priority], self.virtual_time)
+        waiter = _Waiter()
+        queue.append(waiter)
+        self.dispatch()
+        return waiter
+
+    def dispatch(self) -> None:
+        """Grant free slots to waiting requests; call with the lock held"""
+        while True:
+            ready = [name for name in PRIORITY_CLASSES if self.queues[name] and self.in_use < self.limit(name)]
+            if not ready:
+                return
+            # min() keeps the first of equal passes, i.e. the higher class
+            name = min(ready, key=self.passes.__getitem__)
+            waiter = self.queues[name].popleft()
+            self.virtual_time = self.passes[name]
+            self.passes[name] += 1.0 / self.weights[name]
+            self.in_use += 1
+            waiter.granted = True
+            waiter.event.set()
+
+    def release(self) -> None:
+        with self.lock:
+            self.in_use -= 1
+            self.dispatch()
+
+
+class PriorityScheduler:
+    """Per-provider upstream slots shared out between priority classes"""
+
+    def __init__(self, capacity: int = 0, provider_capacity: Optional[Dict[str, int]] = None,
+                 weights: Optional[Dict[str, float]] = None, reserved_percent: float = 25.0,
+                 registry: MetricsRegistry = metrics, admission_threads: int = 256):
+        self.capacity = capacity
+        self.provider_capacity = provider_capacity or {}
+        self.weights = {INTERACTIVE: 8.0, BACKGROUND: 2.0, BULK: 1.0}
+        self.weights.update({name: max(0.01, weight) for name, weight in (weights or {}).items()
+                             if name in PRIORITY_CLASSES})
+        self.reserved_percent = reserved_percent
+        self.registry = registry
+        self.admission_threads = admission_threads
+        self._lanes: Dict[str, Optional[ProviderLane]] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings) -> "PriorityScheduler":
+        return cls(
+            capacity=settings.scheduler_capacity,
+            provider_capacity=settings.scheduler_provider_capacity,
+            weights=settings.scheduler_weights,
+            reserved_percent=settings.scheduler_interactive_reserved_percent,
+            admission_threads=settings.scheduler_admission_threads,
+        )
+
+    def admission_executor(self) -> Optional[ThreadPoolExecutor]:
+        """Executor for first stream steps, which may wait for a slot; None when nothing is scheduled"""
+        if self.capacity <= 0 and not any(limit > 0 for limit in self.provider_capacity.values()):
+            return None
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.admission_threads, thread_name_prefix="admission")
+        return self._executor
+
+    def lane(self, provider: str) -> Optional[ProviderLane]:
+        """The provider's lane, or None when it is not scheduled"""
+        try:
+            return self._lanes[provider]
+        except KeyError:
+            pass
+        with self._lock:
+            if provider not in self._lanes:
+                capacity = self.provider_capacity.get(provider, self.capacity)
+                reserved = int(capacity * self.reserved_percent / 100.0 + 0.5)
+                self._lanes[provider] = ProviderLane(capacity, reserved, self.weights) if capacity > 0 else None
+            return self._lanes[provider]
+
+    def acquire(self, lane: ProviderLane, provider: str, priority: str, deadline: Deadline) -> None:
+        """Wait for a slot of ``lane``; raises DeadlineExceeded"""
+        started = time.perf_counter()
+        with lane.lock:
+            waiter = lane.enqueue(priority)
+        if not waiter.granted and not waiter.event.wait(deadline.remaining()):
+            with lane.lock:
+                if not waiter.granted:
+                    lane.queues[priority].remove(waiter)
+            if not waiter.granted:
+                self.registry.counter("chat_scheduler_timeouts_total", "Requests whose deadline passed in the queue",
+                                      provider=provider, priority=priority).inc()
+                raise DeadlineExceeded(f"Request deadline exceeded waiting for a {provider} slot ({priority})")
+        self.registry.histogram("chat_scheduler_wait_seconds", "Time queued for an upstream slot",
+                                provider=provider, priority=priority).observe(time.perf_counter() - started)
+
+    def admit(self, provider: str, priority: Optional[str], deadline: Deadline,
+              start: Callable[[], Iterator[StreamChunk]]) -> Iterator[StreamChunk]:
+        """Stream from ``start()`` once the request has a slot
+
+        The slot is taken when iteration begins and returned when the stream
+        ends or is closed. Unscheduled providers call ``start`` right away.
+        """
+        lane = self.lane(provider)
+        if lane is None:
+            return start()
+        return self._admitted(lane, provider, priority if priority in self.weights else INTERACTIVE, deadline, start)
+
+    def _admitted(self, lane: ProviderLane, provider: str, priority: str, deadline: Deadline,
+                  start: Callable[[], Iterator[StreamChunk]]) -> Iterator[StreamChunk]:
+        self.acquire(lane, provider, priority, deadline)
+        try:
+            yield from start()
+        finally:
+            lane.release()
+
+
+_scheduler: Optional[PriorityScheduler] = None
+
+
+def get_scheduler() -> PriorityScheduler:
+    """Process-wide scheduler built lazily from settings"""
+    global _scheduler
+    if _scheduler is None:
+        from config.app_settings import settings
+        _scheduler = PriorityScheduler.from_settings(settings)
+    return _scheduler
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""Passive per-model health scoreboard fed from live streaming traffic.
+
+Every upstream stream opened by ChatService is wrapped with
+``Scoreboard.observe`` which records time-to-first-token, inter-token
+latency and the request outcome. Consecutive failures open a simple
+circuit breaker that keeps the model out of ``auto`` routing until a
+cooldown has passed.
+
+The scoreboard is per worker process: each worker routes on what its own
+streams saw, and ``/api/chat/models`` reports the scores of the worker
+that answered (``scoresWorker``). Aggregated latency metrics across
+workers are on /metrics.
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Generator, Iterator, Optional
+
+from common.models import StreamChunk
+from models.http_pool import current_cancel
+
+
+class LatencyWindow:
+    """Fixed-size window of recent latency samples (seconds)"""
+
+    def __init__(self, size: int = 256):
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Return the given percentile (0-100) or None when empty"""
+        samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(pct / 100.0 * (len(samples) - 1)))))
+        return samples[index]
+
+
+class ModelHealth:
+    """Rolling latency and outcome statistics for one model"""
+
+    def __init__(self, model_id: str, window: int = 256, outcomes: int = 50):
+        self.model_id = model_id
+        self.ttft = LatencyWindow(window)
+        self.inter_token = LatencyWindow(window * 8)
+        self.outcomes = deque(maxlen=outcomes)  # True for success
+        self.requests = 0
+        self.consecutive_failures = 0
+        self.breaker_open_until = 0.0
+        self.last_seen = 0.0
+        self._lock = threading.Lock()
+
+    def record_outcome(self, ok: bool, threshold: int, cooldown: float) -> None:
+        now = time.time()
+        with self._lock:
+            self.requests += 1
+            self.last_seen = now
+            self.outcomes.append(ok)
+            if ok:
+                self.consecutive_failures = 0
+                self.breaker_open_until = 0.0
+            else:
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= threshold:
+                    self.breaker_open_until = now + cooldown
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    @property
+    def breaker_open(self) -> bool:
+        return time.time() < self.breaker_open_until
+
+    def snapshot(self) -> Dict[str, Any]:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            "ttftP50Ms": ms(self.ttft.percentile(50)),
+            "ttftP95Ms": ms(self.ttft.percentile(95)),
+            "interTokenP50Ms": ms(self.inter_token.percentile(50)),
+            "interTokenP95Ms": ms(self.inter_token.percentile(95)),
+            "errorRate": round(self.error_rate, 3),
+            "requests": self.requests,
+            "breakerOpen": self.breaker_open,
+            "lastSeen": self.last_seen or None,
+        }
+
+
+class Scoreboard:
+    """Live health scores for all models that have seen traffic"""
+
+    def __init__(self, breaker_threshold: int = 5, breaker_cooldown: float = 30.0):
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._models: Dict[str, ModelHealth] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings) -> "Scoreboard":
+        return cls(
+            breaker_threshold=settings.breaker_failure_threshold,
+            breaker_cooldown=settings.breaker_cooldown_seconds,
+        )
+
+    def health(self, model_id: str) -> ModelHealth:
+        health = self._models.get(model_id)
+        if health is None:
+            with self._lock:
+                health = self._models.setdefault(model_id, ModelHealth(model_id))
+        return health
+
+    def is_healthy(self, model_id: str) -> bool:
+        health = self._models.get(model_id)
+        return health is None or not health.breaker_open
+
+    def ttft_estimate(self, model_id: str, default: float) -> float:
+        """Median TTFT of the model, or ``default`` when it has no samples"""
+        health = self._models.get(model_id)
+        value = health.ttft.percentile(50) if health is not None else None
+        return value if value is not None else default
+
+    def last_seen(self, model_id: str) -> float:
+        health = self._models.get(model_id)
+        return health.last_seen if health is not None else 0.0
+
+    def observe(self, model_id: str, stream: Iterator[StreamChunk]) -> Generator[StreamChunk, None, None]:
+        """Pass chunks through while recording latency and outcome"""
+        health = self.health(model_id)
+        started = time.perf_counter()
+        last = None
+        ok = False
+        record = True
+        try:
+            for chunk in stream:
+                if chunk.error is not None:
+                    ok = False
+                    cancel = current_cancel()
+                    # Read aborted by UpstreamCancel: cancelled, not an upstream failure
+                    record = cancel is None or not cancel.cancelled
+                    yield chunk
+                    return
+                now = time.perf_counter()
+                if last is None:
+                    health.ttft.add(now - started)
+                else:
+                    health.inter_token.add(now - last)
+                last = now
+                ok = True
+                yield chunk
+        except GeneratorExit:
+            # Cancelled by the consumer (client gone, hedge lost): not an upstream failure
+            record = last is not None
+            raise
+        finally:
+            if record:
+                health.record_outcome(ok, self.breaker_threshold, self.breaker_cooldown)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {model_id: health.snapshot() for model_id, health in list(self._models.items())}
+
+
+_scoreboard: Optional[Scoreboard] = None
+
+
+def get_scoreboard() -> Scoreboard:
+    """Process-wide scoreboard built lazily from settings"""
+    global _scoreboard
+    if _scoreboard is None:
+        from config.app_settings import settings
+        _scoreboard = Scoreboard.from_settings(settings)
+    return _scoreboard
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for recording provider streams to cassettes and replaying them.
+Records from a local SSE server, no external network access.
+"""
+import glob
+import gzip
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+# Add src to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Set test environment variables
+os.environ['GLM_API_KEY'] = 'test-glm-api-key'
+
+from models import http_pool
+from models.cassette import REDACTED, Cassette, RecordingTransport, ReplayTransport
+
+
+class PacedSSEHandler(BaseHTTPRequestHandler):
+    """Streams four tokens 50ms apart"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for i in range(4):
+            data = {"choices": [{"delta": {"content": f"t{i} "}, "finish_reason": "stop" if i == 3 else None}]}
+            self.wfile.write(f"data: {json.dumps(data)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(0.05)
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, *args):
+        pass
+
+
+def record(directory: str) -> Cassette:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PacedSSEHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = httpx.Client(transport=RecordingTransport(httpx.HTTPTransport(), directory))
+        with client.stream(
+            "POST", f"http://127.0.0.1:{server.server_address[1]}/v4/chat/completions",
+            headers={"Authorization": "Bearer secret-key"}, json={"model": "glm-4", "messages": []},
+        ) as response:
+            assert b"t3" in response.read()
+        client.close()
+    finally:
+        server.shutdown()
+    paths = glob.glob(os.path.join(directory, "*-glm-4-*.jsonl.gz"))
+    assert len(paths) == 1
+    return Cassette.load(paths[0])
+
+
+class TestCassette:
+    """Test cassette recording, redaction and replay speeds"""
+
+    def test_recording_captures_chunks_and_redacts_keys(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cassette = record(directory)
+            raw = gzip.open(glob.glob(os.path.join(directory, "*.jsonl.gz"))[0]).read()
+
+        assert b"secret-key" not in raw
+        assert ["authorization", REDACTED] in cassette.request["headers"]
+        assert cassette.response["status"] == 200
+        assert cassette.model == "glm-4"
+        offsets = [offset for offset, _ in cassette.events]
+        assert offsets == sorted(offsets)
+        assert cassette.duration >= 0.15, "Inter-arrival timing should be preserved"
+        assert cassette.body().endswith(b"data: [DONE]\n\n")
+
+    def test_replay_speeds(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cassette = record(directory)
+
+        def replay(speed):
+            client = httpx.Client(transport=ReplayTransport([cassette], speed))
+            start = time.perf_counter()
+            with client.stream("POST", "http://replay.invalid/v4/chat/completions", json={"model": "glm-4"}) as response:
+                body = response.read()
+            return time.perf_counter() - start, body
+
+        original, body = replay(1.0)
+        fast, _ = replay(10.0)
+        instant, _ = replay(0)
+        assert body == cassette.body()
+        assert original >= cassette.duration * 0.9
+        assert fast < original / 3
+        assert instant < 0.05
+
+    def test_provider_streams_from_replay(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cassette = record(directory)
+
+        url = "http://replay.invalid/v4/"
+        os.environ['GLM_BASE_URL'] = url
+        http_pool._clients[http_pool.origin_of(url)] = httpx.Client(transport=ReplayTransport([cassette], speed=0))
+        try:
+            from models.glm_model import GLMModel
+
+            chunks = list(GLMModel(model_id="glm-4").stream_chat(messages=[{"sender": "user", "content": "Hi"}]))
+            assert "".join(c.content for c in chunks) == "t0 t1 t2 t3 "
+            assert chunks[-1].finished
+        finally:
+            del os.environ['GLM_BASE_URL']
+            http_pool._clients.pop(http_pool.origin_of(url)).close()
+
+
+if __name__ == "__main__":
+    test = TestCassette()
+    for name in dir(test):
+        if name.startswith("test_"):
+            getattr(test, name)()
+            print(f"PASS {name}")
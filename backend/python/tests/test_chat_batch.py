@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the batch endpoint in api/endpoints/chat_batch_endpoint.py,
+against the offline mock provider.
+"""
+import asyncio
+import copy
+import json
+import os
+import sys
+import time
+
+# Add src and bench to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'bench'))
+
+os.environ['GLM_API_KEY'] = 'test-glm-api-key'
+
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from api.endpoints.chat_batch_endpoint import CANCELLED, BatchRun
+from common.metrics import metrics
+from common.models import ChatBatchRequest
+from config.app_settings import settings
+from main import app
+from mock_upstream import MockConfig, MockServer
+
+
+def chat_request(model="glm-4", text="Hi"):
+    return {
+        "messages": [{"id": "1", "content": text, "sender": "user", "time": "2024-01-01T12:00:00Z"}],
+        "model": model,
+    }
+
+
+def post_batch(mock, body):
+    """NDJSON records of one batch run against ``mock``"""
+    os.environ['GLM_BASE_URL'] = f"{mock.url}/v4/"
+    try:
+        response = TestClient(app).post("/api/chat/batch", json=body)
+    finally:
+        del os.environ['GLM_BASE_URL']
+    assert response.status_code == 200, response.text
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+class TestChatBatch:
+    """Test batch results, concurrency limits, partial failure and cancellation"""
+
+    def setup_method(self):
+        # Streams here must not show up in tests that count exact glm-4 samples
+        self._metrics = (copy.deepcopy(metrics._histograms), copy.deepcopy(metrics._counters))
+        self._concurrency = settings.batch_concurrency
+
+    def teardown_method(self):
+        metrics._histograms, metrics._counters = self._metrics
+        settings.batch_concurrency = self._concurrency
+
+    def test_results_by_index_under_provider_limit(self):
+        settings.batch_concurrency = 2
+        mock = MockServer(MockConfig(ttft_ms=20, tokens_per_second=200, tokens=5, seed=1)).start()
+        try:
+            records = post_batch(mock, {"requests": [chat_request() for _ in range(6)]})
+            assert mock.stats.peak_streams == 2
+        finally:
+            mock.stop()
+        *results, summary = records
+        assert sorted(r["index"] for r in results) == list(range(6))
+        assert all(r["content"].strip() and "error" not in r for r in results)
+        assert summary == {"done": True, "succeeded": 6, "failed": 0, "cancelled": 0}
+
+    def test_partial_failure(self):
+        mock = MockServer(MockConfig(ttft_ms=10, tokens_per_second=200, tokens=5, seed=1)).start()
+        try:
+            records = post_batch(mock, {"requests": [chat_request(), chat_request("no-such-model"), chat_request()]})
+        finally:
+            mock.stop()
+        *results, summary = records
+        by_index = {r["index"]: r for r in results}
+        assert by_index[1]["error"]["errorClass"] and not by_index[1]["content"]
+        assert "error" not in by_index[0] and "error" not in by_index[2]
+        assert summary == {"done": True, "succeeded": 2, "failed": 1, "cancelled": 0}
+
+    def test_cancel_on_error(self):
+        settings.batch_concurrency = 1
+        mock = MockServer(MockConfig(ttft_ms=10, tokens_per_second=50, tokens=20, seed=1)).start()
+        try:
+            requests = [chat_request("no-such-model")] + [chat_request() for _ in range(4)]
+            records = post_batch(mock, {"requests": requests, "cancelOnError": True})
+        finally:
+            mock.stop()
+        *results, summary = records
+        cancelled = [r for r in results if r.get("error", {}).get("errorClass") == CANCELLED]
+        assert summary["failed"] == 1 and summary["cancelled"] == len(cancelled) == 4
+        assert all(r["error"]["retryable"] for r in cancelled)
+
+    def test_closing_the_stream_cancels_the_batch(self):
+        settings.batch_concurrency = 2
+        mock = MockServer(MockConfig(ttft_ms=10, tokens_per_second=20, tokens=200, seed=1)).start()
+        os.environ['GLM_BASE_URL'] = f"{mock.url}/v4/"
+
+        async def first_record_then_close():
+            batch = ChatBatchRequest(requests=[chat_request() for _ in range(4)] + [chat_request("no-such-model")])
+            run = BatchRun(batch, Request({"type": "http", "headers": []}))
+            run.start()
+            records = run.records()
+            first = await records.__anext__()
+            await records.aclose()
+            return json.loads(first), run
+
+        try:
+            first, run = asyncio.run(first_record_then_close())
+            assert first["index"] == 4
+            assert all(task.done() for task in run.tasks)
+            deadline = time.monotonic() + 5
+            while mock.stats.active_streams and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert mock.stats.active_streams == 0 and mock.stats.completed_streams == 0
+            assert mock.stats.requests == 2
+        finally:
+            del os.environ['GLM_BASE_URL']
+            mock.stop()
+
+    def test_batch_size_is_bounded(self):
+        client = TestClient(app)
+        assert client.post("/api/chat/batch", json={"requests": []}).status_code == 400
+        too_many = [chat_request()] * (settings.batch_max_requests + 1)
+        assert client.post("/api/chat/batch", json={"requests": too_many}).status_code == 400
+
+
+if __name__ == "__main__":
+    # Run tests directly
+    import pytest
+    pytest.main([__file__, "-v"])
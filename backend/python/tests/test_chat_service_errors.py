@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Load test for the ChatService error path.
+Failed requests must return one structured error chunk and release the
+worker thread immediately instead of simulating a slow token stream.
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add src to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from common.models import ChatStreamRequest, Message
+from services.chat.chat_service import ChatService
+
+REQUESTS = 2000
+WORKERS = 32
+MAX_RELEASE_SECONDS = 0.010
+
+
+def failing_request() -> ChatStreamRequest:
+    return ChatStreamRequest(
+        messages=[Message(id="msg-1", content="Hello", sender="user", time="2024-01-01T12:00:00Z")],
+        model="invalid-model-name",
+    )
+
+
+def drain(req: ChatStreamRequest):
+    start = time.perf_counter()
+    chunks = list(ChatService.stream_chat(req))
+    return time.perf_counter() - start, chunks
+
+
+class TestChatServiceErrors:
+    """Test the fail-fast structured error path"""
+
+    def test_error_chunk_is_structured(self):
+        _, chunks = drain(failing_request())
+
+        assert len(chunks) == 1, "Error path should yield exactly one chunk"
+        chunk = chunks[0]
+        assert chunk.finished
+        assert chunk.error is not None
+        assert chunk.error.errorClass == "ValueError"
+        assert chunk.error.retryable is False
+        assert chunk.error.provider == "unknown"
+        assert "Unsupported model type" in chunk.content
+
+    def test_failed_request_release_latency(self):
+        durations = sorted(drain(failing_request())[0] for _ in range(200))
+        p99 = durations[int(len(durations) * 0.99) - 1]
+        assert p99 < MAX_RELEASE_SECONDS, f"p99 release time {p99 * 1000:.2f}ms exceeds 10ms"
+
+    def test_failed_requests_release_workers_under_load(self):
+        reqs = [failing_request() for _ in range(REQUESTS)]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            results = list(pool.map(drain, reqs))
+        wall = time.perf_counter() - start
+
+        # Average time each request held a worker, independent of GIL scheduling
+        hold = wall * WORKERS / REQUESTS
+        print(f"{REQUESTS} failed requests in {wall:.3f}s, {hold * 1000:.2f}ms worker hold per request")
+
+        assert all(len(chunks) == 1 and chunks[0].error for _, chunks in results)
+        assert hold < MAX_RELEASE_SECONDS, f"Worker hold time {hold * 1000:.2f}ms exceeds 10ms"
+
+
+if __name__ == "__main__":
+    test = TestChatServiceErrors()
+    test.test_error_chunk_is_structured()
+    print("PASS Structured error chunk")
+    test.test_failed_request_release_latency()
+    print("PASS Failed request released under 10ms")
+    test.test_failed_requests_release_workers_under_load()
+    print("PASS Failed requests release workers under load")
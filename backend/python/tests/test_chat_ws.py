@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for multiplexed chat streams over the WebSocket endpoint in
+api/endpoints/chat_ws_endpoint.py, against the offline mock provider.
+"""
+import copy
+import json
+import os
+import sys
+import time
+
+# Add src and bench to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'bench'))
+
+os.environ['GLM_API_KEY'] = 'test-glm-api-key'
+
+from fastapi.testclient import TestClient
+
+from common import drain as drain_module
+from common.drain import StreamDrain
+from common.metrics import metrics
+from main import app
+from mock_upstream import MockConfig, MockServer
+
+
+def start_frame(stream_id, text="Hi", **extra):
+    frame = {
+        "type": "start",
+        "id": stream_id,
+        "request": {
+            "messages": [{"id": "1", "content": text, "sender": "user", "time": "2024-01-01T12:00:00Z"}],
+            "model": "glm-4",
+        },
+    }
+    frame.update(extra)
+    return frame
+
+
+class MockUpstream:
+    """MockServer serving as the GLM endpoint for the duration of a test"""
+
+    def __init__(self, **config):
+        self.server = MockServer(MockConfig(seed=1, **config))
+
+    def __enter__(self) -> MockServer:
+        self.server.start()
+        os.environ['GLM_BASE_URL'] = f"{self.server.url}/v4/"
+        return self.server
+
+    def __exit__(self, *exc):
+        del os.environ['GLM_BASE_URL']
+        self.server.stop()
+
+
+def receive_until_ended(ws, stream_ids, binary=False):
+    """Frames grouped by stream id until every stream in ``stream_ids`` has ended"""
+    frames = {stream_id: [] for stream_id in stream_ids}
+    order = []
+    pending = set(stream_ids)
+    while pending:
+        frame = json.loads(ws.receive_bytes() if binary else ws.receive_text())
+        frames.setdefault(frame["id"], []).append(frame)
+        order.append(frame["id"])
+        if frame["type"] == "end":
+            pending.discard(frame["id"])
+    return frames, order
+
+
+class TestChatWebSocket:
+    """Test multiplexing, flow control, cancellation and protocol errors"""
+
+    def setup_method(self):
+        # Streams here must not show up in tests that count exact glm-4 samples
+        self._metrics = (copy.deepcopy(metrics._histograms), copy.deepcopy(metrics._counters))
+
+    def teardown_method(self):
+        metrics._histograms, metrics._counters = self._metrics
+
+    def test_concurrent_streams_on_one_connection(self):
+        with MockUpstream(ttft_ms=20, tokens_per_second=100, tokens=8):
+            with TestClient(app).websocket_connect("/api/chat/ws") as ws:
+                for stream_id in ("a", "b", "c"):
+                    ws.send_json(start_frame(stream_id))
+                frames, order = receive_until_ended(ws, ["a", "b", "c"])
+
+        for stream_id in ("a", "b", "c"):
+            chunks = [f["chunk"] for f in frames[stream_id] if f["type"] == "chunk"]
+            assert chunks[-1]["finished"] is True
+            assert "".join(c.get("content", "") for c in chunks).strip()
+            assert frames[stream_id][-1] == {"type": "end", "id": stream_id, "reason": "finished"}
+        # The streams ran side by side, not one after another
+        first_end = min(order.index(s) + len(frames[s]) for s in ("a", "b", "c"))
+        assert len(set(order[:first_end])) == 3
+
+    def test_chunks_match_the_http_encoding(self):
+        frame = start_frame("bad")
+        # A compare-mode model that fails at once: tagged, with no time to first token
+        frame["request"]["compareModels"] = ["no-such-model"]
+        client = TestClient(app)
+        with client.websocket_connect("/api/chat/ws") as ws:
+            ws.send_json(frame)
+            frames, _ = receive_until_ended(ws, ["bad"])
+        http = [json.loads(line) for line in
+                client.post("/api/chat/stream", json=frame["request"]).text.splitlines()]
+
+        assert [f["chunk"] for f in frames["bad"] if f["type"] == "chunk"] == http
+        assert http[0]["modelDone"] and http[0]["ttftMs"] is None and "errorClass" in http[0]["error"]
+
+    def test_credits_pause_a_stream(self):
+        with MockUpstream(ttft_ms=10, tokens_per_second=200, tokens=6):
+            with TestClient(app).websocket_connect("/api/chat/ws") as ws:
+                ws.send_json(start_frame("slow", credits=2))
+                ws.send_json(start_frame("fast"))
+                frames, _ = receive_until_ended(ws, ["fast"])
+                assert [f["type"] for f in frames["slow"]] == ["chunk", "chunk"]
+
+                ws.send_json({"type": "credit", "id": "slow", "n": 100})
+                more, _ = receive_until_ended(ws, ["slow"])
+
+        chunks = frames["slow"] + [f for f in more["slow"] if f["type"] == "chunk"]
+        assert chunks[-1]["chunk"]["finished"] is True
+        assert more["slow"][-1]["reason"] == "finished"
+
+    def test_cancel_closes_upstream_stream(self):
+        with MockUpstream(ttft_ms=10, tokens_per_second=20, tokens=200) as mock:
+            with TestClient(app).websocket_connect("/api/chat/ws?frames=binary") as ws:
+                ws.send_bytes(json.dumps(start_frame("s1")).encode("utf-8"))
+                first = json.loads(ws.receive_bytes())
+                assert first["type"] == "chunk" and first["id"] == "s1"
+                ws.send_bytes(json.dumps({"type": "cancel", "id": "s1"}).encode("utf-8"))
+                frames, _ = receive_until_ended(ws, ["s1"], binary=True)
+                assert frames["s1"][-1] == {"type": "end", "id": "s1", "reason": "cancelled"}
+
+            deadline = time.monotonic() + 5
+            while mock.stats.active_streams and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert mock.stats.active_streams == 0
+            assert mock.stats.completed_streams == 0
+
+    def test_cancel_before_first_chunk(self):
+        with MockUpstream(ttft_ms=10000, tokens_per_second=20, tokens=5) as mock:
+            with TestClient(app).websocket_connect("/api/chat/ws") as ws:
+                ws.send_text(json.dumps(start_frame("s1")))
+                deadline = time.monotonic() + 5
+                while not mock.stats.active_streams and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                assert mock.stats.active_streams == 1
+
+                start = time.perf_counter()
+                ws.send_text(json.dumps({"type": "cancel", "id": "s1"}))
+                frames, _ = receive_until_ended(ws, ["s1"])
+                # Ended without waiting for the provider's first token
+                assert time.perf_counter() - start < 2.0
+                assert frames["s1"] == [{"type": "end", "id": "s1", "reason": "cancelled"}]
+
+            while mock.stats.active_streams and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert mock.stats.active_streams == 0
+
+    def test_protocol_errors(self):
+        previous = drain_module._drain
+        try:
+            with TestClient(app).websocket_connect("/api/chat/ws") as ws:
+                ws.send_text("not json")
+                assert ws.receive_json()["message"] == "Frame is not valid JSON"
+                ws.send_json({"type": "start"})
+                assert ws.receive_json()["message"] == "Frame needs a string id"
+                ws.send_json({"type": "resume", "id": "x"})
+                assert ws.receive_json()["message"] == "Unknown frame type 'resume'"
+                ws.send_json({"type": "start", "id": "x", "request": {"model": "glm-4"}})
+                error = ws.receive_json()
+                assert error["id"] == "x" and error["message"].startswith("Invalid request")
+                assert error["retryable"] is False
+
+                drain_module._drain = StreamDrain(timeout=30)
+                drain_module._drain.begin()
+                ws.send_json(start_frame("late"))
+                error = ws.receive_json()
+                assert error["type"] == "error" and error["id"] == "late" and error["retryable"] is True
+        finally:
+            drain_module._drain = previous
+
+
+if __name__ == "__main__":
+    # Run tests directly
+    import pytest
+    pytest.main([__file__, "-v"])
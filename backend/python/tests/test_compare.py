@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for compare mode (compareModels) in services/chat/compare.py,
+against the offline mock provider.
+"""
+import copy
+import json
+import os
+import sys
+import time
+
+# Add src and bench to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'bench'))
+
+os.environ['GLM_API_KEY'] = 'test-glm-api-key'
+os.environ['MOONSHOT_API_KEY'] = 'test-kimi-api-key'
+
+from fastapi.testclient import TestClient
+
+from common.deadline import Deadline
+from common.metrics import StreamTimings, metrics
+from common.models import ChatStreamRequest, StreamChunk
+from common.usage import RequestUsage
+from config.app_settings import settings
+from main import app
+from mock_upstream import MockConfig, MockServer
+from rpc import chat_pb2
+from rpc.server import encode_chunk_proto
+from services.chat.chat_service import ChatService
+from services.chat.compare import CANCELLED
+
+MESSAGES = [{"id": "1", "content": "Hi", "sender": "user", "time": "2024-01-01T12:00:00Z"}]
+
+
+class UsageRecorder:
+    def __init__(self):
+        self.records = []
+
+    def record(self, model, user, prompt, completion, estimated):
+        self.records.append((model, user))
+
+
+def by_model(chunks):
+    models = {}
+    for chunk in chunks[:-1]:
+        models.setdefault(chunk["model"], []).append(chunk)
+    return models
+
+
+class TestCompareMode:
+    """Test the tagged stream, per-model completion, stopping losers and failures"""
+
+    def setup_method(self):
+        # Streams here must not show up in tests that count exact glm-4 samples
+        self._metrics = (copy.deepcopy(metrics._histograms), copy.deepcopy(metrics._counters))
+        self.glm = MockServer(MockConfig(ttft_ms=50, tokens_per_second=50, tokens=5, seed=1)).start()
+        self.kimi = MockServer(MockConfig(ttft_ms=50, tokens_per_second=50, tokens=5, seed=1)).start()
+        os.environ['GLM_BASE_URL'] = f"{self.glm.url}/v4/"
+        os.environ['KIMI_BASE_URL'] = f"{self.kimi.url}/v1"
+
+    def teardown_method(self):
+        metrics._histograms, metrics._counters = self._metrics
+        del os.environ['GLM_BASE_URL']
+        del os.environ['KIMI_BASE_URL']
+        self.glm.stop()
+        self.kimi.stop()
+
+    def test_models_stream_side_by_side(self):
+        recorder = UsageRecorder()
+        usage = RequestUsage("user-1", MESSAGES, recorder)
+        req = ChatStreamRequest(messages=MESSAGES, compareModels=["glm-4", "kimi-k2-turbo-preview", "glm-4"])
+        chunks = [c.model_dump(exclude_none=True)
+                  for c in ChatService.stream_chat(req, Deadline(10), StreamTimings(), usage)]
+        usage.finish()
+
+        assert chunks[-1] == {"content": "", "finished": True}
+        models = by_model(chunks)
+        assert set(models) == {"glm-4", "kimi-k2-turbo-preview"}
+        assert "".join(c["content"] for c in models["glm-4"]) == "token0 token1 token2 token3 token4 "
+        for model_chunks in models.values():
+            assert [c.get("modelDone", False) for c in model_chunks][-1] is True
+            assert sum(c.get("modelDone", False) for c in model_chunks) == 1
+            assert model_chunks[-1]["ttftMs"] >= 50 and "error" not in model_chunks[-1]
+        # Started together, not one after the other
+        first_done = [i for i, c in enumerate(chunks) if c.get("modelDone")][0]
+        assert {c.get("model") for c in chunks[:first_done]} == set(models)
+        # One usage record per model, none for the comparison itself
+        assert sorted(recorder.records) == [("glm-4", "user-1"), ("kimi-k2-turbo-preview", "user-1")]
+
+        last = StreamChunk(content="", finished=False, model="glm-4", modelDone=True, ttftMs=12.5)
+        frame = chat_pb2.StreamChunk.FromString(encode_chunk_proto(last))
+        assert frame.model == "glm-4" and frame.model_done and frame.ttft_ms == 12.5
+
+    def test_stop_after_first_model_cancels_the_others(self):
+        self.kimi.config.update({"tokens_per_second": 20, "tokens": 200})
+        body = {"messages": MESSAGES, "compareModels": ["kimi-k2-turbo-preview", "glm-4"], "compareStopAfter": 1}
+        response = TestClient(app).post("/api/chat/stream", json=body)
+        chunks = [json.loads(line) for line in response.text.splitlines()]
+
+        models = by_model(chunks)
+        assert models["glm-4"][-1]["modelDone"] and "error" not in models["glm-4"][-1]
+        loser = models["kimi-k2-turbo-preview"][-1]
+        assert loser["modelDone"] and loser["error"]["errorClass"] == CANCELLED
+        assert chunks[-1] == {"content": "", "finished": True}
+        deadline = time.monotonic() + 5
+        while self.kimi.stats.active_streams and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert self.kimi.stats.active_streams == 0 and self.kimi.stats.completed_streams == 0
+
+    def test_stop_after_does_not_wait_for_a_slow_first_token(self):
+        self.kimi.config.update({"ttft_ms": 10000})
+        body = {"messages": MESSAGES, "compareModels": ["kimi-k2-turbo-preview", "glm-4"], "compareStopAfter": 1}
+        start = time.perf_counter()
+        response = TestClient(app).post("/api/chat/stream", json=body)
+        elapsed = time.perf_counter() - start
+        chunks = [json.loads(line) for line in response.text.splitlines()]
+
+        # Stopped while still waiting for its first token
+        stopped = by_model(chunks)["kimi-k2-turbo-preview"]
+        assert len(stopped) == 1 and stopped[0]["modelDone"] and stopped[0]["ttftMs"] is None
+        assert stopped[0]["error"]["errorClass"] == CANCELLED
+        assert elapsed < 3.0
+        deadline = time.monotonic() + 2
+        while self.kimi.stats.active_streams and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert self.kimi.stats.active_streams == 0 and self.kimi.stats.completed_streams == 0
+
+    def test_failed_model_does_not_end_the_comparison(self):
+        body = {"messages": MESSAGES, "compareModels": ["no-such-model", "glm-4"]}
+        chunks = [json.loads(line) for line in TestClient(app).post("/api/chat/stream", json=body).text.splitlines()]
+
+        models = by_model(chunks)
+        assert models["no-such-model"][-1]["modelDone"] and models["no-such-model"][-1]["error"]["errorClass"]
+        assert "".join(c["content"] for c in models["glm-4"]) == "token0 token1 token2 token3 token4 "
+        assert chunks[-1] == {"content": "", "finished": True}
+
+    def test_number_of_models_is_bounded(self):
+        limit = settings.compare_max_models
+        settings.compare_max_models = 1
+        try:
+            req = ChatStreamRequest(messages=MESSAGES, compareModels=["glm-4", "kimi-k2-turbo-preview"])
+            chunks = list(ChatService.stream_chat(req, Deadline(10)))
+        finally:
+            settings.compare_max_models = limit
+        assert len(chunks) == 1 and chunks[0].finished and "At most 1" in chunks[0].error.message
+        assert self.glm.stats.requests == 0 and self.kimi.stats.requests == 0
+
+
+if __name__ == "__main__":
+    # Run tests directly
+    import pytest
+    pytest.main([__file__, "-v"])
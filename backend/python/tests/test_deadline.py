@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for request deadline propagation from ChatService to providers.
+Uses a local slow SSE server, no external network access.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add src to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Set test environment variables
+os.environ['GLM_API_KEY'] = 'test-glm-api-key'
+
+from common.deadline import Deadline, DeadlineExceeded
+from common.models import ChatStreamRequest, Message
+
+
+class SlowSSEHandler(BaseHTTPRequestHandler):
+    """Streams one token every 100ms for two seconds"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        try:
+            for i in range(20):
+                data = {"choices": [{"delta": {"content": f"t{i} "}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(data)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(0.1)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class StallingSSEHandler(BaseHTTPRequestHandler):
+    """Streams three tokens 300ms apart, then stalls for five seconds"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        try:
+            for i in range(3):
+                data = {"choices": [{"delta": {"content": f"t{i} "}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(data)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(0.3)
+            time.sleep(5)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDeadline:
+    """Test deadline budgets and enforcement"""
+
+    def test_tighter_budget_wins(self):
+        deadline = Deadline.from_request(timeout_ms=5000, header_ms="1000")
+        assert 0.9 < deadline.remaining() <= 1.0
+        assert Deadline.from_request(header_ms="not-a-number").remaining() > 1.0
+
+    def test_budgets_are_capped_by_remaining_time(self):
+        deadline = Deadline(0.5, connect_timeout=10, first_token_timeout=60)
+        timeout = deadline.httpx_timeout()
+        assert timeout.connect <= 0.5
+        assert timeout.read <= 0.5
+
+    def test_expired_deadline_fails_before_upstream(self):
+        from services.chat.chat_service import ChatService
+
+        req = ChatStreamRequest(
+            messages=[Message(id="1", content="Hi", sender="user", time="2024-01-01T12:00:00Z")],
+            model="glm-4",
+        )
+        start = time.perf_counter()
+        chunks = list(ChatService.stream_chat(req, Deadline(0)))
+        assert time.perf_counter() - start < 0.05
+        assert len(chunks) == 1
+        assert chunks[0].error.errorClass == DeadlineExceeded.__name__
+        assert chunks[0].error.retryable is False
+
+    def test_provider_stops_when_deadline_passes(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), SlowSSEHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ['GLM_BASE_URL'] = f"http://127.0.0.1:{server.server_address[1]}/v4/"
+        try:
+            from models.glm_model import GLMModel
+
+            model = GLMModel(model_id="glm-4")
+            start = time.perf_counter()
+            chunks = list(model.stream_chat(
+                messages=[{"sender": "user", "content": "Hi"}],
+                deadline=Deadline(0.35),
+            ))
+            elapsed = time.perf_counter() - start
+
+            assert elapsed < 0.6, f"Stream should stop at the deadline, took {elapsed:.2f}s"
+            assert 1 <= len([c for c in chunks if c.error is None]) < 20
+            assert chunks[-1].finished
+            assert chunks[-1].error.errorClass == DeadlineExceeded.__name__
+        finally:
+            del os.environ['GLM_BASE_URL']
+            server.shutdown()
+
+    def test_stalled_read_is_aborted_at_the_deadline(self):
+        from services.chat.chat_service import ChatService
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StallingSSEHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ['GLM_BASE_URL'] = f"http://127.0.0.1:{server.server_address[1]}/v4/"
+        req = ChatStreamRequest(
+            messages=[Message(id="1", content="Hi", sender="user", time="2024-01-01T12:00:00Z")],
+            model="glm-4",
+        )
+        try:
+            start = time.perf_counter()
+            # The read timeout is the 1s budget, armed at the last token 0.6s in
+            chunks = list(ChatService.stream_chat(req, Deadline(1.0)))
+            elapsed = time.perf_counter() - start
+        finally:
+            del os.environ['GLM_BASE_URL']
+            server.shutdown()
+
+        assert elapsed < 1.3, f"Stream should end at the deadline, took {elapsed:.2f}s"
+        assert [c.content for c in chunks[:-1]] == ["t0 ", "t1 ", "t2 "]
+        assert chunks[-1].error.errorClass == DeadlineExceeded.__name__
+
+
+if __name__ == "__main__":
+    test = TestDeadline()
+    for name in dir(test):
+        if name.startswith("test_"):
+            getattr(test, name)()
+            print(f"PASS {name}")
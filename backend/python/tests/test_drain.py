@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for production server options and graceful stream draining.
+Runs the service with server.py against the offline mock provider.
+"""
+import json
+import math
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+# Add src and bench to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'bench'))
+
+from load_test import free_port, wait_for
+from mock_upstream import MockConfig, MockServer
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+REQUEST = {
+    "messages": [{"id": "1", "content": "Hi", "sender": "user", "time": "2024-01-01T12:00:00Z"}],
+    "model": "glm-4",
+}
+
+
+def stream_during_sigterm(drain_seconds: float, tokens: int, tokens_per_second: float = 20, signal_after: int = 3):
+    """Start a stream, SIGTERM the server mid-stream; returns (chunks, exit code, seconds from SIGTERM to end)"""
+    mock = MockServer(MockConfig(ttft_ms=50, tokens_per_second=tokens_per_second, tokens=tokens, seed=1)).start()
+    port = free_port()
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(
+            os.environ,
+            GLM_API_KEY="test-glm-api-key",
+            GLM_BASE_URL=f"{mock.url}/v4/",
+            PORT_PYTHON=str(port),
+            SERVER_HOST="127.0.0.1",
+            SHUTDOWN_DRAIN_SECONDS=str(drain_seconds),
+            UPSTREAM_WARM_MIN_IDLE="0",
+            DB_SQLITE_PATH=os.path.join(directory, "usage.db"),
+            LOG_LEVEL="WARNING",
+        )
+        server = subprocess.Popen([sys.executable, "server.py", "--mode", "production", "--workers", "1"],
+                                  cwd=SRC_DIR, env=env)
+        try:
+            wait_for(f"http://127.0.0.1:{port}/health")
+            chunks = []
+            signalled = None
+            with httpx.stream("POST", f"http://127.0.0.1:{port}/api/chat/stream", json=REQUEST, timeout=30) as response:
+                for line in response.iter_lines():
+                    chunks.append(json.loads(line))
+                    if len(chunks) == signal_after:
+                        signalled = time.monotonic()
+                        server.send_signal(signal.SIGTERM)
+            elapsed = time.monotonic() - signalled
+            return chunks, server.wait(timeout=30), elapsed
+        finally:
+            if server.poll() is None:
+                server.kill()
+            mock.stop()
+
+
+class TestDrain:
+    """Test server launch options and draining of in-flight streams"""
+
+    def test_server_options(self):
+        from config.app_settings import settings
+        from server import SHUTDOWN_GRACE_SECONDS, server_options
+
+        production = server_options("production")
+        assert production["workers"] >= 1
+        assert production["loop"] in ("uvloop", "asyncio")
+        assert production["http"] in ("httptools", "h11")
+        assert production["backlog"] == settings.server_backlog
+        assert production["timeout_graceful_shutdown"] == (
+            math.ceil(settings.shutdown_drain_seconds) + SHUTDOWN_GRACE_SECONDS)
+        assert server_options("production", workers=3)["workers"] == 3
+        development = server_options("development")
+        assert development["reload"] and development["workers"] == 1
+
+    def test_draining_refuses_new_streams(self):
+        from fastapi.testclient import TestClient
+        from common import drain as drain_module
+        from common.drain import StreamDrain
+        from main import app
+
+        original = drain_module._drain
+        drain_module._drain = StreamDrain(timeout=5)
+        drain_module._drain.begin()
+        try:
+            client = TestClient(app)
+            response = client.post("/api/chat/stream", json=REQUEST)
+            assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+            assert client.get("/health").json()["status"] == "draining"
+        finally:
+            drain_module._drain = original
+
+    def test_sigterm_lets_in_flight_stream_finish(self):
+        chunks, code, _ = stream_during_sigterm(drain_seconds=10, tokens=20)
+        # uvicorn re-raises the captured SIGTERM once shutdown completes
+        assert code in (0, -signal.SIGTERM)
+        assert [c["content"] for c in chunks[:-1]] == [f"token{i} " for i in range(19)]
+        assert chunks[-1]["finished"] and "error" not in chunks[-1]
+
+    def test_drain_deadline_ends_stream_with_retryable_error(self):
+        chunks, code, _ = stream_during_sigterm(drain_seconds=0.5, tokens=200)
+        assert code in (0, -signal.SIGTERM)
+        assert 3 < len(chunks) < 100
+        error = chunks[-1]["error"]
+        assert chunks[-1]["finished"] and error["errorClass"] == "ServerDraining" and error["retryable"]
+
+    def test_drain_deadline_does_not_wait_for_the_next_chunk(self):
+        # Ten seconds between tokens: the stream is waiting on the provider at the deadline
+        chunks, code, elapsed = stream_during_sigterm(drain_seconds=0.5, tokens=5, tokens_per_second=0.1,
+                                                      signal_after=1)
+        assert code in (0, -signal.SIGTERM)
+        assert len(chunks) == 2 and elapsed < 5
+        error = chunks[-1]["error"]
+        assert chunks[-1]["finished"] and error["errorClass"] == "ServerDraining" and error["retryable"]
+
+
+if __name__ == "__main__":
+    test = TestDrain()
+    for name in dir(test):
+        if name.startswith("test_"):
+            getattr(test, name)()
+            print(f"PASS {name}")
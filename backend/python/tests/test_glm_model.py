@@ -45,7 +45,7 @@ class TestAPIEndpoint:
             
             # Check response
             assert response.status_code == 200
-            assert "text/plain" in response.headers["content-type"]
+            assert "application/x-ndjson" in response.headers["content-type"]
             
             # Parse streaming response
             content = response.content.decode()
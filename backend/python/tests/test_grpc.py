@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the gRPC ChatService in rpc/server.py, served in-process against
+the offline mock provider.
+"""
+import asyncio
+import copy
+import os
+import sys
+import time
+
+import grpc
+
+# Add src and bench to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'bench'))
+
+os.environ['GLM_API_KEY'] = 'test-glm-api-key'
+
+from common import drain as drain_module
+from common.drain import StreamDrain
+from common.metrics import metrics
+from load_test import free_port
+from mock_upstream import MockConfig, MockServer
+from rpc import chat_pb2
+from rpc.chat_pb2_grpc import ChatServiceStub
+from rpc.server import request_from_proto, start_grpc_server
+
+
+def chat_request(model="glm-4", **fields) -> chat_pb2.ChatStreamRequest:
+    return chat_pb2.ChatStreamRequest(
+        messages=[chat_pb2.Message(id="1", content="Hi", sender="user", time="2024-01-01T12:00:00Z")],
+        model=model,
+        **fields,
+    )
+
+
+def serve(test, mock: MockServer = None):
+    """Run ``test(stub)`` against a fresh in-process gRPC server"""
+    async def main():
+        port = free_port()
+        server = await start_grpc_server("127.0.0.1", port)
+        try:
+            async with grpc.aio.insecure_channel(f"127.0.0.1:{port}") as channel:
+                return await test(ChatServiceStub(channel))
+        finally:
+            await server.stop(None)
+
+    if mock is not None:
+        os.environ['GLM_BASE_URL'] = f"{mock.url}/v4/"
+    try:
+        return asyncio.run(main())
+    finally:
+        os.environ.pop('GLM_BASE_URL', None)
+
+
+class TestGrpcChatService:
+    """Test streaming, model listing, cancellation and request mapping"""
+
+    def setup_method(self):
+        # Streams here must not show up in tests that count exact glm-4 samples
+        self._metrics = (copy.deepcopy(metrics._histograms), copy.deepcopy(metrics._counters))
+
+    def teardown_method(self):
+        metrics._histograms, metrics._counters = self._metrics
+
+    def test_request_mapping(self):
+        req = request_from_proto(chat_request(max_tokens=64, thinking_mode=True, stop=["END"]))
+        assert req.messages[0].content == "Hi" and req.model == "glm-4"
+        assert req.maxTokens == 64 and req.thinkingMode is True and req.stop == ["END"]
+        # Unset optional fields keep the HTTP defaults
+        assert req.temperature == 0.7 and req.timeoutMs is None
+
+    def test_chat_stream(self):
+        mock = MockServer(MockConfig(ttft_ms=10, tokens_per_second=200, tokens=5, seed=1)).start()
+
+        async def test(stub):
+            return [chunk async for chunk in stub.ChatStream(chat_request(), metadata=(("x-user-id", "alice"),))]
+
+        try:
+            chunks = serve(test, mock)
+        finally:
+            mock.stop()
+        assert chunks[-1].finished and not chunks[-1].HasField("error")
+        assert "".join(c.content for c in chunks).strip()
+
+    def test_error_chunk(self):
+        async def test(stub):
+            return [chunk async for chunk in stub.ChatStream(chat_request(model="no-such-model"))]
+
+        chunks = serve(test)
+        assert chunks[-1].finished
+        assert chunks[-1].HasField("error") and chunks[-1].error.error_class
+
+    def test_cancel_closes_upstream_stream(self):
+        mock = MockServer(MockConfig(ttft_ms=10, tokens_per_second=20, tokens=200, seed=1)).start()
+
+        async def test(stub):
+            call = stub.ChatStream(chat_request())
+            first = await call.read()
+            call.cancel()
+            return first
+
+        try:
+            first = serve(test, mock)
+            assert first.content
+            deadline = time.monotonic() + 5
+            while mock.stats.active_streams and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert mock.stats.active_streams == 0
+            assert mock.stats.completed_streams == 0
+        finally:
+            mock.stop()
+
+    def test_draining_refuses_calls(self):
+        previous = drain_module._drain
+        drain_module._drain = StreamDrain(timeout=30)
+        drain_module._drain.begin()
+
+        async def test(stub):
+            try:
+                async for _ in stub.ChatStream(chat_request()):
+                    pass
+            except grpc.aio.AioRpcError as e:
+                return e.code()
+
+        try:
+            assert serve(test) == grpc.StatusCode.UNAVAILABLE
+        finally:
+            drain_module._drain = previous
+
+    def test_list_models(self):
+        async def test(stub):
+            return await stub.ListModels(chat_pb2.ListModelsRequest())
+
+        response = serve(test)
+        assert response.default_model
+        assert all(model.id and model.type for model in response.models)
+
+
+if __name__ == "__main__":
+    # Run tests directly
+    import pytest
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for hedged streaming in services/chat/hedging.py.
+Uses fake upstream streams and the offline mock provider.
+"""
+import os
+import queue
+import sys
+import time
+
+# Add src and bench to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'bench'))
+
+os.environ['GLM_API_KEY'] = 'test-glm-api-key'
+os.environ['MOONSHOT_API_KEY'] = 'test-kimi-api-key'
+
+from common.deadline import Deadline
+from common.metrics import MetricsRegistry, StreamTimings
+from common.models import ChatStreamRequest, StreamChunk
+from common.usage import RequestUsage
+from mock_upstream import MockConfig, MockServer
+from services.chat import chat_service as chat_service_module
+from services.chat.chat_service import ChatService
+from services.chat.hedging import HedgeBudget, HedgePolicy, StreamPump
+from services.chat.scoreboard import get_scoreboard
+
+
+def fake_stream(first_delay, tokens, closed=None, name=""):
+    """Fake upstream yielding tokens after an initial delay"""
+    try:
+        time.sleep(first_delay)
+        for i, token in enumerate(tokens):
+            yield StreamChunk(content=f"{name}{token}", finished=(i == len(tokens) - 1))
+    finally:
+        if closed is not None:
+            closed.append(name)
+
+
+class TestHedging:
+    """Test hedge delay, winner selection and budget"""
+
+    def test_fast_primary_is_not_hedged(self):
+        policy = HedgePolicy(enabled=True, min_delay=0.05, max_delay=0.05, budget_percent=100)
+        opened = []
+
+        def open_stream(model_id):
+            opened.append(model_id)
+            return fake_stream(0.0, ["a", "b"], name="p:")
+
+        chunks = list(policy.stream("glm-4", open_stream))
+        assert [c.content for c in chunks] == ["p:a", "p:b"]
+        assert opened == ["glm-4"]
+
+    def test_slow_primary_loses_to_hedge(self):
+        policy = HedgePolicy(
+            enabled=True, min_delay=0.05, max_delay=0.05, budget_percent=100,
+            alternates={"glm-4": "kimi-k2-turbo-preview"},
+        )
+        closed = []
+
+        def open_stream(model_id):
+            if model_id == "glm-4":
+                return fake_stream(0.5, ["a", "b"], closed, name="primary:")
+            return fake_stream(0.0, ["x", "y"], closed, name="hedge:")
+
+        start = time.perf_counter()
+        chunks = list(policy.stream("glm-4", open_stream))
+        elapsed = time.perf_counter() - start
+
+        assert [c.content for c in chunks] == ["hedge:x", "hedge:y"]
+        assert elapsed < 0.4, "Hedge should answer before the slow primary"
+        # The losing primary is cancelled as soon as it yields
+        time.sleep(0.6)
+        assert "primary:" in closed
+
+    def test_budget_blocks_hedge(self):
+        policy = HedgePolicy(enabled=True, min_delay=0.02, max_delay=0.02, budget_percent=0)
+        opened = []
+
+        def open_stream(model_id):
+            opened.append(model_id)
+            return fake_stream(0.1, ["a"], name="p:")
+
+        chunks = list(policy.stream("glm-4", open_stream))
+        assert [c.content for c in chunks] == ["p:a"]
+        assert opened == ["glm-4"]
+
+    def test_budget_percentage(self):
+        budget = HedgeBudget(percent=10, burst=1)
+        spent = 0
+        for _ in range(1000):
+            budget.deposit()
+            if budget.try_spend():
+                spent += 1
+        assert spent <= 100
+
+    def test_delay_follows_ttft_percentile(self):
+        policy = HedgePolicy(enabled=True, min_delay=0.1, max_delay=5.0, min_samples=10, percentile=90)
+        assert policy.hedge_delay("glm-4") == 5.0
+        for i in range(100):
+            policy.record_ttft("glm-4", 0.2 + i * 0.01)
+        assert abs(policy.hedge_delay("glm-4") - 1.09) < 0.02
+
+
+class UsageRecorder:
+    def __init__(self):
+        self.records = []
+
+    def record(self, model, user, prompt, completion, estimated):
+        self.records.append((model, completion))
+
+
+class TestHedgedAccounting:
+    """Test that usage and metrics follow the attempt that answered"""
+
+    def setup_method(self):
+        self._policy = chat_service_module._hedge_policy
+        chat_service_module._hedge_policy = HedgePolicy(
+            enabled=True, min_delay=0.05, max_delay=0.05, budget_percent=100,
+            alternates={"glm-4": "kimi-k2-turbo-preview"},
+        )
+        self.glm = MockServer(MockConfig(ttft_ms=2000, tokens_per_second=50, tokens=5, seed=1)).start()
+        self.kimi = MockServer(MockConfig(ttft_ms=10, tokens_per_second=200, tokens=3, seed=1)).start()
+        os.environ['GLM_BASE_URL'] = f"{self.glm.url}/v4/"
+        os.environ['KIMI_BASE_URL'] = f"{self.kimi.url}/v1"
+
+    def teardown_method(self):
+        chat_service_module._hedge_policy = self._policy
+        del os.environ['GLM_BASE_URL']
+        del os.environ['KIMI_BASE_URL']
+        self.glm.stop()
+        self.kimi.stop()
+
+    def test_hedge_alternate_answers(self):
+        message = {"id": "1", "content": "Hi", "sender": "user", "time": "2024-01-01T12:00:00Z"}
+        recorder = UsageRecorder()
+        usage = RequestUsage("user-1", [message], recorder)
+        timings = StreamTimings(registry=MetricsRegistry())
+        req = ChatStreamRequest(messages=[message], model="glm-4")
+        chunks = list(ChatService.stream_chat(req, Deadline(10), timings, usage))
+        usage.finish()
+
+        assert chunks[-1].finished and all(c.error is None for c in chunks)
+        assert "token2" in "".join(c.content for c in chunks)
+        assert timings.model == "kimi-k2-turbo-preview"
+        # Only the answering attempt, with its own completion count
+        assert recorder.records == [("kimi-k2-turbo-preview", 3)]
+
+
+class TestStreamPumpCancel:
+    """Test that cancelling a pump aborts the upstream read it is blocked in"""
+
+    def test_cancel_before_first_chunk(self):
+        mock = MockServer(MockConfig(ttft_ms=10000, tokens_per_second=50, tokens=5, seed=1)).start()
+        os.environ['GLM_BASE_URL'] = f"{mock.url}/v4/"
+        message = {"id": "1", "content": "Hi", "sender": "user", "time": "2024-01-01T12:00:00Z"}
+        req = ChatStreamRequest(messages=[message], model="glm-4")
+        requests = get_scoreboard().health("glm-4").requests
+        out = queue.Queue()
+        try:
+            pump = StreamPump("glm-4", lambda: ChatService.stream_chat(req, Deadline(30)), out).start()
+            deadline = time.monotonic() + 5
+            while not mock.stats.active_streams and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert mock.stats.active_streams == 1
+
+            start = time.perf_counter()
+            pump.cancel()
+            while not StreamPump.is_done(out.get(timeout=5)[1]):
+                pass
+            assert time.perf_counter() - start < 1.0, "The blocked read should end at once"
+            while mock.stats.active_streams and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert mock.stats.active_streams == 0 and mock.stats.completed_streams == 0
+        finally:
+            del os.environ['GLM_BASE_URL']
+            mock.stop()
+        # A cancelled attempt is not an upstream failure
+        assert get_scoreboard().health("glm-4").requests == requests
+
+
+if __name__ == "__main__":
+    test = TestHedging()
+    for name in dir(test):
+        if name.startswith("test_"):
+            getattr(test, name)()
+            print(f"PASS {name}")
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for pooled upstream clients, the DNS cache and connection warm-up.
+Runs against a local keep-alive HTTP server, no external network access.
+"""
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+# Add src to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from models.http_pool import DNSCache, UpstreamCancel, dns_cache, get_client, idle_connections, origin_of
+from models.warmup import ConnectionWarmer
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        time.sleep(0.05)  # keep requests overlapping so each needs its own connection
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class TestHttpPool:
+    """Test client pooling and warm-up"""
+
+    def test_clients_are_shared_per_origin(self):
+        assert get_client("https://api.moonshot.cn/v1") is get_client("https://api.moonshot.cn/other")
+        assert get_client("https://api.moonshot.cn/v1") is not get_client("https://open.bigmodel.cn/api/paas/v4/")
+        assert origin_of("https://open.bigmodel.cn/api/paas/v4/") == "https://open.bigmodel.cn"
+
+    def test_dns_cache_ttl(self):
+        calls = []
+        real_getaddrinfo = socket.getaddrinfo
+
+        def counting_getaddrinfo(*args, **kwargs):
+            calls.append(args[0])
+            return real_getaddrinfo(*args, **kwargs)
+
+        cache = DNSCache(ttl=0.2)
+        socket.getaddrinfo = counting_getaddrinfo
+        try:
+            assert "127.0.0.1" in cache.resolve("localhost", 80)
+            cache.resolve("localhost", 80)
+            assert len(calls) == 1, "Second lookup should be served from cache"
+            time.sleep(0.25)
+            cache.resolve("localhost", 80)
+            assert len(calls) == 2, "Expired entry should be resolved again"
+        finally:
+            socket.getaddrinfo = real_getaddrinfo
+
+    def test_dns_cache_serves_stale_on_failure(self):
+        cache = DNSCache(ttl=0)
+        addresses = cache.resolve("localhost", 80)
+        real_getaddrinfo = socket.getaddrinfo
+
+        def failing_getaddrinfo(*args, **kwargs):
+            raise socket.gaierror("resolver down")
+
+        socket.getaddrinfo = failing_getaddrinfo
+        try:
+            assert cache.resolve("localhost", 80) == addresses
+        finally:
+            socket.getaddrinfo = real_getaddrinfo
+
+    def test_warmer_keeps_min_idle_connections(self):
+        server = start_server()
+        url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        try:
+            warmer = ConnectionWarmer(min_idle=3, interval=0)
+            assert warmer.warm(url) >= 3
+            # A second round reuses the warm connections instead of opening more
+            assert warmer.warm(url) == idle_connections(url) >= 3
+        finally:
+            get_client(url).close()
+            server.shutdown()
+
+    def test_cancel_at_fires_unless_disarmed(self):
+        armed, disarmed = UpstreamCancel(), UpstreamCancel()
+        later = UpstreamCancel()
+        later.cancel_at(time.monotonic() + 60)
+        armed.cancel_at(time.monotonic() + 0.05)
+        disarmed.cancel_at(time.monotonic() + 0.05)
+        disarmed.disarm()
+        time.sleep(0.2)
+        later.disarm()
+        assert armed.cancelled and not disarmed.cancelled and not later.cancelled
+
+    def test_pooled_clients_connect_through_the_dns_cache(self):
+        server = start_server()
+        port = server.server_address[1]
+        # Only the cache knows this host name
+        dns_cache._entries[("pool-test.invalid", port)] = (time.monotonic() + 60, ["127.0.0.1"])
+        url = f"http://pool-test.invalid:{port}/v1"
+        try:
+            assert get_client(url).head(url).status_code == 200
+            assert idle_connections(url) == 1
+        finally:
+            get_client(url).close()
+            server.shutdown()
+            server.server_close()
+            dns_cache.clear()
+        # Errors surface as httpx errors, as with httpx's own transport
+        with pytest.raises(httpx.ConnectError):
+            get_client(f"http://127.0.0.1:{port}").head(f"http://127.0.0.1:{port}/")
+
+
+if __name__ == "__main__":
+    test = TestHttpPool()
+    for name in dir(test):
+        if name.startswith("test_"):
+            getattr(test, name)()
+            print(f"PASS {name}")
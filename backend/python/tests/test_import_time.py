@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for lazy provider loading, the config snapshot cache and the
+import-time benchmark.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Add src and bench to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'bench'))
+
+from config import snapshot
+from import_time import LAZY_MODULES, measure, parse_importtime
+
+
+class TestImportTime:
+    """Test boot-time laziness and cached config loading"""
+
+    def test_parse_importtime(self):
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   json.decoder\n"
+            "import time:       300 |        420 | json\n"
+        )
+        assert parse_importtime(stderr) == {"json.decoder": (120, 120), "json": (300, 420)}
+
+    def test_providers_are_not_imported_at_boot(self):
+        total_us, modules = measure("main", runs=1)
+        assert total_us > 0 and "fastapi" in modules
+        assert not [name for name in LAZY_MODULES if name in modules]
+
+    def test_registry_imports_provider_on_first_use(self):
+        os.environ.setdefault('GLM_API_KEY', 'test-glm-api-key')
+        from models.registry import create_model, provider_class
+
+        model = create_model("glm", "glm-4")
+        assert type(model).__name__ == "GLMModel" and model.model_id == "glm-4"
+        assert provider_class("GLM") is type(model)
+        try:
+            provider_class("unknown")
+            assert False, "Unsupported model types should be rejected"
+        except ValueError:
+            pass
+
+    def test_glm_model_still_exports_the_factory(self):
+        os.environ.setdefault('GLM_API_KEY', 'test-glm-api-key')
+        from models import glm_model, registry
+
+        assert glm_model.SUPPORTED_MODEL_TYPES == registry.SUPPORTED_MODEL_TYPES
+        assert type(glm_model.create_model("glm", "glm-4")).__name__ == "GLMModel"
+
+    def test_snapshot_cache_follows_mtime(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "models.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"models": [{"id": "a"}]}, f)
+            first = snapshot.load_json(path)
+            assert snapshot.load_json(path) is first
+
+            # A fresh process reads the marshal snapshot instead of the JSON
+            snapshot._memo.clear()
+            assert snapshot.load_json(path) == first
+
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"models": [{"id": "b"}]}, f)
+            os.utime(path, ns=(time.time_ns(), time.time_ns() + 1_000_000))
+            assert snapshot.load_json(path)["models"][0]["id"] == "b"
+            os.remove(snapshot._snapshot_path(path))
+
+
+if __name__ == "__main__":
+    test = TestImportTime()
+    for name in dir(test):
+        if name.startswith("test_"):
+            getattr(test, name)()
+            print(f"PASS {name}")
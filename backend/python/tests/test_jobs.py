@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for asynchronous chat jobs: scheduling and recovery in
+services/chat/jobs.py and the /api/jobs endpoints, against the offline
+mock provider.
+"""
+import asyncio
+import copy
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+# Add src and bench to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'bench'))
+
+os.environ['GLM_API_KEY'] = 'test-glm-api-key'
+
+from fastapi.testclient import TestClient
+
+from common.metrics import metrics
+from main import app
+from mock_upstream import MockConfig, MockServer
+from services.chat import jobs as jobs_module
+from services.chat.jobs import PRIORITIES, JobQueue, SQLiteJobStore, WebhookRejected, webhook_address
+
+REQUEST = {
+    "messages": [{"id": "1", "content": "Hi", "sender": "user", "time": "2024-01-01T12:00:00Z"}],
+    "model": "glm-4",
+}
+
+
+def job_row(job_id, tenant, priority="normal", created_at=0.0, not_before=0.0):
+    return {
+        "id": job_id, "tenant": tenant, "priority": PRIORITIES[priority], "status": "queued",
+        "request": json.dumps(REQUEST), "not_before": not_before, "created_at": created_at,
+    }
+
+
+class RunningQueue:
+    """A JobQueue over a temporary store, on its own event loop thread, serving /api/jobs"""
+
+    def __init__(self, directory, **options):
+        self.queue = JobQueue(SQLiteJobStore(os.path.join(directory, "jobs.db")),
+                              poll_interval=0.05, progress_interval=0.05, **options)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self) -> JobQueue:
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.queue.start(), self.loop).result(5)
+        self.previous, jobs_module._queue = jobs_module._queue, self.queue
+        return self.queue
+
+    def __exit__(self, *exc):
+        jobs_module._queue = self.previous
+        asyncio.run_coroutine_threadsafe(self.queue.stop(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+
+
+class WebhookReceiver:
+    """Collects JSON bodies POSTed to it"""
+
+    def __init__(self):
+        received = self.received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/hook"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def wait_for_status(client, job_id, statuses, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/jobs/{job_id}").json()
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+class TestJobScheduling:
+    """Test priority classes, tenant fairness, notBefore and recovery on the store"""
+
+    def test_priority_then_fairness(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = SQLiteJobStore(os.path.join(directory, "jobs.db"))
+            store.setup()
+            for row in (job_row("a1", "A", created_at=1), job_row("a2", "A", created_at=2),
+                        job_row("a3", "A", created_at=3), job_row("b1", "B", created_at=4),
+                        job_row("c1", "C", "low", created_at=5), job_row("a4", "A", "high", created_at=6),
+                        job_row("d1", "D", "high", created_at=7, not_before=1e12)):
+                store.insert(row)
+
+            order = []
+            while True:
+                job = store.claim("worker", now=100.0, tenant_limit=2)
+                if job is None:
+                    break
+                order.append(job["id"])
+            # High first; then the tenant with fewer running jobs; A stops at 2 running;
+            # d1 waits for its notBefore
+            assert order == ["a4", "b1", "a1", "c1"]
+
+    def test_stale_running_jobs_are_requeued(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = SQLiteJobStore(os.path.join(directory, "jobs.db"))
+            store.setup()
+            store.insert(job_row("j1", "A"))
+            store.insert(job_row("j2", "A", created_at=1))
+            store.claim("crashed", now=100.0, tenant_limit=5)
+            store.claim("alive", now=100.0, tenant_limit=5)
+            store.heartbeat(["j2"], now=190.0)
+
+            assert store.recover(stale_before=150.0, finished_before=0.0) == 1
+            assert store.get("j1")["status"] == "queued" and store.get("j2")["status"] == "running"
+            assert store.claim("other", now=200.0, tenant_limit=5)["attempt"] == 2
+
+
+class TestWebhookUrls:
+    """Test that webhooks cannot reach internal addresses"""
+
+    def test_only_public_https_or_allowed_hosts(self):
+        assert webhook_address("https://8.8.8.8/hook", []) == "8.8.8.8"
+        assert webhook_address("http://Hooks.Internal:8080/job", ["hooks.internal"]) is None
+        for url in ("http://8.8.8.8/hook", "ftp://8.8.8.8/", "https:///hook", "https://127.0.0.1/hook",
+                    "https://localhost/hook", "https://10.1.2.3/hook", "https://169.254.169.254/latest",
+                    "https://[::1]/hook", "https://[::ffff:192.168.0.1]/hook", "https://0.0.0.0/"):
+            with pytest.raises(WebhookRejected):
+                webhook_address(url, ["hooks.internal"])
+
+    def test_rejected_on_submit(self):
+        with tempfile.TemporaryDirectory() as directory, RunningQueue(directory):
+            response = TestClient(app).post("/api/jobs", json={
+                "request": REQUEST, "webhookUrl": "https://169.254.169.254/latest/meta-data"})
+        assert response.status_code == 400 and "non-public" in response.json()["detail"]
+
+
+class TestJobApi:
+    """Test submitting, polling, reading by offset, cancelling and webhooks"""
+
+    def setup_method(self):
+        # Streams here must not show up in tests that count exact glm-4 samples
+        self._metrics = (copy.deepcopy(metrics._histograms), copy.deepcopy(metrics._counters))
+        os.environ['GLM_BASE_URL'] = f"{self.start_mock().url}/v4/"
+
+    def teardown_method(self):
+        metrics._histograms, metrics._counters = self._metrics
+        del os.environ['GLM_BASE_URL']
+        self.mock.stop()
+
+    def start_mock(self, **config):
+        self.mock = MockServer(MockConfig(seed=1, **{"ttft_ms": 10, "tokens_per_second": 200, "tokens": 5,
+                                                     **config})).start()
+        return self.mock
+
+    def test_job_runs_to_completion(self):
+        hook = WebhookReceiver()
+        client = TestClient(app)
+        try:
+            with tempfile.TemporaryDirectory() as directory, RunningQueue(directory, webhook_allowed_hosts=["127.0.0.1"]):
+                response = client.post("/api/jobs", json={"request": REQUEST, "webhookUrl": hook.url},
+                                       headers={"X-Tenant-Id": "notebook-1"})
+                assert response.status_code == 202
+                job = response.json()
+                assert job["status"] == "queued" and job["tenant"] == "notebook-1"
+
+                done = wait_for_status(client, job["id"], ("succeeded", "failed"))
+                assert done["status"] == "succeeded" and done["attempt"] == 1
+
+                result = client.get(f"/api/jobs/{job['id']}/result").json()
+                assert result["content"].strip() and result["nextOffset"] == len(result["content"])
+                tail = client.get(f"/api/jobs/{job['id']}/result", params={"offset": 3}).json()
+                assert tail["content"] == result["content"][3:]
+
+                deadline = time.monotonic() + 5
+                while not hook.received and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                assert hook.received[0]["id"] == job["id"] and hook.received[0]["status"] == "succeeded"
+        finally:
+            hook.stop()
+
+    def test_cancel_running_and_queued_jobs(self):
+        self.mock.stop()
+        os.environ['GLM_BASE_URL'] = f"{self.start_mock(tokens_per_second=20, tokens=200).url}/v4/"
+        client = TestClient(app)
+        with tempfile.TemporaryDirectory() as directory, RunningQueue(directory, workers=1):
+            running = client.post("/api/jobs", json={"request": REQUEST}).json()
+            queued = client.post("/api/jobs", json={"request": REQUEST, "priority": "low"}).json()
+            wait_for_status(client, running["id"], ("running",))
+            deadline = time.monotonic() + 5
+            while not client.get(f"/api/jobs/{running['id']}/result").json()["content"]:
+                assert time.monotonic() < deadline
+                time.sleep(0.05)
+
+            assert client.post(f"/api/jobs/{queued['id']}/cancel").json()["status"] == "cancelled"
+            assert client.post(f"/api/jobs/{running['id']}/cancel").json()["status"] in ("cancelling", "cancelled")
+            cancelled = wait_for_status(client, running["id"], ("cancelled",))
+            assert cancelled["contentLength"] > 0
+            deadline = time.monotonic() + 5
+            while self.mock.stats.active_streams and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert self.mock.stats.active_streams == 0 and self.mock.stats.requests == 1
+
+    def test_unknown_job_and_invalid_priority(self):
+        client = TestClient(app)
+        with tempfile.TemporaryDirectory() as directory, RunningQueue(directory):
+            assert client.get("/api/jobs/nope").status_code == 404
+            assert client.post("/api/jobs/nope/cancel").status_code == 404
+            assert client.post("/api/jobs", json={"request": REQUEST, "priority": "urgent"}).status_code == 422
+
+
+if __name__ == "__main__":
+    # Run tests directly
+    import pytest
+    pytest.main([__file__, "-v"])
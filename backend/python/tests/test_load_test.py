@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the load-test report calculations (no processes are spawned).
+"""
+import os
+import sys
+
+# Add bench to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'bench'))
+
+from load_test import build_request, compare, percentiles, summarize
+
+
+class TestLoadTestReport:
+    """Test percentile, summary and baseline comparison logic"""
+
+    def test_percentiles(self):
+        result = percentiles([float(i) for i in range(1, 101)])
+        assert result["p50"] == 51.0
+        assert result["p99"] == 100.0
+        assert percentiles([])["p50"] is None
+
+    def test_summarize(self):
+        results = [
+            {"start": 0.0, "end": 1.0, "arrivals": [0.1, 0.2, 0.3], "error": None},
+            {"start": 0.0, "end": 1.0, "arrivals": [0.2], "error": "HTTPStatusError"},
+        ]
+        report = summarize(results, wall=1.0)
+        assert report["succeeded"] == 1
+        assert report["errors"] == {"HTTPStatusError": 1}
+        assert report["tokensPerSecond"] == 3.0
+        assert report["ttftMs"]["p50"] == 100.0
+
+    def test_compare_flags_regressions(self):
+        baseline = {"ttftMs": {"p50": 100, "p99": 200}, "interTokenMs": {"p99": 10}, "requestsPerSecond": 50}
+        faster = {"ttftMs": {"p50": 90, "p99": 190}, "interTokenMs": {"p99": 10}, "requestsPerSecond": 60}
+        slower = {"ttftMs": {"p50": 100, "p99": 300}, "interTokenMs": {"p99": 10}, "requestsPerSecond": 50}
+        assert compare(faster, baseline, tolerance=0.1)
+        assert not compare(slower, baseline, tolerance=0.1)
+
+    def test_build_request_history(self):
+        body = build_request(history=4, message_chars=50, model="glm-4")
+        assert len(body["messages"]) == 4
+        assert all(len(m["content"]) == 50 for m in body["messages"])
+        assert [m["sender"] for m in body["messages"]] == ["user", "assistant", "user", "assistant"]
+
+
+if __name__ == "__main__":
+    test = TestLoadTestReport()
+    for name in dir(test):
+        if name.startswith("test_"):
+            getattr(test, name)()
+            print(f"PASS {name}")
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the queue-based logging pipeline and sampled request tracing.
+"""
+import logging
+import os
+import queue
+import sys
+import threading
+
+# Add src to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from config.logging_config import DeferredQueueHandler, setup_logging, stop_logging, trace_request
+
+
+class FormatSpy:
+    """Records which thread converted it to a string"""
+
+    def __init__(self):
+        self.threads = []
+
+    def __str__(self):
+        self.threads.append(threading.current_thread().name)
+        return "spy"
+
+
+class TestLogging:
+    """Test deferred formatting and debug sampling"""
+
+    def test_message_is_merged_before_enqueueing(self):
+        log_queue = queue.SimpleQueue()
+        logger = logging.getLogger("test_logging.deferred")
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(DeferredQueueHandler(log_queue))
+        items = ["a"]
+
+        logger.debug("items: %s", items)
+        items.append("b")
+
+        record = log_queue.get_nowait()
+        assert record.getMessage() == "items: ['a']" and record.args is None
+
+    def test_disabled_debug_is_not_formatted(self):
+        setup_logging(level="INFO", sample_rate=1.0)
+        spy = FormatSpy()
+        logging.getLogger("test_logging.disabled").debug("value: %s", spy)
+        assert spy.threads == []
+
+    def test_trace_request_sampling(self):
+        logger = logging.getLogger("test_logging.sampling")
+        setup_logging(level="INFO", sample_rate=1.0)
+        assert not trace_request(logger)
+
+        setup_logging(level="DEBUG", sample_rate=0.0)
+        assert not any(trace_request(logger) for _ in range(100))
+
+        setup_logging(level="DEBUG", sample_rate=1.0)
+        assert trace_request(logger)
+        setup_logging(level="INFO", sample_rate=1.0)
+
+    def test_setup_keeps_other_handlers(self):
+        root = logging.getLogger()
+        other = logging.NullHandler()
+        root.addHandler(other)
+        try:
+            stop_logging()
+            setup_logging(level="INFO", sample_rate=1.0)
+            assert other in root.handlers
+            assert sum(isinstance(h, DeferredQueueHandler) for h in root.handlers) == 1
+        finally:
+            root.removeHandler(other)
+
+
+if __name__ == "__main__":
+    test = TestLogging()
+    for name in dir(test):
+        if name.startswith("test_"):
+            getattr(test, name)()
+            print(f"PASS {name}")
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for per-stage streaming latency metrics and the /metrics endpoint.
+Streams from a local SSE server, no external network access.
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add src to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Set test environment variables
+os.environ['GLM_API_KEY'] = 'test-glm-api-key'
+
+from common.metrics import Histogram, MetricsRegistry, StreamTimings, WorkerMetrics
+
+
+class SSEHandler(BaseHTTPRequestHandler):
+    """Streams five content tokens"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for i in range(5):
+            data = {"choices": [{"delta": {"content": f"t{i} "}, "finish_reason": "stop" if i == 4 else None}]}
+            self.wfile.write(f"data: {json.dumps(data)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, *args):
+        pass
+
+
+class TestMetrics:
+    """Test histograms, stage timings and the Prometheus endpoint"""
+
+    def test_histogram_buckets_are_upper_bounds(self):
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 5.0):
+            histogram.observe(value)
+        assert histogram.counts == [2, 1, 1]
+        assert histogram.count == 4
+
+    def test_render_is_cumulative(self):
+        registry = MetricsRegistry()
+        registry.histogram("x_seconds", "X", model="m").observe(0.002)
+        registry.counter("x_total", "X", model="m").inc(3)
+        text = registry.render()
+        assert '# TYPE x_seconds histogram' in text
+        assert 'x_seconds_bucket{model="m",le="0.0025"} 1' in text
+        assert 'x_seconds_bucket{model="m",le="+Inf"} 1' in text
+        assert 'x_seconds_count{model="m"} 1' in text
+        assert 'x_total{model="m"} 3' in text
+
+    def test_label_values_are_escaped(self):
+        registry = MetricsRegistry()
+        registry.counter("x_total", "X", model='a\\b"c\nd').inc()
+        assert 'x_total{model="a\\\\b\\"c\\nd"} 1' in registry.render()
+
+    def test_workers_are_summed(self):
+        first, second = MetricsRegistry(), MetricsRegistry()
+        first.histogram("x_seconds", "X", model="m").observe(0.002)
+        first.counter("x_total", "X", model="m").inc(3)
+        second.histogram("x_seconds", "X", model="m").observe(0.2)
+        second.counter("x_total", "X", model="m").inc(4)
+        second.counter("y_total", "Y", model="n").inc()
+        with tempfile.TemporaryDirectory() as directory:
+            WorkerMetrics(directory, second, worker="2").publish()
+            worker = WorkerMetrics(directory, first, worker="1")
+            text = worker.render()
+            # Snapshots of exited workers still count
+            first.counter("x_total", "X", model="m").inc()
+            assert 'x_total{model="m"} 8' in worker.render()
+        assert 'x_total{model="m"} 7' in text and 'y_total{model="n"} 1' in text
+        assert 'x_seconds_bucket{model="m",le="0.0025"} 1' in text
+        assert 'x_seconds_bucket{model="m",le="0.25"} 2' in text
+        assert 'x_seconds_count{model="m"} 2' in text
+        assert first.counter("x_total", model="m").value == 4
+
+    def test_unconfigured_models_are_not_labels(self):
+        from common.deadline import Deadline
+        from common.models import ChatStreamRequest
+        from services.chat.chat_service import ChatService
+
+        timings = StreamTimings(registry=MetricsRegistry())
+        req = ChatStreamRequest(
+            messages=[{"id": "1", "content": "Hi", "sender": "user", "time": "2024-01-01T12:00:00Z"}],
+            model='evil"} 1\n',
+        )
+        list(ChatService.stream_chat(req, Deadline(5), timings))
+        assert timings.model == "unknown"
+
+    def test_per_chunk_overhead_is_below_a_microsecond(self):
+        timings = StreamTimings(registry=MetricsRegistry())
+        iterations = 20000
+        # Best of several batches, so scheduler noise does not fail the test
+        best = float("inf")
+        for _ in range(10):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                timings.on_chunk(32)
+            best = min(best, time.perf_counter() - start)
+        per_chunk = best / iterations
+        assert per_chunk < 1e-6, f"on_chunk took {per_chunk * 1e9:.0f}ns"
+
+    def test_stream_records_stages(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), SSEHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ['GLM_BASE_URL'] = f"http://127.0.0.1:{server.server_address[1]}/v4/"
+        try:
+            from fastapi.testclient import TestClient
+            from main import app
+
+            client = TestClient(app)
+            response = client.post("/api/chat/stream", json={
+                "messages": [{"id": "1", "content": "Hi", "sender": "user", "time": "2024-01-01T12:00:00Z"}],
+                "model": "glm-4",
+            })
+            assert response.status_code == 200
+            assert "t4" in response.text
+
+            text = client.get("/metrics").text
+            for stage in ("body_parse", "model_resolution", "create_model",
+                          "upstream_connect", "upstream_ttfb", "first_content_token", "total"):
+                assert f'chat_stage_seconds_count{{model="glm-4",stage="{stage}"}}' in text, stage
+            assert 'chat_inter_token_seconds_count{model="glm-4"} 4' in text
+            assert 'chat_stream_chunks_total{model="glm-4"}' in text
+        finally:
+            del os.environ['GLM_BASE_URL']
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    test = TestMetrics()
+    for name in dir(test):
+        if name.startswith("test_"):
+            getattr(test, name)()
+            print(f"PASS {name}")
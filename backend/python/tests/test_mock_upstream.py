@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the offline mock provider used by benchmarks.
+Drives the real GLM and Kimi providers against it, no external network access.
+"""
+import json
+import os
+import sys
+import time
+
+# Add src and bench to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'bench'))
+
+# Set test environment variables
+os.environ['GLM_API_KEY'] = 'test-glm-api-key'
+os.environ['MOONSHOT_API_KEY'] = 'test-kimi-api-key'
+
+from mock_upstream import MockConfig, MockServer
+
+MESSAGES = [{"sender": "user", "content": "Hi"}]
+
+
+class TestMockUpstream:
+    """Test the mock provider against GLMModel and KimiModel"""
+
+    @classmethod
+    def setup_class(cls):
+        cls.server = MockServer(MockConfig(ttft_ms=50, tokens_per_second=0, tokens=5, reasoning_tokens=3, seed=1)).start()
+        os.environ['GLM_BASE_URL'] = f"{cls.server.url}/v4/"
+        os.environ['KIMI_BASE_URL'] = f"{cls.server.url}/v1"
+
+    @classmethod
+    def teardown_class(cls):
+        del os.environ['GLM_BASE_URL']
+        del os.environ['KIMI_BASE_URL']
+        cls.server.stop()
+
+    def setup_method(self):
+        self.server.config.update({"error_rate": 0.0, "rate_limit_rate": 0.0, "disconnect_rate": 0.0})
+
+    def test_glm_stream(self):
+        from models.glm_model import GLMModel
+
+        start = time.perf_counter()
+        chunks = list(GLMModel(model_id="glm-4").stream_chat(messages=MESSAGES))
+        assert time.perf_counter() - start >= 0.05, "TTFT delay should apply"
+        assert "".join(c.content for c in chunks) == "token0 token1 token2 token3 token4 "
+        assert chunks[-1].finished and chunks[-1].error is None
+
+    def test_kimi_reasoning_stream(self):
+        from models.kimi_model import KimiModel
+
+        chunks = list(KimiModel(model_id="kimi-k2-thinking").stream_chat(messages=MESSAGES, thinkingMode=True))
+        types = [json.loads(c.content)["type"] for c in chunks]
+        assert types[:3] == ["thinking"] * 3
+        assert types.count("content") >= 5
+        assert chunks[-1].finished
+
+    def test_rate_limit_returns_retry_after(self):
+        import httpx
+
+        self.server.config.update({"rate_limit_rate": 1.0, "retry_after_seconds": 7})
+        response = httpx.post(f"{self.server.url}/v1/chat/completions", json={"model": "x", "messages": []})
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "7"
+
+        from models.glm_model import GLMModel
+        chunks = list(GLMModel(model_id="glm-4").stream_chat(messages=MESSAGES))
+        assert chunks[-1].error.retryable is True
+
+    def test_mid_stream_disconnect(self):
+        from models.glm_model import GLMModel
+
+        self.server.config.update({"disconnect_rate": 1.0, "disconnect_after_tokens": 2})
+        chunks = list(GLMModel(model_id="glm-4").stream_chat(messages=MESSAGES))
+        assert [c.content for c in chunks[:2]] == ["token0 ", "token1 "]
+        assert chunks[-1].error is not None
+        assert self.server.stats.disconnects >= 1
+
+
+if __name__ == "__main__":
+    TestMockUpstream.setup_class()
+    test = TestMockUpstream()
+    try:
+        for name in dir(test):
+            if name.startswith("test_"):
+                test.setup_method()
+                getattr(test, name)()
+                print(f"PASS {name}")
+    finally:
+        TestMockUpstream.teardown_class()
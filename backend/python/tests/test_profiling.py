@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the sampling profiler, allocation tracking and admin endpoints.
+"""
+import os
+import sys
+import threading
+import time
+
+# Add src to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from common.profiling import sample_cpu, track_allocations
+
+
+def busy_loop_for_profiler(stop: threading.Event):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+class TestProfiling:
+    """Test CPU sampling, allocation diffs and admin access control"""
+
+    def test_sampler_sees_worker_threads(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop_for_profiler, args=(stop,), name="busy-worker")
+        worker.start()
+        try:
+            sampler = sample_cpu(0.2, interval=0.005)
+        finally:
+            stop.set()
+            worker.join()
+
+        assert sampler.sample_count > 10
+        lines = sampler.collapsed().splitlines()
+        busy = [line for line in lines if line.startswith("busy-worker;")]
+        assert busy and any("busy_loop_for_profiler" in line for line in busy)
+        stack, count = busy[0].rsplit(" ", 1)
+        assert int(count) > 0 and ";" in stack
+
+    def test_waiting_threads_are_left_out(self):
+        stop = threading.Event()
+        waiter = threading.Thread(target=stop.wait, name="idle-waiter")
+        waiter.start()
+        try:
+            cpu = sample_cpu(0.1, interval=0.005)
+            wall = sample_cpu(0.1, interval=0.005, include_idle=True)
+        finally:
+            stop.set()
+            waiter.join()
+
+        assert not any(line.startswith("idle-waiter;") for line in cpu.collapsed().splitlines())
+        assert any(line.startswith("idle-waiter;") for line in wall.collapsed().splitlines())
+
+    def test_allocation_diff_finds_growth(self):
+        retained = []
+
+        def allocate():
+            time.sleep(0.05)
+            retained.extend(bytearray(10000) for _ in range(200))
+
+        thread = threading.Thread(target=allocate)
+        thread.start()
+        top = track_allocations(0.2, limit=5)
+        thread.join()
+
+        assert top[0]["sizeDiffKb"] > 1000
+        assert any("test_profiling.py" in frame for frame in top[0]["traceback"])
+
+    def test_admin_endpoints_require_token(self):
+        from fastapi.testclient import TestClient
+        from config.app_settings import settings
+        from main import app
+
+        client = TestClient(app)
+        original = settings.admin_token
+        try:
+            settings.admin_token = ""
+            assert client.post("/api/admin/profile/cpu?seconds=0.1").status_code == 404
+
+            settings.admin_token = "s3cret"
+            assert client.post("/api/admin/profile/cpu?seconds=0.1").status_code == 403
+            assert client.post("/api/admin/profile/cpu?seconds=0.1", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+            response = client.post("/api/admin/profile/cpu?seconds=0.1", headers={"X-Admin-Token": "s3cret"})
+            assert response.status_code == 200
+            assert int(response.headers["X-Profile-Samples"]) > 0
+            assert response.headers["X-Profile-Kind"] == "cpu"
+
+            response = client.post("/api/admin/profile/memory?seconds=0.1&limit=3", headers={"X-Admin-Token": "s3cret"})
+            assert response.status_code == 200
+            assert len(response.json()["top"]) <= 3
+        finally:
+            settings.admin_token = original
+
+
+if __name__ == "__main__":
+    test = TestProfiling()
+    for name in dir(test):
+        if name.startswith("test_"):
+            getattr(test, name)()
+            print(f"PASS {name}")
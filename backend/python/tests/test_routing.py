@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the model health scoreboard and latency-aware 'auto' routing.
+Uses the real config/models.json with fake API keys, no network access.
+"""
+import os
+import sys
+
+# Add src to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Set test environment variables
+os.environ['GLM_API_KEY'] = 'test-glm-api-key'
+os.environ['MOONSHOT_API_KEY'] = 'test-moonshot-api-key'
+
+from common.errors import error_chunk
+from common.models import StreamChunk
+from config.app_settings import AppSettings
+from services.chat.routing import resolve_model, routing_groups_summary
+from services.chat.scoreboard import Scoreboard
+
+
+def chunks(*contents):
+    for content in contents:
+        yield StreamChunk(content=content, finished=False)
+
+
+class TestScoreboard:
+    """Test passive recording from streams"""
+
+    def test_observe_records_latency_and_outcome(self):
+        board = Scoreboard()
+        assert list(c.content for c in board.observe("glm-4", chunks("a", "b", "c"))) == ["a", "b", "c"]
+
+        snapshot = board.snapshot()["glm-4"]
+        assert snapshot["requests"] == 1
+        assert snapshot["errorRate"] == 0.0
+        assert snapshot["ttftP50Ms"] is not None
+        assert snapshot["interTokenP50Ms"] is not None
+
+    def test_consecutive_errors_open_breaker(self):
+        board = Scoreboard(breaker_threshold=2, breaker_cooldown=60)
+
+        def failing():
+            yield error_chunk(ConnectionError("boom"), "glm")
+
+        for _ in range(2):
+            list(board.observe("glm-4", failing()))
+
+        assert not board.is_healthy("glm-4")
+        assert board.snapshot()["glm-4"]["breakerOpen"] is True
+        assert board.snapshot()["glm-4"]["errorRate"] == 1.0
+
+    def test_cancel_before_first_token_is_not_a_failure(self):
+        board = Scoreboard(breaker_threshold=1)
+
+        def slow():
+            yield StreamChunk(content="late", finished=True)
+
+        stream = board.observe("glm-4", slow())
+        stream.close()
+        assert board.is_healthy("glm-4")
+
+
+class TestRouting:
+    """Test resolution of routed model ids"""
+
+    def setup_method(self):
+        self.settings = AppSettings()
+        self.board = Scoreboard(breaker_threshold=1, breaker_cooldown=60)
+
+    def resolve(self, model_id, thinking=False):
+        return resolve_model(model_id, thinking=thinking, settings=self.settings, scoreboard=self.board)
+
+    def test_concrete_model_is_unchanged(self):
+        assert self.resolve("glm-4") == "glm-4"
+        assert self.resolve(None) is None
+
+    def test_weights_break_ties_without_samples(self):
+        assert self.resolve("auto") == "kimi-k2-turbo-preview"
+
+    def test_fastest_model_wins(self):
+        for _ in range(10):
+            self.board.health("kimi-k2-turbo-preview").ttft.add(3.0)
+            self.board.health("glm-4").ttft.add(0.4)
+        assert self.resolve("auto") == "glm-4"
+
+    def test_open_breaker_is_skipped(self):
+        self.board.health("glm-4").ttft.add(0.1)
+        self.board.health("glm-4").record_outcome(False, threshold=1, cooldown=60)
+        assert self.resolve("auto-fast") == "kimi-k2-turbo-preview"
+
+    def test_capability_class(self):
+        assert self.resolve("auto:thinking") == "kimi-k2-thinking"
+        assert self.resolve("auto", thinking=True) == "kimi-k2-thinking"
+        # auto-fast has no thinking model, thinking mode falls back to the group
+        assert self.resolve("auto-fast", thinking=True) in ("glm-4", "kimi-k2-turbo-preview")
+
+    def test_unknown_capability_raises(self):
+        try:
+            self.resolve("auto:image-generation")
+        except ValueError as e:
+            assert "auto:image-generation" in str(e)
+        else:
+            raise AssertionError("Expected ValueError")
+
+    def test_groups_summary(self):
+        summary = routing_groups_summary(self.settings)
+        assert "auto" in summary and "auto-fast" in summary
+        assert summary["auto"]["resolvedModel"]
+
+
+if __name__ == "__main__":
+    for test in (TestScoreboard(), TestRouting()):
+        for name in dir(test):
+            if name.startswith("test_"):
+                if hasattr(test, "setup_method"):
+                    test.setup_method()
+                getattr(test, name)()
+                print(f"PASS {name}")
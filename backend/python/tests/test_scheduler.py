@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for priority scheduling of upstream streams in
+services/chat/scheduler.py.
+"""
+import asyncio
+import copy
+import json
+import os
+import sys
+
+import pytest
+
+# Add src and bench to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'bench'))
+
+os.environ['GLM_API_KEY'] = 'test-glm-api-key'
+
+from fastapi.testclient import TestClient
+
+from api.endpoints.chat_endpoint import aiter_stream, encoded_stream
+from common.deadline import Deadline, DeadlineExceeded
+from common.metrics import MetricsRegistry, StreamTimings, metrics
+from common.models import ChatStreamRequest
+from common.tracing import NOOP_SPAN
+from common.usage import RequestUsage
+from main import app
+from mock_upstream import MockConfig, MockServer
+from services.chat import scheduler as scheduler_module
+from services.chat.scheduler import BACKGROUND, BULK, INTERACTIVE, PriorityScheduler, with_default_priority
+
+
+class NullUsage:
+    def record(self, model, user, prompt, completion, estimated):
+        pass
+
+
+def granted_order(lane, waiters, releases):
+    """Classes of the waiters granted by ``releases`` slot releases, in order"""
+    order = []
+    for _ in range(releases):
+        lane.release()
+        for waiter in [w for w in waiters if w[1].granted]:
+            order.append(waiter[0])
+            waiters.remove(waiter)
+    return order
+
+
+class TestPriorityScheduler:
+    """Test reserved slots, weighted shares, queue overtaking and slot release"""
+
+    def test_interactive_slots_are_reserved(self):
+        registry = MetricsRegistry()
+        scheduler = PriorityScheduler(capacity=4, reserved_percent=50, registry=registry)
+        lane = scheduler.lane("glm")
+        for _ in range(2):
+            scheduler.acquire(lane, "glm", BACKGROUND, Deadline(5))
+        with pytest.raises(DeadlineExceeded):
+            scheduler.acquire(lane, "glm", BACKGROUND, Deadline(0.1))
+        assert not lane.queues[BACKGROUND]
+        assert registry.counter("chat_scheduler_timeouts_total", provider="glm", priority=BACKGROUND).value == 1
+
+        for _ in range(2):
+            scheduler.acquire(lane, "glm", INTERACTIVE, Deadline(0.1))
+        assert lane.in_use == 4
+
+    def test_contended_slots_follow_weights(self):
+        scheduler = PriorityScheduler(capacity=1, weights={INTERACTIVE: 3, BULK: 1}, registry=MetricsRegistry())
+        lane = scheduler.lane("glm")
+        scheduler.acquire(lane, "glm", BULK, Deadline(5))
+        with lane.lock:
+            waiters = [(name, lane.enqueue(name)) for name in [BULK] * 12 + [INTERACTIVE] * 12]
+
+        # With the bulk request already running, 12 grants split 3:1
+        order = [BULK] + granted_order(lane, waiters, 11)
+        assert order.count(INTERACTIVE) == 9 and order.count(BULK) == 3
+
+    def test_interactive_overtakes_queued_bulk_work(self):
+        scheduler = PriorityScheduler(capacity=1, registry=MetricsRegistry())
+        lane = scheduler.lane("kimi")
+        scheduler.acquire(lane, "kimi", BULK, Deadline(5))
+        with lane.lock:
+            waiters = [(BULK, lane.enqueue(BULK)) for _ in range(5)]
+            waiters.append((INTERACTIVE, lane.enqueue(INTERACTIVE)))
+
+        assert granted_order(lane, waiters, 1) == [INTERACTIVE]
+
+    def test_slot_is_held_while_streaming(self):
+        registry = MetricsRegistry()
+        scheduler = PriorityScheduler(capacity=1, provider_capacity={"kimi": 0}, registry=registry)
+        stream = iter(["a", "b"])
+        assert scheduler.admit("kimi", INTERACTIVE, Deadline(5), lambda: stream) is stream
+
+        admitted = scheduler.admit("glm", "no-such-class", Deadline(5), lambda: iter(["a", "b"]))
+        lane = scheduler.lane("glm")
+        assert lane.in_use == 0
+        assert next(admitted) == "a" and lane.in_use == 1
+        admitted.close()
+        assert lane.in_use == 0
+        assert registry.histogram("chat_scheduler_wait_seconds", provider="glm", priority=INTERACTIVE).count == 1
+
+    def test_default_priority(self):
+        message = {"id": "1", "content": "Hi", "sender": "user", "time": "2024-01-01T12:00:00Z"}
+        assert ChatStreamRequest(messages=[message]).priority == INTERACTIVE
+        assert with_default_priority(ChatStreamRequest(messages=[message]), BULK).priority == BULK
+        explicit = ChatStreamRequest(messages=[message], priority=INTERACTIVE)
+        assert with_default_priority(explicit, BULK).priority == INTERACTIVE
+
+
+class TestScheduledBatch:
+    """Test that batch requests run as background work within the provider's slots"""
+
+    def setup_method(self):
+        # Streams here must not show up in tests that count exact glm-4 samples
+        self._metrics = (copy.deepcopy(metrics._histograms), copy.deepcopy(metrics._counters))
+        self.registry = MetricsRegistry()
+        self._scheduler = scheduler_module._scheduler
+        scheduler_module._scheduler = PriorityScheduler(capacity=2, reserved_percent=50, registry=self.registry)
+
+    def teardown_method(self):
+        metrics._histograms, metrics._counters = self._metrics
+        scheduler_module._scheduler = self._scheduler
+
+    def test_batch_is_background_traffic(self):
+        mock = MockServer(MockConfig(ttft_ms=20, tokens_per_second=200, tokens=5, seed=1)).start()
+        os.environ['GLM_BASE_URL'] = f"{mock.url}/v4/"
+        request = {
+            "messages": [{"id": "1", "content": "Hi", "sender": "user", "time": "2024-01-01T12:00:00Z"}],
+            "model": "glm-4",
+        }
+        try:
+            response = TestClient(app).post("/api/chat/batch", json={"requests": [request] * 4})
+            assert mock.stats.peak_streams == 1
+        finally:
+            del os.environ['GLM_BASE_URL']
+            mock.stop()
+        summary = json.loads(response.text.splitlines()[-1])
+        assert summary["succeeded"] == 4
+        waits = self.registry.histogram("chat_scheduler_wait_seconds", provider="glm", priority=BACKGROUND)
+        assert waits.count == 4
+
+    def test_queued_requests_do_not_hold_worker_threads(self):
+        # More queued streams on one event loop than its 40 worker threads; the running ones still finish
+        mock = MockServer(MockConfig(ttft_ms=10, tokens_per_second=200, tokens=5, seed=1)).start()
+        os.environ['GLM_BASE_URL'] = f"{mock.url}/v4/"
+        message = {"id": "1", "content": "Hi", "sender": "user", "time": "2024-01-01T12:00:00Z"}
+        req = ChatStreamRequest(messages=[message], model="glm-4")
+
+        async def stream():
+            frames = encoded_stream(req, Deadline(30), StreamTimings(), RequestUsage("user-1", [message], NullUsage()),
+                                    NOOP_SPAN)
+            return [json.loads(data) async for data in aiter_stream(frames)]
+
+        async def streams():
+            return await asyncio.gather(*[stream() for _ in range(60)])
+
+        try:
+            results = asyncio.run(streams())
+            assert mock.stats.peak_streams == 2
+        finally:
+            del os.environ['GLM_BASE_URL']
+            mock.stop()
+        assert all(chunks[-1]["finished"] and "error" not in chunks[-1] for chunks in results)
+        assert mock.stats.completed_streams == 60
+
+if __name__ == "__main__":
+    # Run tests directly
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the cross-worker shared state in common/shared_state.py and the
+provider quota built on it. Worker processes are simulated with spawned
+multiprocessing children, no network access required.
+"""
+import multiprocessing
+import os
+import sys
+import uuid
+
+# Add src to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from common.models import ChatStreamRequest
+from common.shared_state import SharedState, SharedStateFull
+from services.chat import chat_service, quota as quota_module
+from services.chat.hedging import HedgeBudget
+from services.chat.quota import ProviderQuota, QuotaExceeded
+
+
+def take_tokens(name, attempts, results):
+    """Worker: attach to the segment and try to take ``attempts`` tokens"""
+    state = SharedState.attach(name)
+    granted = sum(state.take_token("quota:TEST_KEY", rate=0.0, burst=50) for _ in range(attempts))
+    state.close()
+    results.put(granted)
+
+
+def count(name, times):
+    state = SharedState.attach(name)
+    for _ in range(times):
+        state.add("requests")
+    state.close()
+
+
+class TestSharedState:
+    """Test counters, token buckets and sharing across processes"""
+
+    def test_counters(self):
+        state = SharedState(slots=8)
+        assert state.get("missing") == 0.0
+        assert state.add("a", 2) == 2
+        assert state.add("a", 5, limit=4) == 4
+        assert state.try_take("a", 3)
+        assert not state.try_take("a", 3)
+        assert not state.try_take("missing")
+        assert state.get("a") == 1
+
+    def test_token_bucket_starts_full_and_refills(self):
+        state = SharedState(slots=8)
+        assert [state.take_token("bucket", rate=0.0, burst=2) for _ in range(3)] == [True, True, False]
+        assert state.take_token("fast", rate=1e6, burst=1)
+        assert state.take_token("fast", rate=1e6, burst=1)
+
+    def test_full_table(self):
+        state = SharedState(slots=2)
+        state.add("a")
+        state.add("b")
+        try:
+            state.add("c")
+            assert False, "third key should not fit"
+        except SharedStateFull:
+            pass
+        assert state.get("a") == 1
+
+    def test_limits_hold_across_processes(self):
+        state = SharedState.create(f"aaanynotes-test-{uuid.uuid4().hex[:8]}", slots=64)
+        context = multiprocessing.get_context("spawn")
+        try:
+            results = context.Queue()
+            workers = [context.Process(target=take_tokens, args=(state.name, 30, results)) for _ in range(4)]
+            workers += [context.Process(target=count, args=(state.name, 200)) for _ in range(2)]
+            for worker in workers:
+                worker.start()
+            granted = sum(results.get(timeout=30) for _ in range(4))
+            for worker in workers:
+                worker.join(timeout=30)
+                assert worker.exitcode == 0
+            # 120 attempts against one bucket of 50, whichever worker asked
+            assert granted == 50
+            assert state.get("requests") == 400
+        finally:
+            state.unlink()
+        assert not os.path.exists(f"/dev/shm/{state.name}")
+
+    def test_hedge_budget_uses_shared_state(self):
+        state = SharedState(slots=8)
+        first, second = HedgeBudget(percent=50, state=state), HedgeBudget(percent=50, state=state)
+        first.deposit()
+        second.deposit()
+        # Deposits from either worker fund one hedge
+        assert first.try_spend()
+        assert not second.try_spend()
+
+
+class TestProviderQuota:
+    """Test per-API-key request limits"""
+
+    def test_limit_per_api_key(self):
+        quota = ProviderQuota({"MOONSHOT_API_KEY": 2})
+        quota.acquire("kimi-k2-thinking")
+        # Both Kimi models share the key and its limit
+        quota.acquire("kimi-k2-turbo-preview")
+        try:
+            quota.acquire("kimi-k2-thinking")
+            assert False, "third request should exceed the quota"
+        except QuotaExceeded:
+            pass
+        # Unlimited keys and unknown models pass
+        quota.acquire("glm-4")
+        quota.acquire(None)
+
+    def test_chat_service_fails_fast_when_over_quota(self):
+        previous = quota_module._quota
+        quota_module._quota = ProviderQuota({"GLM_API_KEY": 1})
+        quota_module._quota.acquire("glm-4")
+        try:
+            req = ChatStreamRequest(
+                messages=[{"id": "1", "content": "Hi", "sender": "user", "time": "2024-01-01T12:00:00Z"}],
+                model="glm-4",
+            )
+            chunks = list(chat_service.ChatService.stream_chat(req))
+        finally:
+            quota_module._quota = previous
+        assert len(chunks) == 1
+        assert chunks[0].error.errorClass == "QuotaExceeded"
+        assert chunks[0].error.retryable
+
+
+if __name__ == "__main__":
+    # Run tests directly
+    import pytest
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for Accept negotiation and the stream formats in api/stream_formats.py,
+end to end against the offline mock provider.
+"""
+import copy
+import json
+import os
+import sys
+
+# Add src and bench to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'bench'))
+
+os.environ['GLM_API_KEY'] = 'test-glm-api-key'
+
+from fastapi.testclient import TestClient
+
+from api.stream_formats import (EVENT_STREAM, MSGPACK, NDJSON, decode_msgpack_frames, encode_chunk,
+                                encode_chunk_msgpack, negotiate)
+from common.errors import error_chunk
+from common.metrics import metrics
+from common.models import StreamChunk
+from main import app
+from mock_upstream import MockConfig, MockServer
+
+REQUEST = {
+    "messages": [{"id": "1", "content": "Hi", "sender": "user", "time": "2024-01-01T12:00:00Z"}],
+    "model": "glm-4",
+}
+
+
+def stream(accept=None):
+    """Response to one chat stream against a fresh mock provider"""
+    mock = MockServer(MockConfig(ttft_ms=10, tokens_per_second=200, tokens=5, seed=1)).start()
+    os.environ['GLM_BASE_URL'] = f"{mock.url}/v4/"
+    try:
+        headers = {"Accept": accept} if accept else {}
+        return TestClient(app).post("/api/chat/stream", json=REQUEST, headers=headers)
+    finally:
+        del os.environ['GLM_BASE_URL']
+        mock.stop()
+
+
+class TestNegotiation:
+    """Test picking a format from the Accept header"""
+
+    def test_default_is_ndjson(self):
+        for accept in (None, "", "*/*", "text/plain", "application/json, text/html"):
+            assert negotiate(accept).media_type == NDJSON
+
+    def test_picks_highest_quality(self):
+        assert negotiate("application/msgpack").media_type == MSGPACK
+        assert negotiate("text/event-stream; charset=utf-8").media_type == EVENT_STREAM
+        assert negotiate("application/x-ndjson;q=0.5, application/msgpack").media_type == MSGPACK
+        assert negotiate("application/msgpack;q=0.2, */*;q=0.8").media_type == NDJSON
+        # Earliest listed wins on equal quality; q=0 means "not acceptable"
+        assert negotiate("text/event-stream, application/msgpack").media_type == EVENT_STREAM
+        assert negotiate("application/msgpack;q=0, text/event-stream;q=0.1").media_type == EVENT_STREAM
+
+    def test_encodings_carry_the_same_fields(self):
+        chunk = error_chunk(TimeoutError("upstream timed out"), "glm")
+        fields = json.loads(encode_chunk(chunk))
+        assert decode_msgpack_frames(encode_chunk_msgpack(chunk)) == [fields]
+        assert fields["finished"] and fields["error"]["errorClass"]
+        assert "error" not in json.loads(encode_chunk(StreamChunk(content="a", finished=False)))
+
+
+class TestStreamFormats:
+    """Test each format on /api/chat/stream"""
+
+    def setup_method(self):
+        # Streams here must not show up in tests that count exact glm-4 samples
+        self._metrics = (copy.deepcopy(metrics._histograms), copy.deepcopy(metrics._counters))
+
+    def teardown_method(self):
+        metrics._histograms, metrics._counters = self._metrics
+
+    def test_ndjson(self):
+        response = stream()
+        assert response.headers["content-type"].startswith(NDJSON)
+        assert response.headers["vary"] == "Accept"
+        chunks = [json.loads(line) for line in response.text.splitlines()]
+        assert chunks[-1]["finished"] and "error" not in chunks[-1]
+
+    def test_event_stream(self):
+        response = stream(EVENT_STREAM)
+        assert response.headers["content-type"].startswith(EVENT_STREAM)
+        events = [event for event in response.text.split("\n\n") if event]
+        ids = [int(event.split("\n")[0][len("id: "):]) for event in events]
+        assert ids == list(range(1, len(events) + 1))
+        chunks = [json.loads(event.split("\n")[1][len("data: "):]) for event in events]
+        assert chunks[-1]["finished"] and "".join(c["content"] for c in chunks).strip()
+
+    def test_msgpack(self):
+        response = stream(MSGPACK)
+        assert response.headers["content-type"] == MSGPACK
+        chunks = decode_msgpack_frames(response.content)
+        assert chunks[-1]["finished"] and "".join(c["content"] for c in chunks).strip()
+        assert stream().text.splitlines() == [json.dumps(c, ensure_ascii=False) for c in chunks]
+
+
+if __name__ == "__main__":
+    # Run tests directly
+    import pytest
+    pytest.main([__file__, "-v"])
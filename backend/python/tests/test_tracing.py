@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for traceparent handling, head sampling and span export.
+Streams from a local SSE server, no external network access.
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer
+
+# Add src to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Set test environment variables
+os.environ['GLM_API_KEY'] = 'test-glm-api-key'
+
+from common import tracing
+from common.tracing import NOOP_SPAN, BatchSpanProcessor, FileExporter, Tracer, parse_traceparent
+from test_metrics import SSEHandler
+
+TRACE_ID = "0af7651916cd43dd8448eb211c80319c"
+SAMPLED = f"00-{TRACE_ID}-b7ad6b7169203331-01"
+UNSAMPLED = f"00-{TRACE_ID}-b7ad6b7169203331-00"
+
+
+class ListExporter:
+    def __init__(self):
+        self.payloads = []
+
+    def export(self, payload):
+        self.payloads.append(payload)
+
+    def spans(self):
+        return [s for p in self.payloads for s in p["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+
+
+class TestTracing:
+    """Test trace context parsing, sampling decisions and exported spans"""
+
+    def test_parse_traceparent(self):
+        assert parse_traceparent(SAMPLED) == (TRACE_ID, "b7ad6b7169203331", True)
+        assert parse_traceparent(UNSAMPLED)[2] is False
+        for invalid in (None, "", "garbage", f"01-{TRACE_ID}-b7ad6b7169203331-01",
+                        f"00-{'0' * 32}-b7ad6b7169203331-01", f"00-{TRACE_ID}-xyz-01"):
+            assert parse_traceparent(invalid) is None, invalid
+
+    def test_head_sampling(self):
+        exporter = ListExporter()
+        tracer = Tracer(0.0, BatchSpanProcessor([exporter], "test"))
+        assert tracer.start_request_span("root", None) is NOOP_SPAN
+        assert tracer.start_request_span("root", UNSAMPLED) is NOOP_SPAN
+        span = tracer.start_request_span("root", SAMPLED)
+        assert span.sampled and span.trace_id == TRACE_ID and span.parent_id == "b7ad6b7169203331"
+
+        assert Tracer(1.0, BatchSpanProcessor([exporter], "test")).start_request_span("root", None).sampled
+        # No exporter configured: tracing is off even for sampled parents
+        assert Tracer(1.0, None).start_request_span("root", SAMPLED) is NOOP_SPAN
+
+    def test_file_exporter_writes_otlp_batches(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "spans.jsonl")
+            processor = BatchSpanProcessor([FileExporter(path)], "test", batch_size=2)
+            tracer = Tracer(1.0, processor)
+            for _ in range(3):
+                tracer.start_request_span("root", None).end()
+            processor.shutdown()
+            with open(path, encoding="utf-8") as f:
+                batches = [json.loads(line) for line in f]
+
+        assert sum(len(b["resourceSpans"][0]["scopeSpans"][0]["spans"]) for b in batches) == 3
+        resource = batches[0]["resourceSpans"][0]["resource"]["attributes"]
+        assert {"key": "service.name", "value": {"stringValue": "test"}} in resource
+
+    def test_stream_exports_stage_spans(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), SSEHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ['GLM_BASE_URL'] = f"http://127.0.0.1:{server.server_address[1]}/v4/"
+        exporter = ListExporter()
+        processor = BatchSpanProcessor([exporter], "test")
+        original = tracing._tracer
+        tracing._tracer = Tracer(0.0, processor)
+        try:
+            from fastapi.testclient import TestClient
+            from main import app
+
+            response = TestClient(app).post("/api/chat/stream", headers={"traceparent": SAMPLED}, json={
+                "messages": [{"id": "1", "content": "Hi", "sender": "user", "time": "2024-01-01T12:00:00Z"}],
+                "model": "glm-4",
+            })
+            assert "t4" in response.text
+            processor.flush()
+        finally:
+            tracing._tracer = original
+            del os.environ['GLM_BASE_URL']
+            server.shutdown()
+
+        spans = {s["name"]: s for s in exporter.spans()}
+        root = spans["POST /api/chat/stream"]
+        assert root["traceId"] == TRACE_ID and root["parentSpanId"] == "b7ad6b7169203331"
+        attributes = {a["key"]: a["value"] for a in root["attributes"]}
+        assert attributes["llm.model"] == {"stringValue": "glm-4"}
+        assert attributes["llm.provider"] == {"stringValue": "glm"}
+        assert attributes["stream.chunks"] == {"intValue": "5"}
+        for name in ("model.resolution", "upstream.connect", "upstream.ttfb", "stream.first_token", "stream.completion"):
+            child = spans[name]
+            assert child["parentSpanId"] == root["spanId"], name
+            assert int(root["startTimeUnixNano"]) <= int(child["startTimeUnixNano"]) <= int(child["endTimeUnixNano"])
+            assert int(child["endTimeUnixNano"]) <= int(root["endTimeUnixNano"]) + 1000
+
+
+if __name__ == "__main__":
+    test = TestTracing()
+    for name in dir(test):
+        if name.startswith("test_"):
+            getattr(test, name)()
+            print(f"PASS {name}")
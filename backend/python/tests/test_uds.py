@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for serving the API on a Unix domain socket (SOCKET_PYTHON) with
+server.py, against the offline mock provider.
+"""
+import json
+import os
+import signal
+import stat
+import subprocess
+import sys
+import tempfile
+
+import httpx
+import pytest
+
+# Add src and bench to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'bench'))
+
+from load_test import wait_for
+from mock_upstream import MockConfig, MockServer
+from server import bind_unix_socket, server_options
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+REQUEST = {
+    "messages": [{"id": "1", "content": "Hi", "sender": "user", "time": "2024-01-01T12:00:00Z"}],
+    "model": "glm-4",
+}
+
+
+class TestUnixSocket:
+    """Test socket binding, permissions, the health probe and streaming over the socket"""
+
+    def test_bind_sets_mode_and_replaces_stale_socket(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run", "python.sock")
+            bind_unix_socket(path, 0o640).close()
+            # Closed without unlinking, as after a crash
+            sock = bind_unix_socket(path, 0o640)
+            try:
+                assert stat.S_ISSOCK(os.stat(path).st_mode)
+                assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+            finally:
+                sock.close()
+
+    def test_refuses_live_socket_and_other_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "python.sock")
+            sock = bind_unix_socket(path, 0o600)
+            sock.listen()
+            try:
+                with pytest.raises(RuntimeError, match="in use"):
+                    bind_unix_socket(path, 0o600)
+            finally:
+                sock.close()
+
+            other = os.path.join(directory, "notes.txt")
+            open(other, "w").close()
+            with pytest.raises(RuntimeError, match="not a socket"):
+                bind_unix_socket(other, 0o600)
+
+    def test_server_options_listen_on_fd(self):
+        options = server_options("production", workers=2, fd=7)
+        assert options["fd"] == 7
+        assert "host" not in options and "port" not in options
+
+    def test_server_streams_over_socket(self):
+        mock = MockServer(MockConfig(ttft_ms=10, tokens_per_second=200, tokens=5, seed=1)).start()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "python.sock")
+            env = dict(
+                os.environ,
+                GLM_API_KEY="test-glm-api-key",
+                GLM_BASE_URL=f"{mock.url}/v4/",
+                SOCKET_PYTHON=path,
+                SOCKET_PYTHON_MODE="600",
+                UPSTREAM_WARM_MIN_IDLE="0",
+                DB_SQLITE_PATH=os.path.join(directory, "usage.db"),
+                LOG_LEVEL="WARNING",
+            )
+            probe = [sys.executable, "server.py", "--probe"]
+            server = subprocess.Popen([sys.executable, "server.py", "--mode", "production", "--workers", "1"],
+                                      cwd=SRC_DIR, env=env)
+            try:
+                wait_for("http://localhost/health", uds=path)
+                assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+                assert subprocess.run(probe, cwd=SRC_DIR, env=env).returncode == 0
+
+                with httpx.Client(transport=httpx.HTTPTransport(uds=path), timeout=30) as client:
+                    response = client.post("http://localhost/api/chat/stream", json=REQUEST)
+                chunks = [json.loads(line) for line in response.text.splitlines()]
+                assert chunks[-1]["finished"] and "error" not in chunks[-1]
+
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=30)
+                assert not os.path.exists(path)
+                assert subprocess.run(probe, cwd=SRC_DIR, env=env).returncode == 1
+            finally:
+                if server.poll() is None:
+                    server.kill()
+                mock.stop()
+
+
+if __name__ == "__main__":
+    # Run tests directly
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for token usage capture, estimation and batched aggregation.
+Streams from a local SSE server, no external network access.
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add src to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Set test environment variables
+os.environ['GLM_API_KEY'] = 'test-glm-api-key'
+
+from common import usage as usage_module
+from common.usage import RequestUsage, SQLiteUsageStore, UsageAggregator, estimate_tokens
+from config.app_settings import settings
+
+
+def usage_sse_handler(report_usage: bool):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            assert body["stream_options"] == {"include_usage": True}
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for i in range(3):
+                data = {"choices": [{"delta": {"content": f"tok{i} "}, "finish_reason": "stop" if i == 2 else None}]}
+                if i == 2 and report_usage:
+                    data["usage"] = {"prompt_tokens": 11, "completion_tokens": 3, "total_tokens": 14}
+                self.wfile.write(f"data: {json.dumps(data)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+class TestUsage:
+    """Test usage reporting, local estimates, flushing and the /api/usage endpoint"""
+
+    def test_estimate_tokens(self):
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("你好世界") == 4
+        assert estimate_tokens("hello world!") == 3
+
+    def test_records_are_aggregated_per_flush(self):
+        with tempfile.TemporaryDirectory() as directory:
+            aggregator = UsageAggregator(SQLiteUsageStore(os.path.join(directory, "usage.db")))
+            for user in ("alice", "alice", "bob"):
+                request = RequestUsage(user, [{"content": "hello world!"}], aggregator)
+                request.model = "glm-4"
+                request.add_completion("abcdefgh")
+                request.finish()
+                request.finish()
+            reported = RequestUsage("bob", aggregator=aggregator)
+            reported.model = "glm-4"
+            reported.report({"prompt_tokens": 100, "completion_tokens": 50})
+            reported.finish()
+
+            assert len(aggregator._pending) == 4
+            assert aggregator.flush()
+            assert not aggregator._pending
+
+            by_user = {row["user"]: row for row in aggregator.summary(group_by="user")}
+            assert by_user["alice"]["requests"] == 2
+            assert by_user["alice"]["promptTokens"] == 6
+            assert by_user["alice"]["completionTokens"] == 4
+            assert by_user["alice"]["estimatedRequests"] == 2
+            assert by_user["bob"]["promptTokens"] == 103
+            assert by_user["bob"]["estimatedRequests"] == 1
+            by_key = aggregator.summary(group_by="key")
+            assert by_key[0]["key"] == "GLM_API_KEY" and by_key[0]["requests"] == 4
+
+    def test_failed_flush_is_retried(self):
+        with tempfile.TemporaryDirectory() as directory:
+            aggregator = UsageAggregator(SQLiteUsageStore(os.path.join(directory, "missing", "usage.db")))
+            aggregator.record("glm-4", "alice", 10, 5, False)
+            assert not aggregator.flush()
+            aggregator.store.path = os.path.join(directory, "usage.db")
+            aggregator.record("glm-4", "alice", 10, 5, False)
+            assert aggregator.flush()
+            assert aggregator.summary()[0]["requests"] == 2
+
+    def test_stream_records_reported_and_estimated_usage(self):
+        from fastapi.testclient import TestClient
+        from main import app
+
+        original = usage_module._aggregator
+        admin_token = settings.admin_token
+        settings.admin_token = ""
+        with tempfile.TemporaryDirectory() as directory:
+            usage_module._aggregator = UsageAggregator(SQLiteUsageStore(os.path.join(directory, "usage.db")))
+            try:
+                client = TestClient(app)
+                for report_usage in (True, False):
+                    server = ThreadingHTTPServer(("127.0.0.1", 0), usage_sse_handler(report_usage))
+                    threading.Thread(target=server.serve_forever, daemon=True).start()
+                    os.environ['GLM_BASE_URL'] = f"http://127.0.0.1:{server.server_address[1]}/v4/"
+                    try:
+                        response = client.post("/api/chat/stream", headers={"X-User-Id": "alice"}, json={
+                            "messages": [{"id": "1", "content": "Hello there", "sender": "user",
+                                          "time": "2024-01-01T12:00:00Z"}],
+                            "model": "glm-4",
+                        })
+                        assert "tok2" in response.text
+                    finally:
+                        del os.environ['GLM_BASE_URL']
+                        server.shutdown()
+
+                assert client.get("/api/usage?groupBy=user").status_code == 404
+                settings.admin_token = "s3cret"
+                assert client.get("/api/usage?groupBy=user").status_code == 403
+                headers = {"X-Admin-Token": "s3cret"}
+                body = client.get("/api/usage?groupBy=user", headers=headers).json()
+                alice = body["usage"][0]
+                assert alice["user"] == "alice" and alice["requests"] == 2
+                assert alice["promptTokens"] == 11 + estimate_tokens("Hello there")
+                assert alice["completionTokens"] == 3 + estimate_tokens("tok0 tok1 tok2 ")
+                assert alice["estimatedRequests"] == 1
+                assert client.get("/api/usage?groupBy=nope", headers=headers).status_code == 422
+            finally:
+                usage_module._aggregator = original
+                settings.admin_token = admin_token
+
+
+if __name__ == "__main__":
+    test = TestUsage()
+    for name in dir(test):
+        if name.startswith("test_"):
+            getattr(test, name)()
+            print(f"PASS {name}")